@@ -0,0 +1,235 @@
+'''
+	Measures the time and peak memory of the hot paths of the analysis
+	types on synthetic data (see `synthetic.py`): loading the datasets,
+	the chrome mapping, comparing and aggregating coverage, filtering
+	frequencies, scheduling lookups, and writing results.
+
+	Results can be saved with `--save` and compared with a previous run
+	with `--compare` to see regressions.
+
+	Usage:
+		python benchmarks/bench_hotpaths.py [--tests 200] [--sources 2000] [--lines 500]
+			[--runs 5] [--save results.json] [--compare baseline.json] [benchmark ...]
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+here = os.path.abspath(os.path.dirname(__file__))
+root = os.path.dirname(here)
+sys.path.insert(0, root)
+
+from synthetic import SyntheticCoverage, generate_datasets
+
+from pertestcoverage.utils.cocoload import (
+	chrome_mapping_rewrite,
+	get_all_lcov_data,
+	get_all_pertest_data,
+	get_all_stdptc_data,
+	get_coverage_tests_from_jsondatalist,
+	get_jsdcov_file,
+	save_results
+)
+from pertestcoverage.utils.cocoanalyze.general_comparison import (
+	aggregate_reports,
+	compare_coverage_files
+)
+from pertestcoverage.utils.cocopush import PushIndex
+
+# Number of changesets used for the scheduling lookups
+NUM_CHANGESETS = 500
+
+
+def get_benchmarks(data_dir, chrome_map_path, tests, output_dir):
+	'''
+		Returns the benchmarks as (name, function) tuples,
+		the functions are called once per run.
+	'''
+	pertest_dir = os.path.join(data_dir, 'pertestreport')
+	lcov_dir = os.path.join(data_dir, 'lcov')
+	stdptc_dir = os.path.join(data_dir, 'std-ptc-format')
+	jsdcov_dir = os.path.join(data_dir, 'jsdcov')
+
+	rng = random.Random(0)
+	sources = sorted({source for per_test_data in tests for source in per_test_data['source_files']})
+	changesets = [
+		('%012x' % count, rng.sample(sources, min(len(sources), rng.randint(1, 8))))
+		for count in range(NUM_CHANGESETS)
+	]
+	pushheads = {changeset for changeset, _ in changesets if rng.random() < 0.3}
+
+	def load_jsdcov():
+		return [get_jsdcov_file(jsdcov_dir, file) for file in sorted(os.listdir(jsdcov_dir))]
+
+	def rewrite_chrome_map():
+		return [
+			chrome_mapping_rewrite(per_test_data['source_files'], chrome_map_path)
+			for per_test_data in tests
+		]
+
+	def compare_files():
+		return [
+			compare_coverage_files(
+				tests[count]['source_files'], tests[count + 1]['source_files'], level='line'
+			)
+			for count in range(len(tests) - 1)
+		]
+
+	def aggregate():
+		report = {'source_files': {}}
+		for per_test_data in tests:
+			report = aggregate_reports(report, per_test_data)
+		return report
+
+	def filter_frequencies():
+		from pertestcoverage.utils.cocofilter import filter_freqs
+		with contextlib.redirect_stdout(io.StringIO()):
+			return filter_freqs(tests, [0, 10], seed=0)
+
+	def schedule_tests():
+		return [
+			get_coverage_tests_from_jsondatalist(tests, get_files=files_modified)
+			for _, files_modified in changesets
+		]
+
+	def group_pushes():
+		push_index = PushIndex([changeset for changeset, _ in changesets], pushheads=pushheads)
+		for (changeset, _), scheduled in zip(changesets, schedule_tests()):
+			push_index.add_tests(changeset, scheduled)
+		return push_index
+
+	results = {
+		'%012x' % count: {
+			'numtests': len(per_test_data['source_files']),
+			'tests': sorted(per_test_data['source_files'])
+		}
+		for count, per_test_data in enumerate(tests)
+	}
+
+	def write_results(output_format, compression):
+		def write():
+			return save_results(
+				results, output_dir, 'bench_results.json',
+				output_format=output_format, compression=compression
+			)
+		return write
+
+	return [
+		('load_pertest', lambda: get_all_pertest_data(pertest_dir, chrome_map_path=chrome_map_path)),
+		('load_lcov', lambda: get_all_lcov_data(lcov_dir)),
+		('load_stdptc', lambda: get_all_stdptc_data(stdptc_dir)),
+		('load_jsdcov', load_jsdcov),
+		('chrome_mapping_rewrite', rewrite_chrome_map),
+		('compare_coverage_files', compare_files),
+		('aggregate_reports', aggregate),
+		('filter_freqs', filter_frequencies),
+		('schedule_tests', schedule_tests),
+		('push_index', group_pushes),
+		('write_json', write_results('json', None)),
+		('write_ndjson', write_results('ndjson', None)),
+		('write_json_gzip', write_results('json', 'gzip')),
+	]
+
+
+def measure(func, runs):
+	times = []
+	for _ in range(runs):
+		start = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - start)
+
+	# Separate run, tracemalloc slows everything down
+	tracemalloc.start()
+	try:
+		func()
+		_, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	return times, peak
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('benchmarks', nargs='*', help="Benchmarks to run (default: all).")
+	parser.add_argument('--tests', type=int, default=200, help="Number of tests in the synthetic data.")
+	parser.add_argument('--sources', type=int, default=2000, help="Number of source files.")
+	parser.add_argument('--lines', type=int, default=500, help="Maximum number of lines per source file.")
+	parser.add_argument('--files-per-test', type=int, default=60, help="Source files covered by each test.")
+	parser.add_argument('--runs', type=int, default=5, help="Number of runs per benchmark.")
+	parser.add_argument('--data-dir', default=None,
+						help="Directory of the synthetic data, it's generated if it doesn't exist "
+							 "(default: a temporary directory).")
+	parser.add_argument('--save', default=None, help="Save the results to this JSON file.")
+	parser.add_argument('--compare', default=None, help="Compare with the results saved in this JSON file.")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory(prefix='ptc-bench-') as tmp_dir:
+		run_benchmarks(args, tmp_dir)
+
+
+def run_benchmarks(args, tmp_dir):
+	scale = {
+		'numtests': args.tests,
+		'numsources': args.sources,
+		'numlines': args.lines,
+		'files_per_test': args.files_per_test
+	}
+	data_dir = args.data_dir or os.path.join(tmp_dir, 'data')
+	chrome_map_path = os.path.join(data_dir, 'chrome-map.json')
+	if not os.path.exists(chrome_map_path):
+		print("Generating synthetic data in %s..." % data_dir)
+		chrome_map_path = generate_datasets(data_dir, **scale)
+	tests = list(SyntheticCoverage(**scale).iter_tests())
+
+	baseline = {}
+	if args.compare:
+		with open(args.compare, 'r') as f:
+			baseline = json.load(f)['results']
+
+	benchmarks = get_benchmarks(data_dir, chrome_map_path, tests, tmp_dir)
+	if args.benchmarks:
+		benchmarks = [(name, func) for name, func in benchmarks if name in args.benchmarks]
+
+	print("%-25s %10s %10s %12s  %s" % ('benchmark', 'median ms', 'min ms', 'peak MiB', 'vs. baseline'))
+	results = {}
+	for name, func in benchmarks:
+		try:
+			times, peak = measure(func, args.runs)
+		except ImportError as e:
+			print("%-25s %10s %10s %12s  %s" % (name, '-', '-', '-', 'skipped: ' + str(e)))
+			continue
+
+		results[name] = {
+			'median': statistics.median(times),
+			'min': min(times),
+			'peak': peak
+		}
+		comparison = '-'
+		if name in baseline:
+			comparison = "time x%.2f, memory x%.2f" % (
+				results[name]['median'] / baseline[name]['median'],
+				peak / baseline[name]['peak'] if baseline[name]['peak'] else 0
+			)
+		print("%-25s %10.1f %10.1f %12.2f  %s" % (
+			name,
+			1000 * results[name]['median'],
+			1000 * results[name]['min'],
+			peak / (1024 * 1024),
+			comparison
+		))
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump({'scale': scale, 'runs': args.runs, 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,82 @@
+'''
+	Measures the startup time of `ptc` and of importing each analysis
+	type, and lists the heavy dependencies that each one loads at import.
+
+	Usage:
+		python benchmarks/bench_startup.py [--runs 5] [analysistype ...]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+here = os.path.abspath(os.path.dirname(__file__))
+root = os.path.dirname(here)
+
+HEAVY_MODULES = ('numpy', 'scipy', 'matplotlib', 'matplotlib.pyplot', 'requests')
+
+MEASURE_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+{statement}
+end = time.perf_counter()
+print(json.dumps({{
+	'time': end - start,
+	'loaded': [m for m in {heavy_modules!r} if m in sys.modules]
+}}))
+'''
+
+
+def measure(statement, runs):
+	script = MEASURE_SCRIPT.format(statement=statement, heavy_modules=HEAVY_MODULES)
+	times = []
+	loaded = []
+	for _ in range(runs):
+		output = subprocess.check_output(
+			[sys.executable, '-c', script], cwd=root, stderr=subprocess.DEVNULL
+		)
+		result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+		times.append(result['time'])
+		loaded = result['loaded']
+	return times, loaded
+
+
+def get_analysistypes():
+	analysistypes_dir = os.path.join(root, 'pertestcoverage', 'analysistypes')
+	return sorted(
+		os.path.splitext(p)[0] for p in os.listdir(analysistypes_dir)
+		if p.endswith('.py') and p != '__init__.py'
+	)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('analysistypes', nargs='*', help="Analysis types to measure (default: all).")
+	parser.add_argument('--runs', type=int, default=5, help="Number of runs per measurement.")
+	args = parser.parse_args()
+
+	statements = [('ptc -l', "from pertestcoverage.cli import cli; cli(['-l'])")]
+	for analysis in args.analysistypes or get_analysistypes():
+		statements.append((
+			analysis, "import pertestcoverage.analysistypes.{}".format(analysis)
+		))
+
+	print("%-40s %10s %10s  %s" % ('target', 'median ms', 'min ms', 'heavy modules loaded'))
+	for name, statement in statements:
+		try:
+			times, loaded = measure(statement, args.runs)
+		except subprocess.CalledProcessError:
+			print("%-40s %10s %10s  %s" % (name, '-', '-', 'import failed'))
+			continue
+		print("%-40s %10.1f %10.1f  %s" % (
+			name,
+			1000 * statistics.median(times),
+			1000 * min(times),
+			', '.join(loaded) or '-'
+		))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,216 @@
+'''
+	Generates synthetic per-test coverage datasets in the formats that
+	`ptc` can open (`pertestreport`, LCOV, jsdcov and `std-ptc-format`),
+	along with a chrome-map for them.
+
+	Like real data, a few source files are covered by most of the tests
+	while most files are only covered by a few of them, and the lines
+	covered in a file are grouped in runs instead of being scattered.
+	The same `seed` always generates the same data.
+
+	Usage:
+		python benchmarks/synthetic.py <output_dir> [--tests 200] [--sources 2000] [--lines 500]
+'''
+import argparse
+import json
+import os
+import random
+
+DATATYPES = ('pertestreport', 'lcov', 'jsdcov', 'std-ptc-format')
+
+DIRECTORIES = [
+	'browser/base/content', 'browser/components/extensions', 'devtools/client/shared',
+	'dom/base', 'dom/events', 'dom/media', 'gfx/layers', 'js/src/jit',
+	'layout/generic', 'netwerk/protocol/http', 'toolkit/components/places',
+	'toolkit/mozapps/extensions', 'widget/gtk', 'xpcom/threads'
+]
+SUITES = ['mochitest-plain', 'mochitest-browser-chrome', 'xpcshell', 'web-platform-tests']
+
+
+class SyntheticCoverage:
+	def __init__(self, numtests=200, numsources=2000, numlines=500,
+				 files_per_test=60, coverage=0.2, seed=0):
+		self.numtests = numtests
+		self.numsources = numsources
+		self.numlines = numlines
+		self.files_per_test = min(files_per_test, numsources)
+		self.coverage = coverage
+		self.rng = random.Random(seed)
+		# Used for the hit counts, so that every format has the same coverage
+		self.hits_rng = random.Random(seed + 1)
+
+		self.sources = [self.get_source_name(count) for count in range(numsources)]
+		self.source_lengths = {
+			source: self.rng.randint(max(1, numlines // 4), max(1, numlines))
+			for source in self.sources
+		}
+		# Some JS files are only known by their chrome URL in the reports
+		self.chrome_map = {}
+		self.report_names = {}
+		for source in self.sources:
+			if source.endswith('.js') and self.rng.random() < 0.3:
+				self.report_names[source] = 'chrome://' + source.replace('/content/', '/')
+				self.chrome_map[self.report_names[source]] = source
+
+		# Zipf-like popularity of the source files
+		self.weights = [1.0 / (rank + 1) for rank in range(numsources)]
+		self.rng.shuffle(self.weights)
+
+	def get_source_name(self, count):
+		directory = DIRECTORIES[count % len(DIRECTORIES)]
+		extension = ['.cpp', '.h', '.js', '.c'][self.rng.randint(0, 3)]
+		return '%s/file%s%s' % (directory, str(count), extension)
+
+	def get_report_name(self, source):
+		# Name of a source file in the reports (before the chrome mapping)
+		return self.report_names.get(source, source)
+
+	def get_covered_lines(self, length):
+		# Runs of covered lines, covering about `coverage` of the file
+		lines = set()
+		target = max(1, int(length * self.coverage * self.rng.uniform(0.5, 1.5)))
+		while len(lines) < min(target, length):
+			start = self.rng.randint(1, length)
+			lines.update(range(start, min(length, start + self.rng.randint(3, 30)) + 1))
+		return sorted(lines)
+
+	def iter_tests(self):
+		'''
+			Yields a dict for each test, with the `test` name,
+			the `suite`, and its `source_files` coverage (the
+			covered lines of each source file).
+		'''
+		for count in range(self.numtests):
+			suite = SUITES[count % len(SUITES)]
+			directory = DIRECTORIES[count % len(DIRECTORIES)]
+			indices = set()
+			while len(indices) < self.files_per_test:
+				indices.update(self.rng.choices(
+					range(self.numsources), weights=self.weights,
+					k=self.files_per_test - len(indices)
+				))
+			yield {
+				'test': '%s/test/test_%s_%s.js' % (directory, suite.replace('-', '_'), str(count)),
+				'suite': suite,
+				'source_files': {
+					self.sources[index]: self.get_covered_lines(self.source_lengths[self.sources[index]])
+					for index in sorted(indices)
+				}
+			}
+
+	def write_chrome_map(self, output_dir):
+		path = os.path.join(output_dir, 'chrome-map.json')
+		with open(path, 'w') as f:
+			json.dump([self.chrome_map, {}, {}], f)
+		return path
+
+	def write_dataset(self, output_dir, datatype):
+		'''
+			Writes one file per test in `output_dir`, in the given
+			format. Returns the number of files written.
+		'''
+		if datatype not in DATATYPES:
+			raise Exception("Unknown data type `%s`, expected one of: %s" % (datatype, str(DATATYPES)))
+		os.makedirs(output_dir, exist_ok=True)
+
+		count = 0
+		for count, per_test_data in enumerate(self.iter_tests()):
+			name = 'test%s' % str(count)
+			if datatype == 'pertestreport':
+				data = self.format_pertestreport(per_test_data)
+				filename = name + '.json'
+			elif datatype == 'lcov':
+				data = self.format_lcov(per_test_data)
+				filename = name + '.info'
+			elif datatype == 'jsdcov':
+				data = self.format_jsdcov(per_test_data)
+				filename = name + '_jsdcov.json'
+			else:
+				data = per_test_data
+				filename = name + '_std-ptc-format.json'
+
+			with open(os.path.join(output_dir, filename), 'w') as f:
+				if isinstance(data, str):
+					f.write(data)
+				else:
+					json.dump(data, f)
+		return count + 1
+
+	def format_pertestreport(self, per_test_data):
+		source_files = []
+		for source, lines in per_test_data['source_files'].items():
+			length = self.source_lengths[source]
+			coverage = [None] * length
+			for line in range(0, length, 2):
+				coverage[line] = 0
+			for line in lines:
+				coverage[line - 1] = self.hits_rng.randint(1, 50)
+			source_files.append({'name': self.get_report_name(source), 'coverage': coverage})
+		return {
+			'test': per_test_data['test'],
+			'suite': per_test_data['suite'],
+			'report': {'source_files': source_files}
+		}
+
+	def format_lcov(self, per_test_data):
+		records = []
+		for source, lines in per_test_data['source_files'].items():
+			# Every third line is instrumented, along with the covered ones
+			covered = set(lines)
+			instrumented = covered | set(range(1, self.source_lengths[source] + 1, 3))
+			record = ['SF:' + source]
+			for line in sorted(instrumented):
+				record.append('DA:%s,%s' % (str(line), str(self.hits_rng.randint(1, 50)) if line in covered else '0'))
+			record.append('end_of_record')
+			records.append('\n'.join(record))
+		return '\n'.join(records) + '\n'
+
+	def format_jsdcov(self, per_test_data):
+		return [
+			{
+				'testUrl': per_test_data['test'],
+				'sourceFile': self.get_report_name(source),
+				'covered': lines,
+				'uncovered': []
+			}
+			for source, lines in per_test_data['source_files'].items()
+			if source.endswith('.js')
+		]
+
+
+def generate_datasets(output_dir, datatypes=DATATYPES, **kwargs):
+	'''
+		Writes each dataset in a `output_dir/<datatype>` folder and the
+		chrome-map in `output_dir`. Keyword arguments are given to
+		SyntheticCoverage. Returns the path of the chrome-map.
+	'''
+	chrome_map_path = None
+	for datatype in datatypes:
+		# Same seed, so that all the formats have the same coverage
+		synthetic = SyntheticCoverage(**kwargs)
+		synthetic.write_dataset(os.path.join(output_dir, datatype), datatype)
+		chrome_map_path = synthetic.write_chrome_map(output_dir)
+	return chrome_map_path
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('output_dir', help="Directory to write the datasets in.")
+	parser.add_argument('--tests', type=int, default=200, help="Number of tests.")
+	parser.add_argument('--sources', type=int, default=2000, help="Number of source files.")
+	parser.add_argument('--lines', type=int, default=500, help="Maximum number of lines per source file.")
+	parser.add_argument('--files-per-test', type=int, default=60, help="Source files covered by each test.")
+	parser.add_argument('--seed', type=int, default=0, help="Seed of the generator.")
+	parser.add_argument('--types', nargs='+', default=list(DATATYPES), choices=DATATYPES,
+						help="Formats to generate (default: all).")
+	args = parser.parse_args()
+
+	generate_datasets(
+		args.output_dir, datatypes=args.types, numtests=args.tests, numsources=args.sources,
+		numlines=args.lines, files_per_test=args.files_per_test, seed=args.seed
+	)
+	print("Datasets written to %s" % args.output_dir)
+
+
+if __name__ == '__main__':
+	main()
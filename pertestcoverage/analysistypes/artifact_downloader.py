@@ -7,6 +7,7 @@ import logging
 
 from ..cli import AnalysisParser
 from ..utils.cocoload import pattern_find, rununtiltimeout
+from ..utils.cocoreplay import rewrite_url
 from ..utils import timeout
 
 try:
@@ -63,7 +64,7 @@ def get_json(url=None, params=None):
 	def get_data(url=None, params=None, **kwargs):
 		if params is not None:
 			url += '?' + urlencode(params)
-		r = urlopen(url).read()
+		r = urlopen(rewrite_url(url)).read()
 		return r
 
 	r = rununtiltimeout(get_data, **locals()).decode('utf-8')
@@ -101,7 +102,7 @@ def download_artifact(task_id, artifact, output_dir):
 
 	@timeout(URLRETRIEVE_TIMEOUT)
 	def get_data():
-		data = urlretrieve('https://queue.taskcluster.net/v1/task/' + task_id + '/artifacts/' + artifact['name'], fname)
+		data = urlretrieve(rewrite_url('https://queue.taskcluster.net/v1/task/' + task_id + '/artifacts/' + artifact['name']), fname)
 		return data
 
 	retries = 0
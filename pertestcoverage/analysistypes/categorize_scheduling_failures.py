@@ -6,9 +6,10 @@ import logging
 from ..cli import AnalysisParser
 from ..utils.cocoanalyze.categorize import categorize_data, visualize_category_data
 from ..utils.cocoload import (
-	open_json,
-	save_json,
-	get_paths_from_dir
+	open_results,
+	save_results,
+	get_paths_from_dir,
+	TYPE_RESULTS
 )
 
 log = logging.getLogger('pertestcoverage')
@@ -40,6 +41,10 @@ def run(args=None, config=None):
 		# This path can be Null
 		mozcentral-path: /home/Username/mozilla-source/mozilla-central/
 
+		The files can be JSON or NDJSON (compressed or not). The
+		categorized data is saved in `outputdir` with the format given
+		by `output_format` and `output_compression`.
+
 	'''
 	if args:
 		parser = AnalysisParser('config')
@@ -55,12 +60,12 @@ def run(args=None, config=None):
 	file_paths = []
 	for srcdir in all_dirs:
 		file_paths.extend(
-			get_paths_from_dir(srcdir, file_matchers=file_matchers)
+			get_paths_from_dir(srcdir, file_matchers=file_matchers, filetype=TYPE_RESULTS)
 		)
 
 	data = []
 	for path in file_paths:
-		data.append(open_json(path[0], path[1]))
+		data.append(open_results(path[0], path[1]))
 
 	categ_data = []
 	for category in categories:
@@ -77,8 +82,10 @@ def run(args=None, config=None):
 	visualize_category_data(categ_data, **config)
 
 	if 'outputdir' in config:
-		save_json(
+		save_results(
 			categ_data,
 			config['outputdir'],
-			str(int(time.time())) + '_categ_data.json'
+			str(int(time.time())) + '_categ_data.json',
+			output_format=config['output_format'] if 'output_format' in config else 'json',
+			compression=config['output_compression'] if 'output_compression' in config else None
 		)
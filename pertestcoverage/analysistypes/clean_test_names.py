@@ -84,6 +84,12 @@ def run(args=None, config=None):
 
 		# This path can be Null
 		mozcentral-path: /home/Username/mozilla-source/mozilla-central/
+		Optional(
+			# Number of processes used to clean the names.
+			processes: 4
+			# Where the path index of `mozcentral-path` is cached.
+			cache-dir: /home/Username/.cache/coco-tools/
+		)
 		test-names: [
 			't1',
 			't2',
@@ -104,6 +110,8 @@ def run(args=None, config=None):
 					  None
 	ignore_wpt_existence = False if 'ignore-wpt-existence' not in config else \
 						   config['ignore-wpt-existence']
+	processes = config['processes'] if 'processes' in config else None
+	cache_dir = config['cache-dir'] if 'cache-dir' in config else None
 
 	clean_type = 'wpt' if 'clean-type' not in config and \
 					   config['clean-type'] not in CLEAN_TYPES else \
@@ -139,7 +147,9 @@ def run(args=None, config=None):
 			test_names,
 			mozcentral_path=mozcentral_path,
 			ignore_wpt_existence=ignore_wpt_existence,
-			suites=suites if clean_type in ('mixed',) else None
+			suites=suites if clean_type in ('mixed',) else None,
+			processes=processes,
+			cache_dir=cache_dir
 		)
 
 		if clean_type == 'mixed':
@@ -34,4 +34,19 @@ class ExampleScheduler:
 		else:
 			log.info("A mysterious force prevents {} from being considered!".format(test_fixed))
 			result['skip'] = True
-			return result
\ No newline at end of file
+			return result
+
+	def analyze_fbc_entries(self, batch):
+		'''
+			batch is a list of (entry, fmt_testname) tuples, a result
+			must be returned for each of them (in the same order).
+
+			This is optional, schedulers that can share work between
+			entries should implement it. Otherwise, `analyze_fbc_entry`
+			is called for each entry.
+		'''
+		log.info("Scheduling {} entries at once!".format(len(batch)))
+		return [
+			self.analyze_fbc_entry(entry, fmt_testname)
+			for entry, fmt_testname in batch
+		]
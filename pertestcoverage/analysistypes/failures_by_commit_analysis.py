@@ -1,23 +1,25 @@
 import os
 import time
 import logging
-import numpy as np
-from matplotlib import pyplot as plt
 
 from ..cli import AnalysisParser
+from ..utils.cocoplot import get_pyplot, show_figures
 
 from ..utils.cocoload import (
-	save_json,
+	save_results,
 	get_http_json,
 	query_activedata,
 	get_changesets,
 	HG_URL
 )
+from ..utils.cocoactivedata import query_many
+from ..utils.cocopush import PushIndex
 
 log = logging.getLogger('pertestcoverage')
 
 
 def plot_histogram(data, x_labels, title, figure=None, **kwargs):
+	plt = get_pyplot()
 	if not figure:
 		f = plt.figure()
 	else:
@@ -46,6 +48,16 @@ def run(args=None, config=None):
 
 			Optional(
 				changesets: ["125hV21eE49", ...]
+
+				# Get the changesets from the pushlog (concurrently,
+				# and cached in `cache_dir`) instead of the json-log
+				use_pushlog: True
+				cache_dir: "/home/sparky/.cache/coco-tools/"
+
+				# Format of the breakdown ('json' or 'ndjson'), and
+				# its compression ('gzip' or 'zstd', none by default)
+				output_format: "ndjson"
+				output_compression: "gzip"
 			)
 
 			mochitest_tc_task_rev: "dcb3a3ba9065"
@@ -68,7 +80,11 @@ def run(args=None, config=None):
 	platform_prefix = config['platform_prefix']
 	seta_suites = config['seta_suites']
 	changesets = [] if 'changesets' not in config else config['changesets']
+	use_pushlog = config['use_pushlog'] if 'use_pushlog' in config else False
+	cache_dir = config['cache_dir'] if 'cache_dir' in config else None
 	outputdir = config['outputdir']
+	output_format = config['output_format'] if 'output_format' in config else 'json'
+	output_compression = config['output_compression'] if 'output_compression' in config else None
 
 	exclude_failed_tests = [
 		"Main app process exited normally",
@@ -123,7 +139,10 @@ def run(args=None, config=None):
 
 	# Get all patches
 	if not changesets:
-		changesets = get_changesets(hg_analysisbranch, startrevision, numpatches)
+		changesets = get_changesets(
+			hg_analysisbranch, startrevision, numpatches,
+			use_pushlog=use_pushlog, cache_dir=cache_dir
+		)
 
 	# Get all pushes
 	seta_query = {
@@ -140,46 +159,16 @@ def run(args=None, config=None):
 	seta_numtests_data = query_activedata(seta_query, active_data_url='http://activedata.allizom.org/query')
 	seta_numtests_dict = {changeset: 0 for changeset in seta_numtests_data['changeset']}
 
-	# Format SETA data (expand to all changesets)
-	seta_numtests_expanded = []
-	prev_changeset = None
-	cset_groups = {}
-	cset_group = []
-
-	for changeset in changesets:
-		if prev_changeset:
-			if prev_changeset != changeset and changeset in seta_numtests_dict:
-				# Found a new push, set the new push revision and save cset grouping to
-				# make histogram processing simpler.
-				cset_groups[prev_changeset] = cset_group.copy()
-				cset_group = []
-
-				prev_changeset = changeset
-		else:
-			prev_changeset = changeset
-
-		seta_numtests_expanded.append((seta_numtests_dict[prev_changeset], changeset))
-		cset_group.append(changeset)
-	cset_groups[prev_changeset] = cset_group.copy()
-
-	print(cset_groups)
+	# Group the changesets into pushes, changesets
+	# with test runs start a new push.
+	push_index = PushIndex(changesets, pushheads=seta_numtests_dict)
+	log.debug("Pushes: " + str(push_index.pushes))
 
 	tests_for_changeset = {}
-	tests_per_file = {}
-
-	histogram1_datalist = []
-	grouped_data = {}
 
 	# For each patch
 	all_changesets = []
-	prev_changeset = None
 	for count, changeset in enumerate(changesets):
-		if prev_changeset:
-			if prev_changeset != changeset and changeset in seta_numtests_dict:
-				prev_changeset = changeset
-		else:
-			prev_changeset = changeset
-
 		log.info("On changeset " + "(" + str(count) + "): " + changeset)
 
 		# Get patch
@@ -196,44 +185,44 @@ def run(args=None, config=None):
 		xpcshell_query_json['where']['and'][0] = in_entry
 		failed_tests_query_json['where']['and'][0] = {"eq":{"repo.changeset.id12":changeset}}
 
-		try:
-			failed_tests = query_activedata(failed_tests_query_json, active_data_url='http://activedata.allizom.org/query')
-
-			mochi_tests = [testchunk[0] for testchunk in query_activedata(mochitest_query_json)]
-			xpc_tests = [testchunk[0] for testchunk in query_activedata(xpcshell_query_json)]
-		except Exception as e:
+		failed_tests, = query_many(
+			[failed_tests_query_json],
+			active_data_url='http://activedata.allizom.org/query',
+			return_exceptions=True
+		)
+		if isinstance(failed_tests, Exception):
+			log.info("Error running query: " + str(failed_tests_query_json))
+			failed_tests = {}
+
+		mochi_data, xpc_data = query_many(
+			[mochitest_query_json, xpcshell_query_json], return_exceptions=True
+		)
+		if isinstance(mochi_data, Exception) or isinstance(xpc_data, Exception):
 			log.info("Error running query: " + str(mochitest_query_json))
 			log.info("or the query: " + str(xpcshell_query_json))
 			mochi_tests = []
 			xpc_tests = []
+		else:
+			mochi_tests = [testchunk[0] for testchunk in mochi_data]
+			xpc_tests = [testchunk[0] for testchunk in xpc_data]
 
 		print(failed_tests)
-		if 'test' not in failed_tests and changeset in cset_groups:
+		if 'test' not in failed_tests and push_index.is_push_head(changeset):
 			log.info("No task failures to compare against.")
 			continue
 
-		all_tests = list(set(mochi_tests) | set(xpc_tests))
-
-		if prev_changeset not in grouped_data: 
-			grouped_data[prev_changeset] = {}
-			grouped_data[prev_changeset]['all_failed_tests'] = []
-			grouped_data[prev_changeset]['all_ptc_tests'] = all_tests.copy()
-
-		grouped_data[prev_changeset]['all_ptc_tests'] = list(set(grouped_data[prev_changeset]['all_ptc_tests']) | set(all_tests))
+		# The tests scheduled and failed in the push so far
+		all_tests = push_index.add_tests(changeset, set(mochi_tests) | set(xpc_tests))
 
+		failed = []
 		if 'test' in failed_tests:
-			all_failed_tests = [test for test in failed_tests['test'] if test not in exclude_failed_tests]
-			grouped_data[prev_changeset]['all_failed_tests'] = list(
-				set(grouped_data[prev_changeset]['all_failed_tests']) | set(all_failed_tests)
-			)
+			failed = [test for test in failed_tests['test'] if test not in exclude_failed_tests]
+		all_failed_tests = push_index.add_tests(changeset, failed, name='failed')
 
-		all_failed_tests = grouped_data[prev_changeset]['all_failed_tests']
 		if len(all_failed_tests) == 0:
 			continue
 
-		all_tests = grouped_data[prev_changeset]['all_ptc_tests']
-
-		all_tests_not_run = list(set(all_failed_tests) - set(all_tests))
+		all_tests_not_run = list(all_failed_tests - all_tests)
 
 		log.info("Number of tests: " + str(len(all_tests)))
 		log.info("Number of failed tests: " + str(len(all_failed_tests)))
@@ -252,23 +241,32 @@ def run(args=None, config=None):
 		all_changesets.append(changeset)
 
 	# Recompute histogram
-	new_histogram = []
+	min_tests_not_run = {}
 	for changeset in all_changesets:
-		for pushcset, grouping in cset_groups.items():
-			if changeset not in grouping:
-				continue
-			min_tests_not_run = min([tests_for_changeset[c]['numtestsnotrun'] for c in grouping if c in tests_for_changeset])
-			new_histogram.append(
-				(tests_for_changeset[changeset]['numtestsfailed'], tests_for_changeset[changeset]['numtestsfailed'] - min_tests_not_run, changeset)
-			)
-			break
+		pushid = push_index.get_push(changeset)
+		numtestsnotrun = tests_for_changeset[changeset]['numtestsnotrun']
+		min_tests_not_run[pushid] = min(min_tests_not_run.get(pushid, numtestsnotrun), numtestsnotrun)
+
+	new_histogram = [
+		(
+			tests_for_changeset[changeset]['numtestsfailed'],
+			tests_for_changeset[changeset]['numtestsfailed'] - min_tests_not_run[push_index.get_push(changeset)],
+			changeset
+		)
+		for changeset in all_changesets
+	]
 
 	## Save results (number, and all tests scheduled)
 	if outputdir:
 		log.info("\nSaving results to output directory: " + outputdir)
-		save_json(tests_for_changeset, outputdir, str(int(time.time())) + '_per_changeset_breakdown.json')
+		save_results(
+			tests_for_changeset, outputdir, str(int(time.time())) + '_per_changeset_breakdown.json',
+			output_format=output_format, compression=output_compression
+		)
 
 	## Plot the results
+	plt = get_pyplot()
+
 	f, b1 = plot_histogram(
 		data=[numtestsfailed for numtestsfailed, _, _ in new_histogram],
 		x_labels=all_changesets,
@@ -281,5 +279,5 @@ def run(args=None, config=None):
 
 	log.info("Close figures to end analysis.")
 	log.info("Changesets analyzed (use these in other analysis types if possible): \n" + str(all_changesets))
-	plt.show()
+	show_figures('failures_by_commit_analysis', outputdir=outputdir)
 
@@ -1,18 +1,16 @@
 import os
 import time
 import logging
-import numpy as np
-from matplotlib import pyplot as plt
 
 from ..cli import AnalysisParser
 
 from ..utils.cocoload import (
 	save_json,
 	get_http_json,
-	query_activedata,
 	get_changesets,
 	HG_URL
 )
+from ..utils.cocoactivedata import query_many
 
 log = logging.getLogger('pertestcoverage')
 
@@ -31,6 +29,11 @@ def run(args=None, config=None):
 
 			Optional(
 				changesets: ["125hV21eE49", ...]
+
+				# Get the changesets from the pushlog (concurrently,
+				# and cached in `cache_dir`) instead of the json-log
+				use_pushlog: True
+				cache_dir: "/home/sparky/.cache/coco-tools/"
 			)
 
 			mochitest_tc_task_rev: "dcb3a3ba9065"
@@ -52,6 +55,8 @@ def run(args=None, config=None):
 	minimum_tests = config['minimum_tests']
 	num_test_counts_in_worst_case = config['num_test_counts_in_worst_case']
 	changesets = [] if 'changesets' not in config else config['changesets']
+	use_pushlog = config['use_pushlog'] if 'use_pushlog' in config else False
+	cache_dir = config['cache_dir'] if 'cache_dir' in config else None
 
 	outputdir = config['outputdir']
 
@@ -120,7 +125,10 @@ def run(args=None, config=None):
 
 	# Get number of patches requested
 	if not changesets:
-		changesets = get_changesets(hg_analysisbranch, startrevision, numpatches)
+		changesets = get_changesets(
+			hg_analysisbranch, startrevision, numpatches,
+			use_pushlog=use_pushlog, cache_dir=cache_dir
+		)
 
 	per_changeset_info = {}
 	tests_per_file = {}
@@ -144,8 +152,9 @@ def run(args=None, config=None):
 			xpcshell_all_query_json['where']['and'][0] = in_entry
 
 			try:
-				mochi_tests = [testchunk[0] for testchunk in query_activedata(mochitest_all_query_json)]
-				xpc_tests = [testchunk[0] for testchunk in query_activedata(xpcshell_all_query_json)]
+				mochi_data, xpc_data = query_many([mochitest_all_query_json, xpcshell_all_query_json])
+				mochi_tests = [testchunk[0] for testchunk in mochi_data]
+				xpc_tests = [testchunk[0] for testchunk in xpc_data]
 			except Exception as e:
 				log.info("Error running query: " + str(mochitest_query_json))
 				log.info("or the query: " + str(xpcshell_query_json))
@@ -173,8 +182,7 @@ def run(args=None, config=None):
 			xpcshell_query_json['where']['and'][0]['eq']['source.file.name'] = file
 
 			try:
-				mochi_tests = query_activedata(mochitest_query_json)
-				xpc_tests = query_activedata(xpcshell_query_json)
+				mochi_tests, xpc_tests = query_many([mochitest_query_json, xpcshell_query_json])
 			except Exception as e:
 				log.info("Error running with file: " + file)
 
@@ -1,15 +1,13 @@
 import os
 import time
 import logging
-import numpy as np
 import csv
 
-from matplotlib import pyplot as plt
-
 from ..cli import AnalysisParser
+from ..utils.cocoplot import get_pyplot, show_figures
 
 from ..utils.cocoload import (
-	save_json,
+	save_results,
 	get_http_json,
 	query_activedata,
 	get_changesets,
@@ -21,6 +19,7 @@ log = logging.getLogger('pertestcoverage')
 
 
 def plot_histogram(data, x_labels, title, figure=None, **kwargs):
+	plt = get_pyplot()
 	if not figure:
 		f = plt.figure()
 	else:
@@ -54,6 +53,13 @@ def run(args=None, config=None):
 				["dcb3a3ba9065", "try"],
 				["6369d1c6526b", "try"]
 			]
+
+			Optional(
+				# Format of the breakdown ('json' or 'ndjson'), and
+				# its compression ('gzip' or 'zstd', none by default)
+				output_format: "ndjson"
+				output_compression: "gzip"
+			)
 	"""
 	if args:
 		parser = AnalysisParser('config')
@@ -66,6 +72,8 @@ def run(args=None, config=None):
 	hg_analysisbranch = config['hg_analysisbranch']
 	changesets_list = config['changesets']
 	outputdir = config['outputdir']
+	output_format = config['output_format'] if 'output_format' in config else 'json'
+	output_compression = config['output_compression'] if 'output_compression' in config else None
 	tc_tasks_rev_n_branch = config['tc_tasks_rev_n_branch']
 
 	changesets = []
@@ -214,9 +222,14 @@ def run(args=None, config=None):
 	## Save results (number, and all tests scheduled)
 	if outputdir:
 		log.info("\nSaving results to output directory: " + outputdir)
-		save_json(tests_for_changeset, outputdir, str(int(time.time())) + '_per_changeset_breakdown.json')
+		save_results(
+			tests_for_changeset, outputdir, str(int(time.time())) + '_per_changeset_breakdown.json',
+			output_format=output_format, compression=output_compression
+		)
 
 	## Plot the results
+	plt = get_pyplot()
+
 	f, b1 = plot_histogram(
 		data=[numtestsfailed for numtestsfailed, _, _ in histogram1_datalist],
 		x_labels=all_changesets,
@@ -256,5 +269,5 @@ def run(args=None, config=None):
 
 	log.info("Close figures to end analysis.")
 	log.info("Changesets analyzed (use these in other analysis types if possible): \n" + str(all_changesets))
-	plt.show()
+	show_figures('fixed_by_commit_analysis', outputdir=outputdir)
 
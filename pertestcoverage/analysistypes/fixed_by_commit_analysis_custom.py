@@ -1,13 +1,14 @@
 import os
 import time
 import logging
-import numpy as np
 import csv
+import collections
 import importlib
+import multiprocessing
 
-from matplotlib import pyplot as plt
 
 from ..cli import AnalysisParser
+from ..utils.cocoplot import get_pyplot, show_figures
 
 from ..utils.cocofilter import (
 	fix_names,
@@ -17,18 +18,23 @@ from ..utils.cocofilter import (
 	get_tests_with_no_data
 )
 
+from ..utils.coconames import get_test_name_table
 from ..utils.cocoload import (
 	save_json,
+	save_results,
+	get_results_filename,
+	NDJSONWriter,
 	get_http_json,
 	query_activedata,
 	get_changesets,
 	get_fixed_by_commit_entries,
 	hg_branch,
-	format_testname,
 	pattern_find,
 	HG_URL,
 	TYPE_PERTEST,
-	TYPE_STDPTC
+	TYPE_STDPTC,
+	FBC_WINDOW_DAYS,
+	FBC_CONCURRENCY
 )
 
 log = logging.getLogger('pertestcoverage')
@@ -41,6 +47,166 @@ def import_class(file, classname):
 	return customclass
 
 
+def get_scheduler_specs(config):
+	'''
+		Returns a list of (name, custom_script, custom_classname) for the
+		schedulers given in `custom_scheduling` and `custom_classname`,
+		which can both be single values or lists of the same length.
+	'''
+	custom_scripts = config['custom_scheduling']
+	custom_classnames = config['custom_classname']
+	if not isinstance(custom_scripts, list):
+		custom_scripts = [custom_scripts]
+	if not isinstance(custom_classnames, list):
+		custom_classnames = [custom_classnames]
+
+	if len(custom_scripts) == 1 and len(custom_classnames) > 1:
+		custom_scripts = custom_scripts * len(custom_classnames)
+	if len(custom_scripts) != len(custom_classnames):
+		raise Exception(
+			"`custom_scheduling` and `custom_classname` must have the same number of entries."
+		)
+
+	# Use the class names unless they are not unique
+	unique_classnames = len(set(custom_classnames)) == len(custom_classnames)
+	scheduler_specs = []
+	names = []
+	for count, (custom_script, custom_classname) in enumerate(zip(custom_scripts, custom_classnames)):
+		name = custom_classname if unique_classnames else custom_script + '_' + custom_classname
+		if name in names:
+			name += '_' + str(count)
+		names.append(name)
+		scheduler_specs.append((name, custom_script, custom_classname))
+	return scheduler_specs
+
+
+def analyze_fbc_batch(scheduler, batch):
+	'''
+		Returns the results of the scheduler for a batch of
+		(fbc_entry, fmt_testname) tuples. Schedulers that don't
+		have `analyze_fbc_entries` are given one entry at a time.
+	'''
+	if hasattr(scheduler, 'analyze_fbc_entries'):
+		results = scheduler.analyze_fbc_entries(batch)
+		if len(results) != len(batch):
+			raise Exception(
+				"Expected %s results from analyze_fbc_entries, got %s." %
+				(str(len(batch)), str(len(results)))
+			)
+		return list(results)
+	return [
+		scheduler.analyze_fbc_entry(fbc_entry, fmt_testname)
+		for fbc_entry, fmt_testname in batch
+	]
+
+
+# Schedulers used by the worker processes
+_worker_schedulers = {}
+
+
+def _init_scheduler_worker(scheduler_specs, config):
+	global _worker_schedulers
+	_worker_schedulers = {
+		name: import_class(custom_script, custom_classname)(config)
+		for name, custom_script, custom_classname in scheduler_specs
+	}
+
+
+def _analyze_fbc_batch_worker(name, batch):
+	return analyze_fbc_batch(_worker_schedulers[name], batch)
+
+
+class SchedulerResults:
+	'''
+		Holds the results of one scheduler over the FBC entries.
+	'''
+	def __init__(self, name, numpatches, runname=None):
+		self.name = name
+		self.numpatches = numpatches
+		self.runname = runname
+		self.tests_for_changeset = {}
+		self.changesets_counts = {}
+		self.all_changesets = []
+		self.histogram1_datalist = []
+		self.writer = None
+
+	def is_done(self):
+		return len(self.all_changesets) >= self.numpatches
+
+	def record_result(self, scheduled_entry, returned_data):
+		changeset, suite, repo, orig_test_fixed, test_fixed, files_modified, currhg_analysisbranch = scheduled_entry
+
+		# Schedulers can return the tests they scheduled
+		all_tests = returned_data['tests'] if 'tests' in returned_data else []
+		all_tests_not_run = []
+		if 'skip' in returned_data and returned_data['skip']:
+			return
+		if not returned_data['success']:
+			all_tests_not_run.append(test_fixed)
+
+		log.info("")
+		log.info("Scheduling result of %s for changeset: %s" % (self.name, changeset))
+		log.info("Number of tests: " + str(len(all_tests)))
+		log.info("Number of failed tests: " + str(len([test_fixed])))
+		log.info("Number of files: " + str(len(files_modified)))
+		log.info("Number of tests not scheduled by per-test: " + str(len(all_tests_not_run)))
+		log.info("Tests not scheduled: \n" + str(all_tests_not_run))
+
+		cset_count = 1
+		if changeset not in self.changesets_counts:
+			self.changesets_counts[changeset] = cset_count
+		else:
+			self.changesets_counts[changeset] += 1
+			cset_count = self.changesets_counts[changeset]
+
+		changeset_name = changeset + "_" + str(cset_count)
+		self.tests_for_changeset[changeset_name] = {
+			'patch-link': HG_URL + currhg_analysisbranch + "rev/" + changeset,
+			'numfiles': len(files_modified),
+			'numtests': len(all_tests),
+			'numtestsfailed': 1,
+			'numtestsnotrun': len(all_tests_not_run),
+			'files_modified': files_modified,
+			'suite': suite,
+			'runname': self.runname,
+			'orig-test-related': orig_test_fixed,
+			'test-related': test_fixed,
+			'testsnotrun': all_tests_not_run,
+		}
+
+		for entry in returned_data:
+			self.tests_for_changeset[changeset_name][entry] = returned_data[entry]
+		if self.writer is not None:
+			self.writer.set(changeset_name, self.tests_for_changeset[changeset_name])
+
+		self.all_changesets.append(changeset)
+		self.histogram1_datalist.append((1, 1-len(all_tests_not_run), changeset))
+
+		log.info("Running success rate = {:3.2f}%".format(self.get_summary()['success_rate']))
+
+	def record_batch(self, batch, results):
+		for scheduled_entry, returned_data in zip(batch, results):
+			if self.is_done():
+				return
+			self.record_result(scheduled_entry, returned_data)
+
+	def get_summary(self):
+		numchangesets = len(self.all_changesets)
+		total_correct = sum([
+				1 if not self.tests_for_changeset[cset + "_1"]['testsnotrun'] else 0
+				for cset in self.all_changesets
+		])
+		numtests = [entry['numtests'] for entry in self.tests_for_changeset.values()]
+		return {
+			'numchangesets': numchangesets,
+			'total_correct': total_correct,
+			'total_incorrect': numchangesets - total_correct,
+			'success_rate': 100 * (total_correct/numchangesets) if numchangesets else 0,
+			'total_tests_scheduled': sum(numtests),
+			'mean_tests_scheduled': sum(numtests)/len(numtests) if numtests else 0
+		}
+
+
 def run(args=None, config=None):
 	"""
 		Expects a `config` with the settings found in
@@ -59,6 +225,20 @@ def run(args=None, config=None):
 			>> res = myclass.analyze_fbc_entry(fbc_entry)
 			>> res
 			{'success': False, 'skip': True}
+
+		The class can also have an 'analyze_fbc_entries(batch)' function, it is
+		then given batches of `batch_size` (fbc_entry, fmt_testname) tuples and must
+		return a list with a result for each of them. With `processes` set, the
+		batches are analyzed in that many worker processes (each one with its
+		own instance of the class). A 'tests' entry can be returned in the results
+		with the tests that were scheduled.
+
+		`custom_scheduling` and `custom_classname` can be lists to compare
+		several schedulers, they are all given the same FBC entries (which are
+		only fetched once) and a breakdown is saved for each of them.
+
+		With `output_format: 'ndjson'` the breakdowns are written as the results
+		are produced, and `output_compression` ('gzip' or 'zstd') compresses them.
 	"""
 	if args:
 		parser = AnalysisParser('config')
@@ -76,17 +256,30 @@ def run(args=None, config=None):
 	include_guaranteed = config['include_guaranteed'] if 'include_guaranteed' in  config else False
 	use_active_data = config['use_active_data'] if 'use_active_data' in config else False
 	skip_py = config['skip_py'] if 'skip_py' in config else True
+	cache_dir = config['cache_dir'] if 'cache_dir' in config else None
+	name_table = get_test_name_table(cache_dir=cache_dir)
 
 	suites_to_analyze = config['suites_to_analyze']
 	platforms_to_analyze = config['platforms_to_analyze']
 	from_date = config['from_date']
+	to_date = config['to_date'] if 'to_date' in config else None
+	fbc_window_days = config['fbc_window_days'] if 'fbc_window_days' in config else FBC_WINDOW_DAYS
+	fbc_concurrency = config['fbc_concurrency'] if 'fbc_concurrency' in config else FBC_CONCURRENCY
 
 	timestr = str(int(time.time()))
 
-	custom_script = config['custom_scheduling']
-	custom_classname = config['custom_classname']
-	custom_class = import_class(custom_script, custom_classname)
-	custom_class_obj = custom_class(config)
+	scheduler_specs = get_scheduler_specs(config)
+	schedulers = collections.OrderedDict()
+	for name, custom_script, custom_classname in scheduler_specs:
+		schedulers[name] = import_class(custom_script, custom_classname)(config)
+
+	default_batch_size = 1
+	if all(hasattr(scheduler, 'analyze_fbc_entries') for scheduler in schedulers.values()):
+		default_batch_size = 50
+	batch_size = config['batch_size'] if 'batch_size' in config else default_batch_size
+	processes = config['processes'] if 'processes' in config else None
+	output_format = config['output_format'] if 'output_format' in config else 'json'
+	output_compression = config['output_compression'] if 'output_compression' in config else None
 
 	failed_tests_query_json = {
 		"from":"unittest",
@@ -119,161 +312,220 @@ def run(args=None, config=None):
 		platforms_to_analyze=platforms_to_analyze,
 		from_date=from_date,
 		local_datasets_list=changesets_list,
-		save_fbc_entries=outputdir
+		save_fbc_entries=outputdir,
+		to_date=to_date,
+		window_days=fbc_window_days,
+		concurrency=fbc_concurrency,
+		cache_dir=cache_dir
 	)
+	name_table.add_entries(changesets)
 
 	# For each patch
-	histogram1_datalist = []
-	tests_for_changeset = {}
-	changesets_counts = {}
-	count_changesets_processed = 0
-	all_changesets = []
-
-	for count, tp in enumerate(changesets):
-		if count_changesets_processed >= numpatches:
-			continue
+	all_results = collections.OrderedDict(
+		(name, SchedulerResults(name, numpatches, runname=runname))
+		for name in schedulers
+	)
 
-		if len(tp) == 4:
-			changeset, suite, repo, test_fixed = tp
+	def get_breakdown_filename(name):
+		if len(all_results) == 1:
+			filename = timestr + '_per_changeset_breakdown.json'
 		else:
-			continue
-
-		orig_test_fixed = test_fixed
-		test_fixed = test_fixed.split('ini:')[-1]
-		if 'mochitest' not in suite and 'xpcshell' not in suite:
-			test_fixed = format_testname(test_fixed)
-
-		changeset = changeset[:12]
-
-		log.info("")
-		log.info("On changeset " + "(" + str(count) + "): " + changeset)
-		log.info("Running analysis: %s" % str(runname))
-		log.info("Test name: %s" % test_fixed)
-
-		# Get patch
-		currhg_analysisbranch = hg_branch(repo)
-		files_url = HG_URL + currhg_analysisbranch + "json-info/" + changeset
-		data = get_http_json(files_url)
-		files_modified = data[changeset]['files']
-		orig_files_modified = files_modified.copy()
-
-		# Get tests that use this patch
-		failed_tests_query_json['where']['and'][0] = {"eq": {"repo.changeset.id12": changeset}}
-		failed_tests_query_json['where']['and'][1] = {"eq": {"repo.branch.name": repo}}
-
-		log.info("Checking for test failures...")
-
-		all_tests = []
-		failed_tests = []
-		try:
-			failed_tests = query_activedata(failed_tests_query_json)
-		except Exception as e:
-			log.info("Error running query: " + str(failed_tests_query_json))
-
-		all_failed_tests = []
-		if 'test' in failed_tests:
-			all_failed_tests = [test for test in failed_tests['test']]
-
-		if pattern_find(test_fixed, all_failed_tests):
-			log.info("Test was not completely fixed by commit: " + str(test_fixed))
-			continue
-
-		log.info("Test was truly fixed. Failed tests: " + str(all_failed_tests))
-
-		# Perform scheduling
-		all_tests_not_run = []
-		returned_data = custom_class_obj.analyze_fbc_entry(
-			(changeset, suite, repo, orig_test_fixed),
-			test_fixed
+			filename = timestr + '_' + name + '_per_changeset_breakdown.json'
+		return get_results_filename(filename, output_format, output_compression)
+
+	# NDJSON breakdowns are written as the results come in
+	if outputdir and output_format == 'ndjson':
+		for name, results in all_results.items():
+			results.writer = NDJSONWriter(outputdir, get_breakdown_filename(name))
+
+	def all_done():
+		return all(results.is_done() for results in all_results.values())
+
+	# Batches are scheduled while the next entries are gathered when
+	# worker processes are used, results are recorded in order.
+	pending_batches = collections.deque()
+
+	def record_pending_batches(wait=False):
+		while pending_batches and (wait or pending_batches[0][2].ready()):
+			name, batch, async_results = pending_batches.popleft()
+			all_results[name].record_batch(batch, async_results.get())
+
+	def get_entries_needed():
+		# Entries still needed by the scheduler with the fewest results,
+		# the entries of its pending batches are counted as results.
+		needed = 0
+		for name, results in all_results.items():
+			if results.is_done():
+				continue
+			pending = sum(len(batch) for batch_name, batch, _ in pending_batches if batch_name == name)
+			needed = max(needed, numpatches - len(results.all_changesets) - pending)
+		return needed
+
+	def schedule_batch(batch):
+		if not batch:
+			return
+		log.info("Scheduling a batch of %s entries..." % str(len(batch)))
+		scheduler_batch = [
+			((changeset, suite, repo, orig_test_fixed), test_fixed)
+			for changeset, suite, repo, orig_test_fixed, test_fixed, _, _ in batch
+		]
+		for name, scheduler in schedulers.items():
+			if all_results[name].is_done():
+				continue
+			if pool is None:
+				all_results[name].record_batch(batch, analyze_fbc_batch(scheduler, scheduler_batch))
+			else:
+				pending_batches.append((
+					name, batch, pool.apply_async(_analyze_fbc_batch_worker, (name, scheduler_batch))
+				))
+		record_pending_batches()
+
+	pool = None
+	if processes and processes > 1:
+		pool = multiprocessing.Pool(
+			processes,
+			initializer=_init_scheduler_worker,
+			initargs=(scheduler_specs, config)
 		)
 
-		if 'skip' in returned_data and returned_data['skip']:
-			continue
-		if not returned_data['success']:
-			all_tests_not_run.append(test_fixed)
-
-		log.info("Number of tests: " + str(len(all_tests)))
-		log.info("Number of failed tests: " + str(len([test_fixed])))
-		log.info("Number of files: " + str(len(files_modified)))
-		log.info("Number of tests not scheduled by per-test: " + str(len(all_tests_not_run)))
-		log.info("Tests not scheduled: \n" + str(all_tests_not_run))
-
-		cset_count = 1
-		if changeset not in changesets_counts:
-			changesets_counts[changeset] = cset_count
-		else:
-			changesets_counts[changeset] += 1
-			cset_count = changesets_counts[changeset]
-
-		changeset_name = changeset + "_" + str(cset_count)
-		tests_for_changeset[changeset_name] = {
-			'patch-link': HG_URL + currhg_analysisbranch + "rev/" + changeset,
-			'numfiles': len(files_modified),
-			'numtests': len(all_tests),
-			'numtestsfailed': 1,
-			'numtestsnotrun': len(all_tests_not_run),
-			'files_modified': files_modified,
-			'suite': suite,
-			'runname': runname,
-			'orig-test-related': orig_test_fixed,
-			'test-related': test_fixed,
-			'testsnotrun': all_tests_not_run,
-		}
-
-		for entry in returned_data:
-			tests_for_changeset[entry] = returned_data[entry]
-
-		all_changesets.append(changeset)
-		histogram1_datalist.append((1, 1-len(all_tests_not_run), changeset))
-		count_changesets_processed += 1
-
-		numchangesets = len(all_changesets)
-		total_correct = sum([
-				1 if not tests_for_changeset[cset + "_" + str(cset_count)]['testsnotrun'] else 0
-				for cset in all_changesets
-		])
-		log.info("Running success rate = {:3.2f}%".format(float((100 * (total_correct/numchangesets)))))
-
-	log.info("")
+	try:
+		batch = []
+		for count, tp in enumerate(changesets):
+			# Wait for the pending batches when they may have all the entries
+			# needed, or when there are as many of them as processes.
+			if pending_batches and (get_entries_needed() <= 0 or len(pending_batches) >= processes):
+				record_pending_batches(wait=True)
+			if all_done():
+				break
+
+			if len(tp) == 4:
+				changeset, suite, repo, test_fixed = tp
+			else:
+				continue
+
+			orig_test_fixed = test_fixed
+			test_fixed = test_fixed.split('ini:')[-1]
+			if 'mochitest' not in suite and 'xpcshell' not in suite:
+				test_fixed = name_table.short(test_fixed)
+
+			changeset = changeset[:12]
+
+			log.info("")
+			log.info("On changeset " + "(" + str(count) + "): " + changeset)
+			log.info("Running analysis: %s" % str(runname))
+			log.info("Test name: %s" % test_fixed)
+
+			# Get patch
+			currhg_analysisbranch = hg_branch(repo)
+			files_url = HG_URL + currhg_analysisbranch + "json-info/" + changeset
+			data = get_http_json(files_url)
+			files_modified = data[changeset]['files']
+
+			# Get tests that use this patch
+			failed_tests_query_json['where']['and'][0] = {"eq": {"repo.changeset.id12": changeset}}
+			failed_tests_query_json['where']['and'][1] = {"eq": {"repo.branch.name": repo}}
+
+			log.info("Checking for test failures...")
+
+			failed_tests = []
+			try:
+				failed_tests = query_activedata(failed_tests_query_json)
+			except Exception as e:
+				log.info("Error running query: " + str(failed_tests_query_json))
+
+			all_failed_tests = []
+			if 'test' in failed_tests:
+				all_failed_tests = [test for test in failed_tests['test']]
+
+			if pattern_find(test_fixed, all_failed_tests):
+				log.info("Test was not completely fixed by commit: " + str(test_fixed))
+				continue
+
+			log.info("Test was truly fixed. Failed tests: " + str(all_failed_tests))
+
+			# Perform scheduling
+			batch.append((
+				changeset, suite, repo, orig_test_fixed, test_fixed,
+				files_modified, currhg_analysisbranch
+			))
+			if len(batch) >= min(batch_size, get_entries_needed()):
+				schedule_batch(batch)
+				batch = []
+
+		schedule_batch(batch)
+		record_pending_batches(wait=True)
+	finally:
+		if pool is not None:
+			pool.terminate()
+		for results in all_results.values():
+			if results.writer is not None:
+				results.writer.close()
 
 	## Save results (number, and all tests scheduled)
+	summaries = collections.OrderedDict(
+		(name, results.get_summary()) for name, results in all_results.items()
+	)
 	if outputdir:
 		log.info("\nSaving results to output directory: " + outputdir)
-		timestr = str(int(time.time()))
-		save_json(tests_for_changeset, outputdir, timestr + '_per_changeset_breakdown.json')
-
-	f = plt.figure()
-
-	numchangesets = len(all_changesets)
-	total_correct = sum([
-			1 if not tests_for_changeset[cset + "_1"]['testsnotrun'] else 0
-			for cset in all_changesets
-	])
-	total_incorrect = sum([
-			1 if tests_for_changeset[cset + "_1"]['testsnotrun'] else 0
-			for cset in all_changesets
-	])
-
-	b2 = plt.pie(
-		[
-			100 * (total_correct/numchangesets),
-			100 * (total_no_coverage_data/numchangesets)
-		],
-		colors=['green', 'red'],
-		labels=[
-			'Successfully scheduled',
-			'Not successfully scheduled'
-		],
-		autopct='%1.1f%%'
-	)
+		if output_format != 'ndjson':
+			for name, results in all_results.items():
+				save_results(
+					results.tests_for_changeset, outputdir, get_breakdown_filename(name),
+					compression=output_compression
+				)
+		if len(all_results) > 1:
+			save_json(summaries, outputdir, timestr + '_scheduler_comparison.json')
+
+	name_table.save()
+
+	if len(all_results) > 1:
+		log.info("")
+		log.info("%-45s %12s %14s %16s %16s" % (
+			'scheduler', 'changesets', 'success rate', 'tests scheduled', 'tests/changeset'
+		))
+		for name, summary in summaries.items():
+			log.info("%-45s %12s %13.2f%% %16s %16.2f" % (
+				name,
+				str(summary['numchangesets']),
+				summary['success_rate'],
+				str(summary['total_tests_scheduled']),
+				summary['mean_tests_scheduled']
+			))
+
+	plt = get_pyplot()
+
+	for name, summary in summaries.items():
+		f = plt.figure()
+
+		numchangesets = summary['numchangesets']
+		b2 = plt.pie(
+			[
+				100 * (summary['total_correct']/numchangesets),
+				100 * (summary['total_incorrect']/numchangesets)
+			],
+			colors=['green', 'red'],
+			labels=[
+				'Successfully scheduled',
+				'Not successfully scheduled'
+			],
+			autopct='%1.1f%%'
+		)
+
+		plt.legend()
+		if len(summaries) > 1:
+			plt.title(name)
 
-	plt.legend()
+	all_changesets = []
+	for results in all_results.values():
+		all_changesets.extend([
+			cset for cset in results.all_changesets if cset not in all_changesets
+		])
 
 	log.info("Completed analysis for run: %s" % str(runname))
 
-	log.info("Total number of changesets in pie chart: " + str(numchangesets))
+	for name, summary in summaries.items():
+		log.info("Total number of changesets in pie chart (%s): %s" % (name, str(summary['numchangesets'])))
 
 	log.info("Close figures to end analysis.")
 	log.info("Changesets analyzed (use these in other analysis types if possible): \n" + str(all_changesets))
-	plt.show()
-
+	show_figures('fixed_by_commit_analysis_custom', outputdir=outputdir)
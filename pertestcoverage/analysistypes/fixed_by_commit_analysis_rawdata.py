@@ -1,12 +1,13 @@
 import os
+import json
 import time
 import logging
-import numpy as np
 import csv
 
-from matplotlib import pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 
 from ..cli import AnalysisParser
+from ..utils.cocoplot import get_pyplot, show_figures
 
 from ..utils.cocofilter import (
 	fix_names,
@@ -16,27 +17,33 @@ from ..utils.cocofilter import (
 	get_tests_with_no_data
 )
 
+from ..utils.cocoactivedata import query_many
+from ..utils.cococheckpoint import CheckpointJournal
+from ..utils.coconames import get_test_name_table
 from ..utils.cocoload import (
 	save_json,
+	save_results,
 	get_http_json,
 	query_activedata,
 	get_changesets,
 	get_coverage_tests,
 	get_coverage_tests_from_jsondatalist,
-	get_all_pertest_data,
-	get_all_stdptc_data,
+	get_all_rawdata,
 	get_fixed_by_commit_entries,
-	format_testname,
 	pattern_find,
 	HG_URL,
-	TYPE_PERTEST,
-	TYPE_STDPTC
+	FBC_WINDOW_DAYS,
+	FBC_CONCURRENCY
 )
 
 log = logging.getLogger('pertestcoverage')
 
+# Number of changesets fetched from hg at once when prefetching
+HG_CONCURRENCY = 8
+
 
 def plot_histogram(data, x_labels, title, figure=None, **kwargs):
+	plt = get_pyplot()
 	if not figure:
 		f = plt.figure()
 	else:
@@ -51,103 +58,52 @@ def plot_histogram(data, x_labels, title, figure=None, **kwargs):
 	return f, b
 
 
-def run(args=None, config=None):
-	"""
-		Expects a `config` with the settings found in
-		pertestcoverage/configs/config_fixed_by_commit_rawdata.yml
-
-		Throws errors if something is missing, all the settings
-		are listed at the top of the script.
-	"""
-	if args:
-		parser = AnalysisParser('config')
-		args = parser.parse_analysis_args(args)
-		config = args.config
-	if not config:
-		raise Exception("Missing `config` dict argument.")
-
-	numpatches = config['numpatches']
-	hg_analysisbranch = config['hg_analysisbranch']
-	changesets_list = config['changesets']
-	outputdir = config['outputdir']
-	pertest_rawdata_folders = config['pertest_rawdata_folders']
-	analyze_all = config['analyze_all'] if 'analyze_all' in config else False
-	mozcentral_path = config['mozcentral_path'] if 'mozcentral_path' in config else None
-	runname = config['runname'] if 'runname' in config else None
-	include_guaranteed = config['include_guaranteed'] if 'include_guaranteed' in  config else False
-	use_active_data = config['use_active_data'] if 'use_active_data' in config else False
-	skip_py = config['skip_py'] if 'skip_py' in config else True
-
-	#if use_active_data:
-	suites_to_analyze = config['suites_to_analyze']
-	platforms_to_analyze = config['platforms_to_analyze']
-	from_date = config['from_date']
-
-	timestr = str(int(time.time()))
-
-	# JSONs to use for per-test test file queries
-	coverage_query = {
-		"from":"coverage",
-		"where":{"and":[
-			{"eq":{"repo.branch.name":"mozilla-central"}},
-			{"regexp":{"test.name":""}},
-			{"exists":"test.name"}
-		]},
-		"limit":1,
-		"groupby":[{"name":"source","value":"source.file.name"}]
+def get_fbc_settings(config):
+	# Returns all the settings used by the analysis,
+	# with the defaults of the optional ones.
+	return {
+		'numpatches': config['numpatches'],
+		'hg_analysisbranch': config['hg_analysisbranch'],
+		'changesets': config['changesets'],
+		'outputdir': config['outputdir'],
+		'pertest_rawdata_folders': config['pertest_rawdata_folders'],
+		'analyze_all': config['analyze_all'] if 'analyze_all' in config else False,
+		'mozcentral_path': config['mozcentral_path'] if 'mozcentral_path' in config else None,
+		'cache_dir': config['cache_dir'] if 'cache_dir' in config else None,
+		'runname': config['runname'] if 'runname' in config else None,
+		'include_guaranteed': config['include_guaranteed'] if 'include_guaranteed' in config else False,
+		'use_active_data': config['use_active_data'] if 'use_active_data' in config else False,
+		'skip_py': config['skip_py'] if 'skip_py' in config else True,
+		'suites_to_analyze': config['suites_to_analyze'],
+		'platforms_to_analyze': config['platforms_to_analyze'],
+		'from_date': config['from_date'],
+		'to_date': config['to_date'] if 'to_date' in config else None,
+		'fbc_window_days': config['fbc_window_days'] if 'fbc_window_days' in config else FBC_WINDOW_DAYS,
+		'fbc_concurrency': config['fbc_concurrency'] if 'fbc_concurrency' in config else FBC_CONCURRENCY,
+		'tc_tasks_rev_n_branch': config['tc_tasks_rev_n_branch'] if 'tc_tasks_rev_n_branch' in config else [],
+		'output_format': config['output_format'] if 'output_format' in config else 'json',
+		'output_compression': config['output_compression'] if 'output_compression' in config else None,
 	}
 
-	failed_tests_query_json = {
-		"from":"unittest",
-		"where":{
-			"and":[
-				{"eq":{"repo.changeset.id12":None}},
-				{"eq":{"repo.branch.name":None}},
-				{"prefix":{"run.name":"test-linux64"}},
-				{"eq":{"task.state":"failed"}},
-				{"eq":{"result.ok":"false"}},
-				{
-					"or":[
-						{"prefix":{"run.suite":"mochitest"}},
-						{"prefix":{"run.suite":"xpcshell"}}
-					]
-				}
-			]
-		},
-		"limit":100000,
-		"select":[{"name":"test","value":"result.test"}]
-	}
 
-	changesets = get_fixed_by_commit_entries(
-		localdata=not use_active_data,
-		activedata=use_active_data,
-		suites_to_analyze=suites_to_analyze,
-		platforms_to_analyze=platforms_to_analyze,
-		from_date=from_date,
-		local_datasets_list=changesets_list,
-		save_fbc_entries=outputdir
+def load_fbc_entries(settings):
+	return get_fixed_by_commit_entries(
+		localdata=not settings['use_active_data'],
+		activedata=settings['use_active_data'],
+		suites_to_analyze=settings['suites_to_analyze'],
+		platforms_to_analyze=settings['platforms_to_analyze'],
+		from_date=settings['from_date'],
+		local_datasets_list=settings['changesets'],
+		save_fbc_entries=settings['outputdir'],
+		to_date=settings['to_date'],
+		window_days=settings['fbc_window_days'],
+		concurrency=settings['fbc_concurrency'],
+		cache_dir=settings['cache_dir']
 	)
 
-	jsondatalist = []
-	if not use_active_data:
-		for location_entry in pertest_rawdata_folders:
-			log.info("Opening data from %s" % location_entry)
-			if location_entry['type'] == TYPE_PERTEST:
-				print('here')
-				jsondatalist.extend(get_all_pertest_data(location_entry['location'], chrome_map_path=location_entry['chrome-map']))
-			elif location_entry['type'] == TYPE_STDPTC:
-				print('here2')
-				jsondatalist.extend(get_all_stdptc_data(location_entry['location'], chrome_map_path=location_entry['chrome-map']))
-
-	all_failed_ptc_tests = get_coverage_tests(tc_tasks_rev_n_branch, get_failed=True)
-
-	tests_for_changeset = {}
-	changesets_counts = {}
-	tests_per_file = {}
-
-	histogram1_datalist = []
 
-	# Remove tests with no data 
+def get_fixed_test_matchers(changesets, name_table):
+	# Returns the names used to find the data of the fixed tests.
 	tmp_tests = []
 	for count, tp in enumerate(changesets):
 		if len(tp) == 4:
@@ -157,48 +113,49 @@ def run(args=None, config=None):
 
 		test_fixed = test_fixed.split('ini:')[-1]
 		if 'mochitest' not in suite and 'xpcshell' not in suite:
-			test_fixed = format_testname(test_fixed)
+			test_fixed = name_table.short(test_fixed)
 		else:
-			test_fixed = format_testname(test_fixed, wpt=False)
+			test_fixed = name_table.short(test_fixed, wpt=False)
 		tmp_tests.append(test_fixed)
+	return tmp_tests
 
-	tests_with_no_data = []
-	if not use_active_data:
-		tests_with_no_data = get_tests_with_no_data(jsondatalist, tmp_tests)
-	else:
-		for test_matcher in tmp_tests:
-			coverage_query['where']['and'][1]['regexp']['test.name'] = ".*" + test_matcher.replace('\\', '/') + ".*"
-			log.info("Querying active data for data for the test: %s" % test_matcher.replace('\\', '/'))
-			coverage_data = query_activedata(coverage_query)
-			if len(coverage_data) == 0:
-				log.info("Found no data.\n")
-				tests_with_no_data.append(test_matcher)
-			else:
-				log.info("Found data. \n")
 
-	log.info("Number of tests with no data: %s" % str(len(tests_with_no_data)))
-	log.info("Number of tests in total: %s" % str(len(tmp_tests)))
+def find_tests_with_no_data(settings, tmp_tests, jsondatalist):
+	if not settings['use_active_data']:
+		return get_tests_with_no_data(jsondatalist, tmp_tests)
 
-	if outputdir:
-		save_json(
-			{
-				'testswithnodata': fix_names(changesets, tests_with_no_data),
-				'orig_testswithnodata': tests_with_no_data,
-				'alltests-matchers': tmp_tests,
-			},
-			outputdir,
-			timestr + '_test_matching_info.json'
-		)
+	# JSON to use for per-test test file queries
+	coverage_query = {
+		"from":"coverage",
+		"where":{"and":[
+			{"eq":{"repo.branch.name":"mozilla-central"}},
+			{"regexp":{"test.name":""}},
+			{"exists":"test.name"}
+		]},
+		"limit":1,
+		"groupby":[{"name":"source","value":"source.file.name"}]
+	}
 
-	# For each patch
-	changesets_removed = {}
-	count_changesets_processed = 0
-	all_changesets = []
-	num_guaranteed = 0
-	for count, tp in enumerate(changesets):
-		if count_changesets_processed >= numpatches:
-			continue
+	tests_with_no_data = []
+	for test_matcher in tmp_tests:
+		coverage_query['where']['and'][1]['regexp']['test.name'] = ".*" + test_matcher.replace('\\', '/') + ".*"
+		log.info("Querying active data for data for the test: %s" % test_matcher.replace('\\', '/'))
+		coverage_data = query_activedata(coverage_query)
+		if len(coverage_data) == 0:
+			log.info("Found no data.\n")
+			tests_with_no_data.append(test_matcher)
+		else:
+			log.info("Found data. \n")
+	return tests_with_no_data
 
+
+def get_candidate_entries(settings, changesets, tests_with_no_data, name_table):
+	'''
+		Yields the FBC entries that are kept before looking
+		at their changesets, in the form:
+			(count, changeset, suite, repo, orig_test_fixed, test_fixed)
+	'''
+	for count, tp in enumerate(changesets):
 		if len(tp) == 4:
 			changeset, suite, repo, test_fixed = tp
 		else:
@@ -207,14 +164,14 @@ def run(args=None, config=None):
 			if 'test' in status:
 				continue
 
-		if skip_py and test_fixed.endswith('.py'):
+		if settings['skip_py'] and test_fixed.endswith('.py'):
 			# Skip all python tests.
 			continue
 
 		orig_test_fixed = test_fixed
 		test_fixed = test_fixed.split('ini:')[-1]
 		if 'mochitest' not in suite and 'xpcshell' not in suite:
-			test_fixed = format_testname(test_fixed)
+			test_fixed = name_table.short(test_fixed)
 
 		found_bad = False
 		for t in tests_with_no_data:
@@ -224,7 +181,206 @@ def run(args=None, config=None):
 		if found_bad:
 			continue
 
-		changeset = changeset[:12]
+		yield count, changeset[:12], suite, repo, orig_test_fixed, test_fixed
+
+
+class ChangesetInfo:
+	'''
+		Gets (and keeps) what is needed from each changeset: the files
+		it modifies, the files it adds, and the tests that failed on it.
+		It can be filled ahead of time with `prefetch` and shared by
+		all the evaluations of the same FBC entries.
+	'''
+	def __init__(self, hg_analysisbranch):
+		self.hg_analysisbranch = hg_analysisbranch
+		self.files_modified = {}
+		self.new_files = {}
+		self.failed_tests = {}
+
+	def get_files_modified(self, changeset, repo):
+		if changeset not in self.files_modified:
+			files_url = HG_URL + self.hg_analysisbranch[repo] + "/json-info/" + changeset
+			data = get_http_json(files_url)
+			self.files_modified[changeset] = data[changeset]['files']
+		return list(self.files_modified[changeset])
+
+	def get_new_files(self, changeset, repo):
+		if changeset not in self.new_files:
+			new, _, _ = find_files_in_changeset(changeset, repo)
+			self.new_files[changeset] = [n.lstrip('/') for n in new]
+		return list(self.new_files[changeset])
+
+	def get_failed_tests_query(self, changeset, repo):
+		return {
+			"from":"unittest",
+			"where":{
+				"and":[
+					{"eq":{"repo.changeset.id12":changeset}},
+					{"eq":{"repo.branch.name":repo}},
+					{"prefix":{"run.name":"test-linux64"}},
+					{"eq":{"task.state":"failed"}},
+					{"eq":{"result.ok":"false"}},
+					{
+						"or":[
+							{"prefix":{"run.suite":"mochitest"}},
+							{"prefix":{"run.suite":"xpcshell"}}
+						]
+					}
+				]
+			},
+			"limit":100000,
+			"select":[{"name":"test","value":"result.test"}]
+		}
+
+	def get_failed_tests(self, changeset, repo):
+		key = changeset + ':' + repo
+		if key in self.failed_tests:
+			return self.failed_tests[key]
+
+		failed_tests_query_json = self.get_failed_tests_query(changeset, repo)
+		try:
+			failed_tests = query_activedata(failed_tests_query_json)
+		except Exception as e:
+			# Not kept so that the query is retried the next time
+			log.info("Error running query: " + str(failed_tests_query_json))
+			return []
+
+		self.failed_tests[key] = failed_tests
+		return failed_tests
+
+	def fetch_changeset(self, changeset, repo, get_new_files=True):
+		try:
+			self.get_files_modified(changeset, repo)
+			if get_new_files:
+				self.get_new_files(changeset, repo)
+		except Exception as e:
+			# Not kept so that it's fetched again when it's needed
+			log.info("Error prefetching changeset %s: %s" % (changeset, str(e)))
+
+	def prefetch(self, entries, get_new_files=True, concurrency=HG_CONCURRENCY):
+		# `entries` is a list of (changeset, repo) tuples.
+		entries = sorted(set(entries))
+		log.info("Prefetching %s changesets..." % str(len(entries)))
+		with ThreadPoolExecutor(max_workers=concurrency) as executor:
+			list(executor.map(
+				lambda entry: self.fetch_changeset(*entry, get_new_files=get_new_files),
+				entries
+			))
+
+		# The failed tests are queried concurrently
+		entries = [
+			(changeset, repo) for changeset, repo in entries
+			if changeset + ':' + repo not in self.failed_tests
+		]
+		log.info("Prefetching the failed tests of %s changesets..." % str(len(entries)))
+		all_failed_tests = query_many(
+			[self.get_failed_tests_query(changeset, repo) for changeset, repo in entries],
+			return_exceptions=True
+		)
+		for (changeset, repo), failed_tests in zip(entries, all_failed_tests):
+			if isinstance(failed_tests, Exception):
+				# Not kept so that the query is retried the next time
+				log.info("Error querying the failed tests of %s: %s" % (changeset, str(failed_tests)))
+				continue
+			self.failed_tests[changeset + ':' + repo] = failed_tests
+
+
+def restore_fbc_state(records):
+	'''
+		Rebuilds the state of `evaluate_fbc_entries` from the
+		records of its checkpoint journal. The entries processed
+		are kept as {(changeset, repo, orig_test_fixed): count}
+		since the entries are queried again when resuming, and
+		they can come in a different order.
+	'''
+	state = {
+		'tests_for_changeset': {},
+		'changesets_counts': {},
+		'changesets_removed': {},
+		'all_changesets': [],
+		'num_guaranteed': 0,
+		'processed': {}
+	}
+	for record in records:
+		entry = tuple(record['entry'])
+		state['processed'][entry] = state['processed'].get(entry, 0) + 1
+		if 'removed' in record:
+			changeset, orig_files_modified = record['removed']
+			state['changesets_removed'][changeset] = {
+				'support/test files modified': orig_files_modified
+			}
+		if 'guaranteed' in record:
+			state['num_guaranteed'] += 1
+		if 'result' in record:
+			changeset_name, entry = record['result']
+			changeset, cset_count = changeset_name.rsplit('_', 1)
+			state['tests_for_changeset'][changeset_name] = entry
+			state['changesets_counts'][changeset] = max(
+				int(cset_count), state['changesets_counts'].get(changeset, 0)
+			)
+		if 'analyzed' in record:
+			state['all_changesets'].append(record['analyzed'])
+	return state
+
+
+def get_checkpoint_key(settings):
+	# Settings which can change without invalidating a checkpoint
+	ignored = (
+		'numpatches', 'runname', 'outputdir', 'cache_dir',
+		'output_format', 'output_compression',
+		'fbc_window_days', 'fbc_concurrency'
+	)
+	return json.dumps(
+		{setting: value for setting, value in settings.items() if setting not in ignored},
+		sort_keys=True, default=str
+	)
+
+
+def evaluate_fbc_entries(settings, changesets, jsondatalist, tests_with_no_data,
+						 changeset_info, name_table, all_failed_ptc_tests=None,
+						 journal=None, state=None):
+	'''
+		Checks if the tests fixed in each FBC entry would have been
+		scheduled with the per-test coverage data. Returns a dict with
+		the `tests_for_changeset` breakdown, the `changesets_removed`,
+		all the changesets analyzed, and the number of guaranteed ones.
+
+		Each entry processed is recorded in `journal` (a CheckpointJournal)
+		if one is given, and a `state` from `restore_fbc_state` can be given
+		to skip the entries that were already processed.
+	'''
+	runname = settings['runname']
+	all_failed_ptc_tests = all_failed_ptc_tests or []
+	state = state or restore_fbc_state([])
+
+	tests_for_changeset = state['tests_for_changeset']
+	changesets_counts = state['changesets_counts']
+	changesets_removed = state['changesets_removed']
+	all_changesets = state['all_changesets']
+	num_guaranteed = state['num_guaranteed']
+	processed = dict(state['processed'])
+	if processed:
+		log.info(
+			"Resuming with %s entries processed and %s changesets analyzed." %
+			(str(sum(processed.values())), str(len(all_changesets)))
+		)
+
+	# What changed with the current entry, it's added
+	# to the journal once the entry is processed.
+	record = None
+
+	candidates = get_candidate_entries(settings, changesets, tests_with_no_data, name_table)
+	for count, changeset, suite, repo, orig_test_fixed, test_fixed in candidates:
+		entry = (changeset, repo, orig_test_fixed)
+		if processed.get(entry, 0) > 0:
+			processed[entry] -= 1
+			continue
+		if journal is not None and record is not None:
+			journal.append(record)
+			record = None
+		if len(all_changesets) >= settings['numpatches']:
+			break
+		record = {'entry': list(entry)}
 
 		log.info("")
 		log.info("On changeset " + "(" + str(count) + "): " + changeset)
@@ -232,17 +388,18 @@ def run(args=None, config=None):
 		log.info("Test name: %s" % test_fixed)
 
 		# Get patch
-		currhg_analysisbranch = hg_analysisbranch[repo]
-		files_url = HG_URL + currhg_analysisbranch + "/json-info/" + changeset
-		data = get_http_json(files_url)
-		files_modified = data[changeset]['files']
+		currhg_analysisbranch = settings['hg_analysisbranch'][repo]
+		files_modified = changeset_info.get_files_modified(changeset, repo)
 		orig_files_modified = files_modified.copy()
 
 		# Filter modified files to only exclude all test or test helper files
-		if not analyze_all:
+		if not settings['analyze_all']:
 			support_files = []
-			if mozcentral_path:
-				support_files = find_support_files_modified(files_modified, test_fixed, mozcentral_path)
+			if settings['mozcentral_path']:
+				support_files = find_support_files_modified(
+					files_modified, test_fixed, settings['mozcentral_path'],
+					cache_dir=settings['cache_dir']
+				)
 				log.info("Support-files found in files modified: " + str(support_files))
 
 			files_modified = list(set(files_modified) - set(support_files))
@@ -252,16 +409,17 @@ def run(args=None, config=None):
 			]
 
 			# We don't have coverage on new files
-			new, _, _ = find_files_in_changeset(changeset, repo)
-			new = [n.lstrip('/') for n in new]
+			new = changeset_info.get_new_files(changeset, repo)
 			files_modified = list(set(files_modified) - set(new))
 
 			if len(files_modified) == 0:
 				changesets_removed[changeset] = {}
 				changesets_removed[changeset]['support/test files modified'] = orig_files_modified
+				record['removed'] = [changeset, orig_files_modified]
 				log.info("No files modified after filtering test-only or support files.")
-				if include_guaranteed:
+				if settings['include_guaranteed']:
 					num_guaranteed += 1
+					record['guaranteed'] = 1
 
 					cset_count = 1
 					if changeset not in changesets_counts:
@@ -276,7 +434,7 @@ def run(args=None, config=None):
 						'numfiles': len(orig_files_modified),
 						'numtests': 1,
 						'numtestsfailed': 1,
-						'numtestsnotrun': len(all_tests_not_run),
+						'numtestsnotrun': 0,
 						'reasons_not_run': '',
 						'files_modified': orig_files_modified,
 						'suite': suite,
@@ -285,6 +443,7 @@ def run(args=None, config=None):
 						'test-related': test_fixed,
 						'testsnotrun': [],
 					}
+					record['result'] = [changeset_name, tests_for_changeset[changeset_name]]
 				continue
 
 			files_modified = [
@@ -297,19 +456,12 @@ def run(args=None, config=None):
 				continue
 
 		# Get tests that use this patch
-		failed_tests_query_json['where']['and'][0] = {"eq": {"repo.changeset.id12": changeset}}
-		failed_tests_query_json['where']['and'][1] = {"eq": {"repo.branch.name": repo}}
+		failed_tests = changeset_info.get_failed_tests(changeset, repo)
 
 		all_tests = []
-		failed_tests = []
-		try:
-			failed_tests = query_activedata(failed_tests_query_json)
-		except Exception as e:
-			log.info("Error running query: " + str(failed_tests_query_json))
-
-		if use_active_data:
+		if settings['use_active_data']:
 			try:
-				all_tests = get_coverage_tests(tc_tasks_rev_n_branch, get_files=files_modified)
+				all_tests = get_coverage_tests(settings['tc_tasks_rev_n_branch'], get_files=files_modified)
 			except Exception as e:
 				log.info("Error getting coverage from active data...")
 				log.info(str(e))
@@ -365,7 +517,7 @@ def run(args=None, config=None):
 			'testsnotrun': all_tests_not_run,
 		}
 
-		if use_active_data:
+		if settings['use_active_data']:
 			for test in all_tests_not_run:
 				if test in all_failed_ptc_tests:
 					tests_for_changeset[changeset_name]['reasons_not_run'] = 'failed_test'
@@ -374,8 +526,8 @@ def run(args=None, config=None):
 		log.info("Reason not run (if any): " + tests_for_changeset[changeset_name]['reasons_not_run'])
 
 		all_changesets.append(changeset)
-		histogram1_datalist.append((1, 1-len(all_tests_not_run), changeset))
-		count_changesets_processed += 1
+		record['result'] = [changeset_name, tests_for_changeset[changeset_name]]
+		record['analyzed'] = changeset
 
 		numchangesets = len(all_changesets) + num_guaranteed
 		total_correct = sum([
@@ -384,17 +536,23 @@ def run(args=None, config=None):
 		]) + num_guaranteed
 		log.info("Running success rate = {:3.2f}%".format(float((100 * (total_correct/numchangesets)))))
 
+	if journal is not None and record is not None:
+		journal.append(record)
+
 	log.info("")
 
-	## Save results (number, and all tests scheduled)
-	if outputdir:
-		log.info("\nSaving results to output directory: " + outputdir)
-		timestr = str(int(time.time()))
-		save_json(tests_for_changeset, outputdir, timestr + '_per_changeset_breakdown.json')
-		save_json(changesets_removed, outputdir, timestr + '_changesets_with_only_test_or_support_files.json')
+	return {
+		'tests_for_changeset': tests_for_changeset,
+		'changesets_removed': changesets_removed,
+		'all_changesets': all_changesets,
+		'num_guaranteed': num_guaranteed
+	}
 
-	# Plot a second bar on top
-	f = plt.figure()
+
+def summarize_fbc_results(results):
+	tests_for_changeset = results['tests_for_changeset']
+	all_changesets = results['all_changesets']
+	num_guaranteed = results['num_guaranteed']
 
 	numchangesets = len(all_changesets) + num_guaranteed
 	total_correct = sum([
@@ -410,10 +568,41 @@ def run(args=None, config=None):
 			for cset in all_changesets
 	])
 
+	return {
+		'numchangesets': numchangesets,
+		'num_guaranteed': num_guaranteed,
+		'total_correct': total_correct,
+		'total_no_coverage_data': total_no_coverage_data,
+		'total_no_coverage_link': total_no_coverage_link,
+		'success_rate': 100 * (total_correct/numchangesets) if numchangesets else 0
+	}
+
+
+def save_fbc_results(results, outputdir, prefix, output_format='json', compression=None):
+	log.info("\nSaving results to output directory: " + outputdir)
+	save_results(
+		results['tests_for_changeset'], outputdir, prefix + '_per_changeset_breakdown.json',
+		output_format=output_format, compression=compression
+	)
+	save_results(
+		results['changesets_removed'], outputdir,
+		prefix + '_changesets_with_only_test_or_support_files.json',
+		output_format=output_format, compression=compression
+	)
+
+
+def plot_fbc_summary(summary):
+	plt = get_pyplot()
+	numchangesets = summary['numchangesets']
+
+	# Plot a second bar on top
+	f = plt.figure()
+
 	b2 = plt.pie(
 		[
-			100 * (total_correct/numchangesets),
-			100 * (total_no_coverage_data/numchangesets) + 100 * (total_no_coverage_link/numchangesets)
+			100 * (summary['total_correct']/numchangesets),
+			100 * (summary['total_no_coverage_data']/numchangesets) +
+			100 * (summary['total_no_coverage_link']/numchangesets)
 		],
 		colors=['green', 'red'],
 		labels=[
@@ -429,9 +618,9 @@ def run(args=None, config=None):
 
 	b2 = plt.pie(
 		[
-			100 * (total_correct/numchangesets),
-			100 * (total_no_coverage_data/numchangesets),
-			100 * (total_no_coverage_link/numchangesets)
+			100 * (summary['total_correct']/numchangesets),
+			100 * (summary['total_no_coverage_data']/numchangesets),
+			100 * (summary['total_no_coverage_link']/numchangesets)
 		],
 		colors=['green', 'red', 'orange'],
 		labels=[
@@ -444,11 +633,110 @@ def run(args=None, config=None):
 
 	plt.legend()
 
+
+def run(args=None, config=None):
+	"""
+		Expects a `config` with the settings found in
+		pertestcoverage/configs/config_fixed_by_commit_rawdata.yml
+
+		Throws errors if something is missing, all the settings
+		are listed at the top of the script.
+
+		The progress is checkpointed to a journal (`checkpoint` in the
+		config, or a file in `outputdir`) every `checkpoint_interval`
+		entries, and `--resume` (or `resume: True`) continues a run
+		from its journal instead of starting over.
+	"""
+	resume = False
+	checkpoint = None
+	if args:
+		parser = AnalysisParser('config', 'checkpoint')
+		args = parser.parse_analysis_args(args)
+		config = args.config
+		resume = args.resume
+		checkpoint = args.checkpoint
+	if not config:
+		raise Exception("Missing `config` dict argument.")
+
+	settings = get_fbc_settings(config)
+	outputdir = settings['outputdir']
+	resume = resume or (config['resume'] if 'resume' in config else False)
+	checkpoint = checkpoint or (config['checkpoint'] if 'checkpoint' in config else None)
+	checkpoint_interval = config['checkpoint_interval'] if 'checkpoint_interval' in config else 10
+	if not checkpoint and outputdir:
+		checkpoint = os.path.join(outputdir, 'fixed_by_commit_rawdata_checkpoint.ndjson')
+	runname = settings['runname']
+	name_table = get_test_name_table(cache_dir=settings['cache_dir'])
+
+	timestr = str(int(time.time()))
+
+	changesets = load_fbc_entries(settings)
+	name_table.add_entries(changesets)
+
+	jsondatalist = []
+	if not settings['use_active_data']:
+		jsondatalist = get_all_rawdata(settings['pertest_rawdata_folders'])
+
+	all_failed_ptc_tests = []
+	if settings['use_active_data']:
+		all_failed_ptc_tests = get_coverage_tests(settings['tc_tasks_rev_n_branch'], get_failed=True)
+
+	# Remove tests with no data
+	tmp_tests = get_fixed_test_matchers(changesets, name_table)
+	tests_with_no_data = find_tests_with_no_data(settings, tmp_tests, jsondatalist)
+
+	log.info("Number of tests with no data: %s" % str(len(tests_with_no_data)))
+	log.info("Number of tests in total: %s" % str(len(tmp_tests)))
+
+	if outputdir:
+		save_json(
+			{
+				'testswithnodata': fix_names(changesets, tests_with_no_data, name_table=name_table),
+				'orig_testswithnodata': tests_with_no_data,
+				'alltests-matchers': tmp_tests,
+			},
+			outputdir,
+			timestr + '_test_matching_info.json'
+		)
+
+	journal = None
+	state = None
+	if checkpoint:
+		journal = CheckpointJournal(
+			checkpoint, key=get_checkpoint_key(settings), interval=checkpoint_interval
+		)
+		state = restore_fbc_state(journal.start(resume=resume))
+		log.info("Checkpointing progress to %s" % checkpoint)
+
+	try:
+		results = evaluate_fbc_entries(
+			settings, changesets, jsondatalist, tests_with_no_data,
+			ChangesetInfo(settings['hg_analysisbranch']), name_table,
+			all_failed_ptc_tests=all_failed_ptc_tests,
+			journal=journal, state=state
+		)
+	finally:
+		if journal is not None:
+			journal.close()
+	all_changesets = results['all_changesets']
+
+	## Save results (number, and all tests scheduled)
+	if outputdir:
+		save_fbc_results(
+			results, outputdir, str(int(time.time())),
+			output_format=settings['output_format'],
+			compression=settings['output_compression']
+		)
+
+	name_table.save()
+
+	summary = summarize_fbc_results(results)
+	plot_fbc_summary(summary)
+
 	log.info("Completed analysis for run: %s" % str(runname))
 
-	log.info("Total number of changesets in pie chart: " + str(numchangesets))
+	log.info("Total number of changesets in pie chart: " + str(summary['numchangesets']))
 
 	log.info("Close figures to end analysis.")
 	log.info("Changesets analyzed (use these in other analysis types if possible): \n" + str(all_changesets))
-	plt.show()
-
+	show_figures('fixed_by_commit_analysis_rawdata', outputdir=outputdir)
@@ -0,0 +1,251 @@
+import itertools
+import json
+import logging
+import multiprocessing
+import time
+
+from ..cli import AnalysisParser
+
+from .fixed_by_commit_analysis_rawdata import (
+	ChangesetInfo,
+	evaluate_fbc_entries,
+	find_tests_with_no_data,
+	get_candidate_entries,
+	get_fbc_settings,
+	get_fixed_test_matchers,
+	load_fbc_entries,
+	save_fbc_results,
+	summarize_fbc_results
+)
+from ..utils.coconames import get_test_name_table
+from ..utils.cocoload import (
+	save_json,
+	get_coverage_tests,
+	get_rawdata
+)
+
+log = logging.getLogger('pertestcoverage')
+
+# Settings which change the FBC entries that are loaded
+FBC_ENTRY_SETTINGS = (
+	'use_active_data',
+	'suites_to_analyze',
+	'platforms_to_analyze',
+	'from_date',
+	'to_date',
+	'changesets',
+	'cache_dir'
+)
+
+# Inputs shared by the sweep worker processes
+_sweep_inputs = {}
+
+
+def get_sweep_key(*args):
+	return json.dumps(args, sort_keys=True, default=str)
+
+
+def get_variant_settings(config, variant, count):
+	variant = dict(variant)
+	name = variant.pop('name', 'variant' + str(count))
+	variant_config = dict(config)
+	variant_config.update(variant)
+	if 'runname' not in variant:
+		variant_config['runname'] = name
+	return name, get_fbc_settings(variant_config)
+
+
+def get_entries_key(settings):
+	return get_sweep_key(*[settings[setting] for setting in FBC_ENTRY_SETTINGS])
+
+
+def get_no_data_key(settings):
+	# The tests with no data only depend on the entries and the data used
+	return get_sweep_key(
+		get_entries_key(settings),
+		settings['use_active_data'],
+		None if settings['use_active_data'] else settings['pertest_rawdata_folders']
+	)
+
+
+def get_variant_data(settings, datasets):
+	jsondatalist = []
+	if not settings['use_active_data']:
+		for location_entry in settings['pertest_rawdata_folders']:
+			jsondatalist.extend(datasets[get_sweep_key(location_entry)])
+	return jsondatalist
+
+
+def _init_sweep_worker(sweep_inputs):
+	global _sweep_inputs
+	_sweep_inputs = sweep_inputs
+
+
+def _evaluate_variant(variant_args):
+	name, settings = variant_args
+	changesets = _sweep_inputs['entries'][get_entries_key(settings)]
+	name_table = _sweep_inputs['name_table']
+	jsondatalist = get_variant_data(settings, _sweep_inputs['datasets'])
+	tests_with_no_data = _sweep_inputs['tests_with_no_data'][get_no_data_key(settings)]
+
+	all_failed_ptc_tests = []
+	if settings['use_active_data']:
+		all_failed_ptc_tests = get_coverage_tests(settings['tc_tasks_rev_n_branch'], get_failed=True)
+
+	results = evaluate_fbc_entries(
+		settings, changesets, jsondatalist, tests_with_no_data,
+		_sweep_inputs['changeset_info'], name_table,
+		all_failed_ptc_tests=all_failed_ptc_tests
+	)
+	results['tests_with_no_data'] = tests_with_no_data
+	return name, results
+
+
+def run(args=None, config=None):
+	"""
+		Runs `fixed_by_commit_analysis_rawdata` for each of the `variants`
+		given in the config. The FBC entries, the datasets, the tests with
+		no data, and the changeset information are loaded once and shared
+		by all the variants, which are evaluated in parallel.
+
+		Expects a `config` with the settings of the
+		`fixed_by_commit_analysis_rawdata` analysis and:
+
+			variants:
+				# Each variant overrides some of the settings
+				- name: "default"
+				- name: "analyze-all"
+				  analyze_all: True
+				- name: "with-python-tests"
+				  skip_py: False
+
+			Optional(
+				# Number of processes used to evaluate
+				# the variants, defaults to the number of CPUs.
+				processes: 4
+			)
+
+		A breakdown is saved for each variant along with a summary
+		comparing them in `outputdir`.
+	"""
+	if args:
+		parser = AnalysisParser('config')
+		args = parser.parse_analysis_args(args)
+		config = args.config
+	if not config:
+		raise Exception("Missing `config` dict argument.")
+
+	variants = config['variants'] if 'variants' in config and config['variants'] else [{'name': 'default'}]
+	processes = config['processes'] if 'processes' in config else None
+	base_settings = get_fbc_settings(config)
+	outputdir = base_settings['outputdir']
+	name_table = get_test_name_table(cache_dir=base_settings['cache_dir'])
+
+	all_settings = [
+		get_variant_settings(config, variant, count)
+		for count, variant in enumerate(variants)
+	]
+	names = [name for name, _ in all_settings]
+	if len(set(names)) != len(names):
+		raise Exception("Variant names must be unique: %s" % str(names))
+
+	# Load the FBC entries and the datasets used by all the variants once
+	entries = {}
+	datasets = {}
+	for name, settings in all_settings:
+		entries_key = get_entries_key(settings)
+		if entries_key not in entries:
+			entries[entries_key] = load_fbc_entries(settings)
+			name_table.add_entries(entries[entries_key])
+
+		if settings['use_active_data']:
+			continue
+		for location_entry in settings['pertest_rawdata_folders']:
+			dataset_key = get_sweep_key(location_entry)
+			if dataset_key not in datasets:
+				log.info("Opening data from %s" % location_entry['location'])
+				datasets[dataset_key] = get_rawdata(location_entry)
+
+	# Find the tests with no data once for the variants
+	# that use the same entries and data.
+	tests_with_no_data = {}
+	for name, settings in all_settings:
+		no_data_key = get_no_data_key(settings)
+		if no_data_key not in tests_with_no_data:
+			changesets = entries[get_entries_key(settings)]
+			tests_with_no_data[no_data_key] = find_tests_with_no_data(
+				settings, get_fixed_test_matchers(changesets, name_table),
+				get_variant_data(settings, datasets)
+			)
+
+	# Prefetch the changesets of the first `numpatches` candidates of each
+	# variant, as each entry adds at most one changeset to the analysis.
+	# Variants which skip some of them get the others when they need them.
+	changeset_info = ChangesetInfo(base_settings['hg_analysisbranch'])
+	changesets_needed = set()
+	for name, settings in all_settings:
+		candidates = get_candidate_entries(
+			settings, entries[get_entries_key(settings)],
+			tests_with_no_data[get_no_data_key(settings)], name_table
+		)
+		for _, changeset, _, repo, _, _ in itertools.islice(candidates, settings['numpatches']):
+			changesets_needed.add((changeset, repo))
+	changeset_info.prefetch(
+		changesets_needed,
+		get_new_files=any(not settings['analyze_all'] for _, settings in all_settings)
+	)
+
+	sweep_inputs = {
+		'entries': entries,
+		'datasets': datasets,
+		'changeset_info': changeset_info,
+		'tests_with_no_data': tests_with_no_data,
+		'name_table': name_table
+	}
+
+	log.info("Evaluating %s variants..." % str(len(all_settings)))
+	if processes == 1 or len(all_settings) == 1:
+		_init_sweep_worker(sweep_inputs)
+		all_results = [_evaluate_variant(variant_args) for variant_args in all_settings]
+	else:
+		with multiprocessing.Pool(
+				processes, initializer=_init_sweep_worker, initargs=(sweep_inputs,)
+			) as pool:
+			all_results = pool.map(_evaluate_variant, all_settings, chunksize=1)
+
+	name_table.save()
+
+	timestr = str(int(time.time()))
+	summaries = {}
+	for (name, settings), (_, results) in zip(all_settings, all_results):
+		summaries[name] = summarize_fbc_results(results)
+		summaries[name]['numtestswithnodata'] = len(results['tests_with_no_data'])
+		summaries[name]['settings'] = {
+			setting: value for setting, value in settings.items()
+			if value != base_settings[setting] or setting == 'runname'
+		}
+		if outputdir:
+			save_fbc_results(
+				results, outputdir, timestr + '_' + name,
+				output_format=settings['output_format'],
+				compression=settings['output_compression']
+			)
+
+	log.info("")
+	log.info("%-30s %12s %12s %12s %14s" % (
+		'variant', 'changesets', 'guaranteed', 'no link', 'success rate'
+	))
+	for name in names:
+		summary = summaries[name]
+		log.info("%-30s %12s %12s %12s %13.2f%%" % (
+			name,
+			str(summary['numchangesets']),
+			str(summary['num_guaranteed']),
+			str(summary['total_no_coverage_link']),
+			summary['success_rate']
+		))
+
+	if outputdir:
+		save_json(summaries, outputdir, timestr + '_sweep_summary.json')
+
+	return summaries
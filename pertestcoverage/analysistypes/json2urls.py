@@ -6,8 +6,11 @@ from ..utils.cocoload import (
 	get_per_test_scored_file,
 	get_per_test_file,
 	pattern_find,
-	open_json,
-	save_json
+	file_in_type,
+	open_results,
+	save_json,
+	strip_results_extension,
+	TYPE_RESULTS
 )
 
 URL_PREFIX = 'https://hg.mozilla.org/'
@@ -56,7 +59,9 @@ def json2url(
 		json_data,
 		revision,
 		branch='mozilla-central',
-		sources=None
+		sources=None,
+		differences=False,
+		pertestcoverage_view=False
 	):
 	new_entry = {}
 
@@ -115,14 +120,14 @@ def json2urls(
 
 		for root, _, files in os.walk(data_dir):
 			for file in files:
-				if '.json' not in file:
+				if not file_in_type(file, TYPE_RESULTS):
 					continue
 				if is_file and file not in find_files:
 					continue
 
-				new_fname = os.path.splitext(file)[0] + '_urls.json'
+				new_fname = strip_results_extension(file) + '_urls.json'
 				try:
-					json_data = open_json(root, file)
+					json_data = open_results(root, file)
 
 					if pertestcoverage_view:
 						if not file.startswith('view') or \
@@ -133,7 +138,9 @@ def json2urls(
 						json_data,
 						revision,
 						branch=branch,
-						sources=sources
+						sources=sources,
+						differences=differences,
+						pertestcoverage_view=pertestcoverage_view
 					)
 
 					save_json(new_entry, root, new_fname)
@@ -159,13 +166,15 @@ def run(args):
 			differences: True
 
 		`differences` can be replaced with `pertestcoverage_view` if that's the style of json being given.
+		The JSONs can also be NDJSON files (compressed or not) saved by the analysis types.
 	"""
 	parser = AnalysisParser('config', 'branch', 'rev')
 	args = parser.parse_analysis_args(args)
+	config = dict(args.config)
 	json2urls(
-		args.config['json_locations_list'],
+		config.pop('json_locations_list'),
 		args.rev,
-		**args.config
+		**config
 	)
 
 
@@ -1,14 +1,14 @@
 import os
-import json
 import copy
 
 from ..cli import AnalysisParser
 
 from ..utils.cocoload import (
 	save_json,
-	chrome_mapping_rewrite,
-	query_activedata
+	save_results,
+	chrome_mapping_rewrite
 )
+from ..utils.cocoactivedata import query_many
 from ..utils.cocoanalyze.general_comparison import (
 	compare_coverage_files
 )
@@ -87,6 +87,8 @@ def run(args=None, config=None):
 	level = config['level']
 	merge_line_diffs = config['merge_line_diffs']
 	outputdir = config['outputdir']
+	output_format = config['output_format'] if 'output_format' in config else 'json'
+	output_compression = config['output_compression'] if 'output_compression' in config else None
 
 	jsvm_dirs = config['jsvm_dirs']
 	jsvm_baseline_dirs = config['jsvm_baseline_dirs']
@@ -122,11 +124,14 @@ def run(args=None, config=None):
 		return res
 
 	# Get JSDCOV data
-	coverage_query_json['where']['and'][0]['eq']['task.id'] = jsdcov_taskid
-	jsdcov_data = format_results(query_activedata(coverage_query_json))
+	queries = []
+	for taskid in (jsdcov_taskid, jsdcov_baseline_taskid):
+		coverage_query_json['where']['and'][0]['eq']['task.id'] = taskid
+		queries.append(copy.deepcopy(coverage_query_json))
 
-	coverage_query_json['where']['and'][0]['eq']['task.id'] = jsdcov_baseline_taskid
-	jsdcov_baseline_data = format_results(query_activedata(coverage_query_json))
+	jsdcov_data, jsdcov_baseline_data = [
+		format_results(data) for data in query_many(queries)
+	]
 
 	jsdcov_basecorr_data = correct_ccov_for_baseline(jsdcov_data, jsdcov_baseline_data)
 
@@ -180,12 +185,14 @@ def run(args=None, config=None):
 	)
 
 	# Save before proceeding
-	filen = 'common.json'
-	with open(os.path.join(outputdir, filen), 'w+') as f:
-		json.dump(common_to_both, f, indent=4)
+	save_results(
+		common_to_both, outputdir, 'common.json',
+		output_format=output_format, compression=output_compression
+	)
 
-	filen = 'differences.json'
 	print("Differences: ")
 	print(different_between)
-	with open(os.path.join(outputdir, filen), 'w+') as f:
-		json.dump(different_between, f, indent=4)
+	save_results(
+		different_between, outputdir, 'differences.json',
+		output_format=output_format, compression=output_compression
+	)
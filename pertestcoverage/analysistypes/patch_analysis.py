@@ -1,10 +1,9 @@
 import os
 import time
 import logging
-import numpy as np
-from matplotlib import pyplot as plt
 
 from ..cli import AnalysisParser
+from ..utils.cocoplot import get_pyplot, show_figures
 
 from ..utils.cocoload import (
 	save_json,
@@ -13,17 +12,21 @@ from ..utils.cocoload import (
 	get_changesets,
 	HG_URL
 )
+from ..utils.cocoactivedata import query_many
+from ..utils.cocopush import PushIndex
 
 log = logging.getLogger('pertestcoverage')
 
 
 def moving_average(data, n=3) :
+    import numpy as np
     ret = np.cumsum(data, dtype=float)
     ret[n:] = ret[n:] - ret[:-n]
     return ret[n - 1:] / n
 
 
 def running_mean(x, N):
+    import numpy as np
     out = np.zeros_like(x, dtype=np.float64)
     dim_len = x.shape[0]
     for i in range(dim_len):
@@ -40,6 +43,7 @@ def running_mean(x, N):
 
 
 def plot_histogram(data, x_labels, title, figure=None, **kwargs):
+	plt = get_pyplot()
 	if not figure:
 		f = plt.figure()
 	else:
@@ -76,6 +80,11 @@ def run(args=None, config=None):
 
 			Optional(
 				changesets: ["ah212dDJdai2", ...]
+
+				# Get the changesets from the pushlog (concurrently,
+				# and cached in `cache_dir`) instead of the json-log
+				use_pushlog: True
+				cache_dir: "/home/sparky/.cache/coco-tools/"
 			)
 	"""
 	if args:
@@ -92,6 +101,8 @@ def run(args=None, config=None):
 	platform_prefix = config['platform_prefix']
 	seta_suites = config['seta_suites']
 	changesets = [] if 'changesets' not in config else config['changesets']
+	use_pushlog = config['use_pushlog'] if 'use_pushlog' in config else False
+	cache_dir = config['cache_dir'] if 'cache_dir' in config else None
 
 	outputdir = config['outputdir']
 	analyze_files_with_missing_tests = config['analyze_files_with_missing_tests']
@@ -134,7 +145,10 @@ def run(args=None, config=None):
 
 	# Get all patches
 	if not changesets:
-		changesets = get_changesets(hg_analysisbranch, startrevision, numpatches)
+		changesets = get_changesets(
+			hg_analysisbranch, startrevision, numpatches,
+			use_pushlog=use_pushlog, cache_dir=cache_dir
+		)
 
 	tests_for_changeset = {}
 	tests_per_file = {}
@@ -164,8 +178,7 @@ def run(args=None, config=None):
 				xpcshell_query_json['where']['and'][0]['eq']['source.file.name'] = file
 
 				try:
-					mochi_tests = query_activedata(mochitest_query_json)
-					xpc_tests = query_activedata(xpcshell_query_json)
+					mochi_tests, xpc_tests = query_many([mochitest_query_json, xpcshell_query_json])
 				except Exception as e:
 					log.info("Error running with file: " + file)
 
@@ -191,8 +204,9 @@ def run(args=None, config=None):
 			xpcshell_query_json['where']['and'][0] = in_entry
 
 			try:
-				mochi_tests = [testchunk[0] for testchunk in query_activedata(mochitest_query_json)]
-				xpc_tests = [testchunk[0] for testchunk in query_activedata(xpcshell_query_json)]
+				mochi_data, xpc_data = query_many([mochitest_query_json, xpcshell_query_json])
+				mochi_tests = [testchunk[0] for testchunk in mochi_data]
+				xpc_tests = [testchunk[0] for testchunk in xpc_data]
 			except Exception as e:
 				log.info("Error running query: " + str(mochitest_query_json))
 				log.info("or the query: " + str(xpcshell_query_json))
@@ -233,6 +247,8 @@ def run(args=None, config=None):
 
 
 	## Plot the results
+	plt = get_pyplot()
+
 	all_changesets = [changeset for _, changeset in histogram1_datalist]
 	f, b1 = plot_histogram(
 		data=[numtests for numtests, _ in histogram1_datalist],
@@ -247,7 +263,7 @@ def run(args=None, config=None):
 	plt.legend((b1[0], b2[0]), ('Number of tests', '# Tests per File'))
 
 	log.info("Close figures to compare against SETA if requested.")
-	plt.show()
+	show_figures('patch_analysis', outputdir=outputdir)
 
 	## Check against SETA data
 
@@ -279,40 +295,22 @@ def run(args=None, config=None):
 	seta_numtests_data = query_activedata(seta_query)
 	seta_numtests_dict = {changeset: uniquetests for changeset, totaltests, uniquetests in seta_numtests_data}
 
-	# Format SETA data (expand to all changesets)
-	seta_numtests_expanded = []
-	prev_changeset = None
-	cset_groups = {}
-	cset_group = []
+	# Format SETA data (expand to all changesets), changesets with
+	# SETA data start a new push.
+	push_index = PushIndex(all_changesets, pushheads=seta_numtests_dict)
+	seta_numtests_expanded = [
+		(seta_numtests_dict[push_index.get_push(changeset)], changeset)
+		for changeset in all_changesets
+	]
 
 	for changeset in all_changesets:
-		if prev_changeset:
-			if prev_changeset != changeset and changeset in seta_numtests_dict:
-				# Found a new push, set the new push revision and save cset grouping to
-				# make histogram processing simpler.
-				cset_groups[prev_changeset] = cset_group.copy()
-				cset_group = []
-
-				prev_changeset = changeset
-		else:
-			prev_changeset = changeset
-
-		seta_numtests_expanded.append((seta_numtests_dict[prev_changeset], changeset))
-		cset_group.append(changeset)
-	cset_groups[prev_changeset] = cset_group.copy()
-
-	prev_numtest = None
-	new_histogram_data = []
-	for numtests, changeset in seta_numtests_expanded:
-		# Get changeset grouping
-		total_tests = 0
-		for pushcset, grouping in cset_groups.items():
-			if changeset not in grouping:
-				continue
-			# Get total number of tests scheduled to run through per-test coverage
-			total_tests = len(set.union(*[set(tests_for_changeset[c]['tests']) for c in grouping]))
-			break
-		new_histogram_data.append((total_tests, changeset))
+		push_index.add_tests(changeset, tests_for_changeset[changeset]['tests'])
+
+	# Get total number of tests scheduled to run through per-test coverage
+	new_histogram_data = [
+		(len(push_index.get_tests(changeset)), changeset)
+		for _, changeset in seta_numtests_expanded
+	]
 
 
 	## Plot SETA results
@@ -336,5 +334,5 @@ def run(args=None, config=None):
 
 	log.info("Close figures to end anlysis.")
 	log.info("Changesets analyzed (use these in other analysis types if possible): \n" + str(all_changesets))
-	plt.show()
+	show_figures('patch_analysis', outputdir=outputdir)
 
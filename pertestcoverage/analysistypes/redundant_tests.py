@@ -0,0 +1,92 @@
+import time
+import logging
+
+from ..cli import AnalysisParser
+
+from ..utils.cocoanalyze.redundancy import (
+	find_redundant_tests,
+	get_duplicate_groups
+)
+from ..utils.cocofilter import filter_per_test_tests
+from ..utils.cocoload import (
+	get_all_rawdata,
+	save_json
+)
+
+log = logging.getLogger('pertestcoverage')
+
+
+def run(args=None, config=None):
+	"""
+		Finds tests whose coverage is a subset, or a near-subset,
+		of another test's coverage. These are candidates for
+		deduplication when scheduling.
+
+		Expects a `config` with the following settings:
+
+			outputdir: "C:/tmp/"
+
+			# 1.0 finds strict subsets, lower values find tests
+			# which have at least that fraction of their lines
+			# covered by another test.
+			containment_threshold: 0.95
+
+			pertest_rawdata_folders:
+				- location: "/home/sparky/Documents/tmp/NKACHvgaT0uV-VESWcvVdg/"
+				  type: "pertestreport"
+				  chrome-map: "/home/sparky/Documents/tmp/NKACHvgaT0uV-VESWcvVdg/chrome-map.json"
+
+			Optional(
+				# Maximum number of supersets to keep for each test.
+				max_candidates: 10
+				# Only look at tests matching these patterns.
+				tests: ["browser/", "dom/"]
+			)
+	"""
+	if args:
+		parser = AnalysisParser('config')
+		args = parser.parse_analysis_args(args)
+		config = args.config
+	if not config:
+		raise Exception("Missing `config` dict argument.")
+
+	outputdir = config['outputdir']
+	pertest_rawdata_folders = config['pertest_rawdata_folders']
+	containment_threshold = config['containment_threshold'] if 'containment_threshold' in config else 1.0
+	max_candidates = config['max_candidates'] if 'max_candidates' in config else None
+	test_matchers = config['tests'] if 'tests' in config else None
+
+	jsondatalist = get_all_rawdata(pertest_rawdata_folders)
+	if test_matchers:
+		jsondatalist = filter_per_test_tests(jsondatalist, test_matchers)
+
+	log.info("Searching for redundant tests in %s reports..." % str(len(jsondatalist)))
+	redundant, tests_with_no_coverage = find_redundant_tests(
+		jsondatalist,
+		containment_threshold=containment_threshold,
+		max_candidates=max_candidates
+	)
+	duplicate_groups = get_duplicate_groups(redundant)
+
+	log.info("Number of tests with no coverage: %s" % str(len(tests_with_no_coverage)))
+	log.info("Number of redundant test candidates: %s" % str(len(redundant)))
+	log.info("Number of groups of tests with identical coverage: %s" % str(len(duplicate_groups)))
+
+	if outputdir:
+		log.info("\nSaving results to output directory: " + outputdir)
+		save_json(
+			{
+				'containment_threshold': containment_threshold,
+				'redundant': redundant,
+				'duplicate_groups': duplicate_groups,
+				'tests_with_no_coverage': tests_with_no_coverage,
+			},
+			outputdir,
+			str(int(time.time())) + '_redundant_test_candidates.json'
+		)
+	else:
+		for test, info in redundant.items():
+			log.info(
+				"%s (%s lines) is covered by: %s" %
+				(test, str(info['lines']), str([s['superset'] for s in info['supersets']]))
+			)
@@ -0,0 +1,229 @@
+import json
+import logging
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from ..cli import AnalysisParser
+from ..utils.cocoload import (
+	get_all_rawdata,
+	get_http_json,
+	pattern_find,
+	HG_URL
+)
+
+log = logging.getLogger('pertestcoverage')
+
+
+class CoverageDatasets:
+	'''
+		Keeps the per-test data loaded from `pertest_rawdata_folders`
+		in memory along with the indices needed to answer requests.
+	'''
+	def __init__(self, pertest_rawdata_folders, hg_branch='mozilla-central'):
+		self.pertest_rawdata_folders = pertest_rawdata_folders
+		self.hg_branch = hg_branch
+		self.files_modified = {}
+		self.load()
+
+	def load(self):
+		jsondatalist = get_all_rawdata(self.pertest_rawdata_folders)
+
+		records_per_test = {}
+		tests_per_file = {}
+		for per_test_data in jsondatalist:
+			if 'test' not in per_test_data:
+				continue
+			test = per_test_data['test']
+			if test not in records_per_test:
+				records_per_test[test] = []
+			records_per_test[test].append(per_test_data)
+
+			for source in per_test_data['source_files']:
+				if source not in tests_per_file:
+					tests_per_file[source] = set()
+				tests_per_file[source].add(test)
+
+		self.jsondatalist = jsondatalist
+		self.records_per_test = records_per_test
+		self.tests_per_file = tests_per_file
+		log.info(
+			"Loaded %s reports for %s tests covering %s files." %
+			(len(jsondatalist), len(records_per_test), len(tests_per_file))
+		)
+
+	def get_files_modified(self, changeset, hg_branch=None):
+		hg_branch = hg_branch or self.hg_branch
+		key = (hg_branch, changeset)
+		if key not in self.files_modified:
+			data = get_http_json(HG_URL + hg_branch + "/json-info/" + changeset)
+			self.files_modified[key] = data[changeset]['files']
+		return self.files_modified[key]
+
+	def status(self, query):
+		return {
+			'reports': len(self.jsondatalist),
+			'tests': len(self.records_per_test),
+			'files': len(self.tests_per_file)
+		}
+
+	def schedule(self, query):
+		# Returns the tests that cover the files modified in a changeset
+		# (or in the comma-separated list of `files` that is given).
+		if 'files' in query:
+			changeset = None
+			files_modified = [f for f in query['files'].split(',') if f]
+		elif 'changeset' in query:
+			changeset = query['changeset'][:12]
+			files_modified = self.get_files_modified(changeset, hg_branch=query.get('branch'))
+		else:
+			raise ValueError("Either `changeset` or `files` must be given.")
+
+		tests_per_file = {
+			file: sorted(self.tests_per_file.get(file, []))
+			for file in files_modified
+		}
+		tests = set()
+		for file_tests in tests_per_file.values():
+			tests.update(file_tests)
+
+		return {
+			'changeset': changeset,
+			'files_modified': files_modified,
+			'tests': sorted(tests),
+			'tests_per_file': tests_per_file
+		}
+
+	def view(self, query):
+		# Returns the coverage of all the tests matching `test`,
+		# optionally limited to the sources matching `sources`.
+		if 'test' not in query:
+			raise ValueError("A `test` must be given.")
+		test_files = query['test'].split(',')
+		sources = query['sources'].split(',') if 'sources' in query else None
+
+		view_data = []
+		for test, records in self.records_per_test.items():
+			if not pattern_find(test, test_files):
+				continue
+			for per_test_data in records:
+				view_data.append({
+					'test': test,
+					'suite': per_test_data.get('suite', ''),
+					'location': per_test_data.get('location', ''),
+					'source_files': {
+						sf: coverage
+						for sf, coverage in per_test_data['source_files'].items()
+						if pattern_find(sf, sources)
+					}
+				})
+		return view_data
+
+	def files_with_most_tests(self, query):
+		minimum_tests = int(query.get('minimum_tests', 1))
+		limit = int(query.get('limit', 100))
+
+		counts = [
+			(file, len(tests))
+			for file, tests in self.tests_per_file.items()
+			if len(tests) >= minimum_tests
+		]
+		counts = sorted(counts, key=lambda x: (-x[1], x[0]))[:limit]
+		return [{'file': file, 'numtests': numtests} for file, numtests in counts]
+
+	def reload(self, query):
+		self.files_modified = {}
+		self.load()
+		return self.status(query)
+
+
+ENDPOINTS = {
+	'/status': CoverageDatasets.status,
+	'/schedule': CoverageDatasets.schedule,
+	'/view': CoverageDatasets.view,
+	'/files_with_most_tests': CoverageDatasets.files_with_most_tests,
+	'/reload': CoverageDatasets.reload
+}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+def make_handler(datasets):
+	class CoverageRequestHandler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			url = urlparse(self.path)
+			query = {key: vals[-1] for key, vals in parse_qs(url.query).items()}
+
+			if url.path not in ENDPOINTS:
+				self.send_json(404, {'error': "Unknown endpoint: " + url.path, 'endpoints': sorted(ENDPOINTS)})
+				return
+
+			try:
+				self.send_json(200, ENDPOINTS[url.path](datasets, query))
+			except ValueError as e:
+				self.send_json(400, {'error': str(e)})
+			except Exception as e:
+				log.info("Error while handling %s: %s" % (self.path, str(e)))
+				self.send_json(500, {'error': str(e)})
+
+		def send_json(self, code, data):
+			body = json.dumps(data).encode('utf-8')
+			self.send_response(code)
+			self.send_header('Content-Type', 'application/json')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			log.debug(format % args)
+
+	return CoverageRequestHandler
+
+
+def run(args=None, config=None):
+	"""
+		Loads the datasets once and answers requests over HTTP with JSON.
+		Expects a `config` with the following settings:
+
+			pertest_rawdata_folders:
+				- location: "/home/Username/pertestdata/"
+				  type: "pertestreport"
+				  chrome-map: "/home/Username/pertestdata/chrome-map.json"
+
+			Optional(
+				host: "localhost"
+				port: 8765
+				hg_branch: "mozilla-central"
+			)
+
+		Endpoints (all GET):
+			/status
+			/schedule?changeset=<rev>[&branch=<hg branch>] or /schedule?files=<f1>,<f2>
+			/view?test=<t1>,<t2>[&sources=<s1>,<s2>]
+			/files_with_most_tests[?limit=100&minimum_tests=1]
+			/reload
+	"""
+	if args:
+		parser = AnalysisParser('config')
+		args = parser.parse_analysis_args(args)
+		config = args.config
+	if not config:
+		raise Exception("Missing `config` dict argument.")
+
+	host = config['host'] if 'host' in config else 'localhost'
+	port = config['port'] if 'port' in config else 8765
+	hg_branch = config['hg_branch'] if 'hg_branch' in config else 'mozilla-central'
+
+	datasets = CoverageDatasets(config['pertest_rawdata_folders'], hg_branch=hg_branch)
+
+	server = ThreadingHTTPServer((host, port), make_handler(datasets))
+	log.info("Serving on http://%s:%s/ (Ctrl-C to stop)" % (host, str(port)))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		log.info("Stopping server.")
+	finally:
+		server.server_close()
@@ -0,0 +1,108 @@
+import time
+import logging
+
+from ..cli import AnalysisParser
+
+from ..utils.cocoanalyze.minhash import (
+	MinHashLSH,
+	coverage_tokens
+)
+from ..utils.cocoload import (
+	get_all_rawdata,
+	pattern_find,
+	save_json
+)
+
+log = logging.getLogger('pertestcoverage')
+
+
+def run(args=None, config=None):
+	"""
+		Finds tests with coverage similar to the requested tests using
+		MinHash signatures and an LSH index. If no tests are requested,
+		all tests are grouped by similarity instead.
+
+		Expects a `config` with the following settings:
+
+			outputdir: "C:/tmp/"
+
+			pertest_rawdata_folders:
+				- location: "/home/sparky/Documents/tmp/NKACHvgaT0uV-VESWcvVdg/"
+				  type: "pertestreport"
+				  chrome-map: "/home/sparky/Documents/tmp/NKACHvgaT0uV-VESWcvVdg/chrome-map.json"
+
+			Optional(
+				# Pattern matchers for the tests to find neighbours for.
+				tests: ["about/browser_aboutCertError"]
+				# Minimum estimated jaccard similarity.
+				similarity_threshold: 0.5
+				num_neighbours: 10
+				num_perm: 128
+				bands: 32
+				seed: 1
+			)
+	"""
+	if args:
+		parser = AnalysisParser('config', 'test')
+		args = parser.parse_analysis_args(args)
+		config = args.config
+		if args.test:
+			config['tests'] = [args.test]
+	if not config:
+		raise Exception("Missing `config` dict argument.")
+
+	outputdir = config['outputdir']
+	pertest_rawdata_folders = config['pertest_rawdata_folders']
+	test_matchers = config['tests'] if 'tests' in config else None
+	similarity_threshold = config['similarity_threshold'] if 'similarity_threshold' in config else 0.5
+	num_neighbours = config['num_neighbours'] if 'num_neighbours' in config else 10
+	num_perm = config['num_perm'] if 'num_perm' in config else 128
+	bands = config['bands'] if 'bands' in config else 32
+	seed = config['seed'] if 'seed' in config else 1
+
+	jsondatalist = get_all_rawdata(pertest_rawdata_folders)
+
+	tests_tokens = {}
+	for per_test_data in jsondatalist:
+		if 'test' not in per_test_data:
+			continue
+		test = per_test_data['test']
+		if test not in tests_tokens:
+			tests_tokens[test] = set()
+		tests_tokens[test] |= coverage_tokens(per_test_data['source_files'])
+
+	log.info("Computing MinHash signatures for %s tests..." % str(len(tests_tokens)))
+	lsh = MinHashLSH(num_perm=num_perm, bands=bands, seed=seed)
+	for test, tokens in tests_tokens.items():
+		if not tokens:
+			continue
+		lsh.add_tokens(test, tokens)
+
+	results = {}
+	if test_matchers:
+		for test in lsh.signatures:
+			if not pattern_find(test, test_matchers):
+				continue
+			neighbours = lsh.nearest(
+				test, threshold=similarity_threshold, num_neighbours=num_neighbours
+			)
+			results[test] = [
+				{'test': neighbour, 'similarity': similarity}
+				for neighbour, similarity in neighbours
+			]
+			log.info("Tests similar to %s:" % test)
+			for neighbour, similarity in neighbours:
+				log.info("\t{:1.3f} {}".format(similarity, neighbour))
+		if not results:
+			log.info("Could not find coverage for the tests: %s" % str(test_matchers))
+	else:
+		groups = lsh.get_similar_groups(threshold=similarity_threshold)
+		log.info("Found %s groups of similar tests." % str(len(groups)))
+		results = {
+			'similar-group-' + str(count+1): group
+			for count, group in enumerate(groups)
+		}
+
+	if outputdir:
+		log.info("\nSaving results to output directory: " + outputdir)
+		save_json(results, outputdir, str(int(time.time())) + '_similar_tests.json')
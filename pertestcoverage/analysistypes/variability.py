@@ -8,6 +8,7 @@ from utils.cocoanalyze.analysis_types import (
 	filter_freqs_analysis,
 	filter_ttest_analysis
 )
+from utils.cocoanalyze.variability_pipeline import VariabilityPipeline
 
 
 def parse_variability_args():
@@ -73,11 +74,36 @@ def parse_variability_args():
 			 ' 50000 lines changed. \n' +
 			 'IMPORTANT: This also changes how many source files are saved.'
 	)
+	parser.add_argument(
+		"--use-lsh", action="store_true", default=False,
+		help='Set this to use MinHash/LSH to find the candidates for similar ' +
+			 'sources instead of comparing every pair of sources. Candidates are ' +
+			 'still checked against the `--correlation-threshold`.'
+	)
+	parser.add_argument(
+		"--lsh-num-perm", type=int, default=128,
+		help='Number of permutations used in the MinHash signatures of the sources.'
+	)
+	parser.add_argument(
+		"--lsh-bands", type=int, default=32,
+		help='Number of bands used in the LSH index, `--lsh-num-perm` must be ' +
+			 'divisible by it. More bands yield more candidates.'
+	)
 	parser.add_argument(
 		"--frequency-filter", nargs=2, type=float, default=[0.0, 50000.0],
 		help='Filters out changes in line hit counts that fall outside of the ' +
 			 'two values given here. By default, everything is kept.'
 	)
+	parser.add_argument(
+		"--seed", type=int, default=None,
+		help='Seed used for the random noise added to the time series in ' +
+			 '`--filter-freqs` and `--ttest`. Set it to get reproducible results.'
+	)
+	parser.add_argument(
+		"--cache-dir", type=str, default=None,
+		help='If set, the per-source time series are cached in this directory ' +
+			 'and re-used until the arguments or the reports change.'
+	)
 	parser.add_argument(
 		"--save-all", action="store_true", default=False,
 		help='If set, all differences will be stored, not just differences over time. ' +
@@ -89,19 +115,20 @@ def parse_variability_args():
 def main():
 	# Perform a variability analysis
 	args = parse_variability_args().parse_args()
+	pipeline = VariabilityPipeline(args, seed=args.seed, cache_dir=args.cache_dir)
 
 	if args.differences:
 		print("Running differences analysis.")
-		differences_analysis(args=args)
+		differences_analysis(args=args, pipeline=pipeline)
 	elif args.aggregation_graph:
 		print("Running aggregation graph analysis.")
-		aggregation_graph_analysis(args=args)
+		aggregation_graph_analysis(args=args, pipeline=pipeline)
 	elif args.filter_freqs:
 		print("Running FFT frequency filter.")
-		filter_freqs_analysis(args=args)
+		filter_freqs_analysis(args=args, pipeline=pipeline)
 	elif args.ttest:
 		print("Running T-test Significance Check.")
-		filter_ttest_analysis(args=args)
+		filter_ttest_analysis(args=args, pipeline=pipeline)
 	else:
 		print(
 			"No analysis type was specified. Use --differences or something " +
@@ -4,9 +4,9 @@ import time
 import logging
 
 from ..cli import AnalysisParser
+from ..utils.cocoindex import ReportIndex, get_report_paths
 from ..utils.cocoload import (
 	chrome_mapping_rewrite,
-	file_in_type,
 	get_and_check_config,
 	get_per_test_scored_file,
 	get_per_test_file,
@@ -122,92 +122,121 @@ def view(
 		outputdir='',
 		delay=0,
 		show_total=True,
-		show_src_coverage=True
+		show_src_coverage=True,
+		use_index=True,
+		use_store=False,
+		cache_dir=None
 	):
 
 	# Finds tests and shows the coverage for each of it's files.
+	# With `use_index`, only the reports of the requested tests
+	# are opened (see cocoindex.ReportIndex), and `use_store` reads
+	# them from the consolidated store instead of parsing them again.
 	total_datapoints = 0
 	found_test = False
 	tests_found = []
-	for root, _, files in os.walk(per_test_dir):
-		for file in files:
-			if not file_in_type(file, filetype):
-				continue
-			try:
-				fmtd_test_dict = view_file(
-					root=root,
-					file=file,
-					filetype=filetype,
-					score_range=score_range,
-					scored_file=scored_file,
-					ignore_uniques=ignore_uniques,
-					chrome_map=chrome_map
-				)
-			except Exception as e:
-				log.info("Bad JSON found: " + str(os.path.join(root,file)))
-				log.info("Exception: %s" % str(e))
-				continue
 
-			total_datapoints += 1
+	def load_report(path):
+		root, file = os.path.split(path)
+		return view_file(
+			root=root,
+			file=file,
+			filetype=filetype,
+			score_range=score_range,
+			scored_file=scored_file,
+			ignore_uniques=ignore_uniques,
+			chrome_map=chrome_map
+		)
 
-			test_name = ''
-			suite_name = ''
-			if 'test' in fmtd_test_dict:
-				test_name = fmtd_test_dict['test']
-			if 'suite' in fmtd_test_dict:
-				suite_name = fmtd_test_dict['suite']
-			if 'source_files' not in fmtd_test_dict:
-				fmtd_test_dict = {
-					'source_files': fmtd_test_dict.copy()
-				}
-
-			if test_name:
-				if not pattern_find(test_name, test_files):
-					continue
-				tests_found.append(test_name)
+	report_index = None
+	if use_index:
+		report_index = ReportIndex(
+			per_test_dir, filetype, chrome_map=chrome_map, cache_dir=cache_dir,
+			store_options=[score_range, scored_file, ignore_uniques] if use_store else None
+		)
+		report_index.refresh(load_report)
+		for path, error in report_index.get_bad_reports().items():
+			log.info("Bad JSON found: " + str(path))
+			log.info("Exception: %s" % error)
+
+		total_datapoints = report_index.get_num_reports()
+		report_paths = report_index.find(test_files)
+	else:
+		report_paths = get_report_paths(per_test_dir, filetype)
+
+	for path in report_paths:
+		root, file = os.path.split(path)
+		try:
+			if report_index:
+				fmtd_test_dict = report_index.load(path, load_report)
 			else:
-				log.info("No test names found in data, showing all tests.")
+				fmtd_test_dict = load_report(path)
+		except Exception as e:
+			log.info("Bad JSON found: " + str(os.path.join(root,file)))
+			log.info("Exception: %s" % str(e))
+			continue
 
-			found_test = True
+		if not report_index:
+			total_datapoints += 1
 
-			filt_test_dict = {
-				sf: fmtd_test_dict['source_files'][sf]
-				for sf in fmtd_test_dict['source_files']
-				if pattern_find(sf, sources)
+		test_name = ''
+		suite_name = ''
+		if 'test' in fmtd_test_dict:
+			test_name = fmtd_test_dict['test']
+		if 'suite' in fmtd_test_dict:
+			suite_name = fmtd_test_dict['suite']
+		if 'source_files' not in fmtd_test_dict:
+			fmtd_test_dict = {
+				'source_files': fmtd_test_dict.copy()
 			}
 
-			log.info("--With root: " + root)
-			log.info("--From file: " + file)
-			log.info("Test-name: " + test_name)
-			log.info("Suite: " + suite_name)
-
-			if not filt_test_dict:
-				log.info("Found no source files.")
+		if test_name:
+			if not pattern_find(test_name, test_files):
 				continue
+			tests_found.append(test_name)
+		else:
+			log.info("No test names found in data, showing all tests.")
 
-			if show_src_coverage:
-				log.info(
-					"Coverage: \n" + "\n\n".join(
-						[
-							str(sf) + ": " +
-							str(filt_test_dict[sf]) for sf in filt_test_dict
-						]
-					)
-				)
-			else:
-				log.info("Found coverage for requested files.")
+		found_test = True
 
-			log.info("")
+		filt_test_dict = {
+			sf: fmtd_test_dict['source_files'][sf]
+			for sf in fmtd_test_dict['source_files']
+			if pattern_find(sf, sources)
+		}
 
-			if delay:
-				time.sleep(delay)
+		log.info("--With root: " + root)
+		log.info("--From file: " + file)
+		log.info("Test-name: " + test_name)
+		log.info("Suite: " + suite_name)
 
-			if outputdir:
-				save_json(
-					filt_test_dict,
-					outputdir,
-					'view_' + os.path.splitext(file)[0] + '_' + str(int(time.time())) + '.json'
+		if not filt_test_dict:
+			log.info("Found no source files.")
+			continue
+
+		if show_src_coverage:
+			log.info(
+				"Coverage: \n" + "\n\n".join(
+					[
+						str(sf) + ": " +
+						str(filt_test_dict[sf]) for sf in filt_test_dict
+					]
 				)
+			)
+		else:
+			log.info("Found coverage for requested files.")
+
+		log.info("")
+
+		if delay:
+			time.sleep(delay)
+
+		if outputdir:
+			save_json(
+				filt_test_dict,
+				outputdir,
+				'view_' + os.path.splitext(file)[0] + '_' + str(int(time.time())) + '.json'
+			)
 
 	if not found_test:
 		log.info("Found data, but not the requested tests.")
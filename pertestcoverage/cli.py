@@ -11,6 +11,10 @@ import sys
 import ruamel.yaml as yaml
 from argparse import ArgumentParser
 
+from .utils.cococontext import activate_run_context, deactivate_run_context
+from .utils.cocoplot import set_headless
+from .utils.cocoreplay import start_network, stop_network
+
 here = os.path.abspath(os.path.dirname(__file__))
 
 log = logging.getLogger('pertestcoverage')
@@ -94,6 +98,21 @@ ARGUMENT_GROUPS = {
 		  'type': list,
 		  'help': "Patterns for artifacts to download.",
 		  }],
+	],
+	'checkpoint': [
+		[['--resume'],
+		 {'action': 'store_true',
+		  'default': False,
+		  'dest': 'resume',
+		  'help': "Resume from the checkpoint of a previous run, the entries "
+				  "it already processed are skipped.",
+		  }],
+		[['--checkpoint'],
+		 {'required': False,
+		  'default': None,
+		  'dest': 'checkpoint',
+		  'help': "Checkpoint journal to use (default: a file in the outputdir).",
+		  }],
 	]
 }
 """
@@ -131,6 +150,10 @@ class AnalysisParser(ArgumentParser):
 		else:
 			with open(norm_config_path, 'r') as f:
 				args.config = yaml.safe_load(f)
+
+		# Record or replay the network responses if requested
+		if args.config and 'network' in args.config:
+			start_network(args.config['network'])
 		return args
 
 
@@ -148,6 +171,14 @@ def cli(args=sys.argv[1:]):
 						help="List available analysis types.")
 	parser.add_argument('-v', '--verbose', action='store_true', default=False,
 						help="Print debugging information.")
+	parser.add_argument('--headless', action='store_true', default=False,
+						help="Use a non-interactive plotting backend and save "
+							 "figures to files instead of showing them.")
+	parser.add_argument('--figures-dir', dest='figures_dir', default=None,
+						help="Directory to save figures in when running headless "
+							 "(default: the analysis' outputdir, or the current directory).")
+	parser.add_argument('--no-shared-context', dest='no_shared_context', action='store_true',
+						default=False, help="Don't share loaded data between the analysis types.")
 	args, remainder = parser.parse_known_args(args)
 
 	if args.verbose:
@@ -155,6 +186,9 @@ def cli(args=sys.argv[1:]):
 	else:
 		log.setLevel(logging.INFO)
 
+	if args.headless:
+		set_headless(figures_dir=args.figures_dir)
+
 	all_analysistypes = [
 		os.path.splitext(p)[0] for p in os.listdir(ANALYSISTYPES_DIR)
 		if p.endswith('.py') if p != '__init__.py'
@@ -164,11 +198,22 @@ def cli(args=sys.argv[1:]):
 		log.info('\n'.join(sorted(all_analysistypes)))
 		return
 
-	for analysis in args.analysistypes:
-		if analysis not in all_analysistypes:
-			log.error("analysis '{}' not found!".format(analysis))
-			continue
-		run_analysis(analysis, remainder)
+	# Analysis types run together share the datasets
+	# and the HTTP/ActiveData responses they load.
+	shared_context = len(args.analysistypes) > 1 and not args.no_shared_context
+	if shared_context:
+		activate_run_context()
+
+	try:
+		for analysis in args.analysistypes:
+			if analysis not in all_analysistypes:
+				log.error("analysis '{}' not found!".format(analysis))
+				continue
+			run_analysis(analysis, remainder)
+	finally:
+		if shared_context:
+			deactivate_run_context()
+		stop_network()
 
 
 if __name__ == '__main__':
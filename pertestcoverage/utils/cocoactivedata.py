@@ -0,0 +1,219 @@
+'''
+
+	An asyncio client for ActiveData.
+
+	Queries are sent over asyncio connections, so a query that times
+	out is cancelled along with its socket (instead of being left in a
+	thread). The number of queries running at once is bounded, failed
+	queries are retried with a jittered exponential backoff, and
+	identical queries made while one of them is running share its
+	response.
+
+	`query_many` runs a batch of queries from synchronous code:
+
+		>> mochi_tests, xpc_tests = query_many([mochitest_query, xpcshell_query])
+
+'''
+import asyncio
+import json
+import logging
+import random
+import ssl
+import urllib.parse
+
+from .cococontext import get_run_context
+from .cocoreplay import rewrite_url
+
+log = logging.getLogger('pertestcoverage')
+
+ACTIVE_DATA_QUERY_URL = "http://activedata.allizom.org/query"
+
+# Default settings of the client
+CONCURRENCY = 8
+TIMEOUT = 120
+RETRIES = 3
+BACKOFF = 1
+MAX_BACKOFF = 30
+
+
+async def _read_body(reader, headers):
+	if headers.get('transfer-encoding', '').lower() == 'chunked':
+		chunks = []
+		while True:
+			size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+			if size == 0:
+				# Skip the trailers
+				while (await reader.readline()).strip():
+					pass
+				break
+			chunks.append(await reader.readexactly(size))
+			await reader.readline()
+		return b''.join(chunks)
+	if 'content-length' in headers:
+		return await reader.readexactly(int(headers['content-length']))
+	return await reader.read()
+
+
+async def post_json(url, data):
+	'''
+		Posts `data` as JSON to `url` and returns
+		the status code and the text of the response.
+	'''
+	parsed = urllib.parse.urlsplit(url)
+	https = parsed.scheme == 'https'
+	port = parsed.port or (443 if https else 80)
+	path = parsed.path or '/'
+	if parsed.query:
+		path += '?' + parsed.query
+
+	body = json.dumps(data).encode('utf-8')
+	request = (
+		"POST %s HTTP/1.1\r\n"
+		"Host: %s\r\n"
+		"Content-Type: application/json\r\n"
+		"Content-Length: %s\r\n"
+		"Accept-Encoding: identity\r\n"
+		"Connection: close\r\n\r\n" % (path, parsed.netloc, str(len(body)))
+	).encode('latin-1') + body
+
+	reader, writer = await asyncio.open_connection(
+		parsed.hostname, port, ssl=ssl.create_default_context() if https else None
+	)
+	try:
+		writer.write(request)
+		await writer.drain()
+
+		status_line = await reader.readline()
+		if not status_line:
+			raise Exception("No response from %s" % url)
+		status = int(status_line.split()[1])
+
+		headers = {}
+		while True:
+			line = (await reader.readline()).decode('latin-1').strip()
+			if not line:
+				break
+			name, _, value = line.partition(':')
+			headers[name.strip().lower()] = value.strip()
+
+		text = (await _read_body(reader, headers)).decode('utf8')
+	finally:
+		writer.close()
+	return status, text
+
+
+class ActiveDataClient:
+	def __init__(self, url=None, concurrency=CONCURRENCY, timeout=TIMEOUT,
+				 retries=RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+		self.url = url or ACTIVE_DATA_QUERY_URL
+		self.concurrency = concurrency
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self._in_flight = {}
+		self._semaphore = None
+
+	def _get_key(self, query_json):
+		return json.dumps(query_json, sort_keys=True)
+
+	def _get_delay(self, attempt):
+		# Full jitter, so that failed queries don't all retry at once
+		return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+	async def _query(self, query_json):
+		if self._semaphore is None:
+			self._semaphore = asyncio.Semaphore(self.concurrency)
+
+		attempt = 0
+		while True:
+			try:
+				async with self._semaphore:
+					log.debug("Querying Active-data with: " + str(query_json))
+					status, text = await asyncio.wait_for(
+						post_json(rewrite_url(self.url), query_json), self.timeout
+					)
+				log.debug("Status:" + str(status))
+				if status >= 500 or status == 429:
+					raise Exception("ActiveData returned status %s" % str(status))
+				if status >= 400:
+					# Retrying a bad query won't help
+					raise ValueError("ActiveData returned status %s: %s" % (str(status), text[:200]))
+				return text.replace("'", '"')
+			except ValueError:
+				raise
+			except Exception as e:
+				if attempt >= self.retries:
+					raise
+				delay = self._get_delay(attempt)
+				attempt += 1
+				log.info("Error encountered while querying ActiveData...retrying...('-v' to see the error)")
+				log.debug("Error: %s, retrying in %.1f seconds" % (str(e) or type(e).__name__, delay))
+				await asyncio.sleep(delay)
+
+	async def query_text(self, query_json):
+		'''
+			Returns the text of the response to the query, identical
+			queries that are already running share their response.
+		'''
+		key = self._get_key(query_json)
+		if key not in self._in_flight:
+			# Copied so that callers can change their query after this
+			query_json = json.loads(key)
+			self._in_flight[key] = asyncio.ensure_future(self._query(query_json))
+			self._in_flight[key].add_done_callback(lambda _: self._in_flight.pop(key, None))
+		return await asyncio.shield(self._in_flight[key])
+
+	async def query(self, query_json):
+		return json.loads(await self.query_text(query_json))['data']
+
+	async def query_all(self, queries, return_exceptions=False):
+		return await asyncio.gather(
+			*[self.query(query_json) for query_json in queries],
+			return_exceptions=return_exceptions
+		)
+
+
+def query_many(queries, active_data_url=None, return_exceptions=False, **kwargs):
+	'''
+		Runs the queries concurrently and returns the `data` of their
+		responses, in the same order. With `return_exceptions`, the
+		exceptions of the failed queries are returned in place of their
+		data instead of being raised. Other keyword arguments are used
+		to create the ActiveDataClient.
+
+		The responses are kept in the run context, when there is one,
+		along with those of `cocoload.query_activedata`.
+	'''
+	client = ActiveDataClient(url=active_data_url, **kwargs)
+	context = get_run_context()
+
+	results = [None] * len(queries)
+	to_query = []
+	for count, query_json in enumerate(queries):
+		response = None
+		if context is not None:
+			response = context.get_cached_response('activedata', client.url, query_json)
+		if response is None:
+			to_query.append(count)
+		else:
+			results[count] = json.loads(response)['data']
+
+	async def run_query(count):
+		response = await client.query_text(queries[count])
+		results[count] = json.loads(response)['data']
+		if context is not None:
+			context.set_cached_response(response, 'activedata', client.url, queries[count])
+
+	async def run_queries():
+		return await asyncio.gather(
+			*[run_query(count) for count in to_query],
+			return_exceptions=return_exceptions
+		)
+
+	if to_query:
+		for count, error in zip(to_query, asyncio.run(run_queries())):
+			if isinstance(error, BaseException):
+				results[count] = error
+
+	return results
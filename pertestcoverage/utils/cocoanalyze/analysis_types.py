@@ -1,28 +1,25 @@
 import os
 import sys
 import time
-import copy
-import numpy as np
 import json
-from matplotlib import pyplot as plt
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from cocoload import get_all_jsons, save_json, format_to_level
+from cocoload import pattern_find, save_json
+from cocoplot import get_pyplot, show_figures
 from cocoanalyze.general_comparison import (
-	aggregate_reports,
+	IncrementalAggregator,
 	format_per_test_list,
 	get_common_and_different
 )
+from cocoanalyze.minhash import MinHashLSH, timeseries_tokens
+from cocoanalyze.variability_pipeline import VariabilityPipeline, load_filtered_data
 
 from cocofilter import (
 	filter_file_variability,
 	filter_freqs,
 	filter_per_test_sources,
-	filter_per_test_all,
 	filter_ttest,
-	get_total_lines_hit_in_test,
-	group_tests,
-	split_file_types
+	get_total_lines_hit_in_test
 )
 
 
@@ -37,13 +34,108 @@ def check_args_and_get_data(args=None):
 		return None
 	args = wrap_args(args)
 
-	json_data = get_all_jsons(args)
-	filtered_json_data = filter_per_test_all(json_data, args.tests, args.sources, args.line_range)
+	return load_filtered_data(args)
 
-	if args.split_types:
-		filtered_json_data = split_file_types(filtered_json_data)
 
-	return filtered_json_data
+def get_pipeline(args, filt_and_split_data=None, pipeline=None):
+	# All the analyses can share the same pipeline so that
+	# the data is only loaded, grouped, and filtered once.
+	if pipeline is None:
+		pipeline = VariabilityPipeline(
+			args,
+			filt_and_split_data=filt_and_split_data,
+			seed=args.seed,
+			cache_dir=args.cache_dir
+		)
+	return pipeline
+
+
+def get_source_coverage_index(json_data, sources):
+	# Maps each source to the coverage it has in
+	# each test (in the order of the tests).
+	coverage_index = {source: [] for source in sources}
+	for per_test_data in json_data:
+		for src, coverage in per_test_data['source_files'].items():
+			if src in coverage_index:
+				coverage_index[src].append(coverage)
+	return coverage_index
+
+
+def get_lsh_candidate_pairs(lsh):
+	# Returns all pairs of keys (smallest first) that
+	# share a bucket in the given LSH index.
+	candidate_pairs = set()
+	for band_buckets in lsh.buckets:
+		for keys in band_buckets.values():
+			if len(keys) <= 1:
+				continue
+			for i, key1 in enumerate(keys):
+				for key2 in keys[i+1:]:
+					candidate_pairs.add((min(key1, key2), max(key1, key2)))
+	return candidate_pairs
+
+
+def cluster_similar_series(matrix, threshold, candidate_pairs=None, max_block_elements=10000000):
+	'''
+		Groups the rows of a (series x samples) matrix which have an L1
+		distance below `threshold` from each other. Groups are the connected
+		components of the "is similar to" graph, and only groups with more
+		than one series are returned. Each group is a sorted list of row indices.
+
+		If `candidate_pairs` is given, only those pairs of rows are compared.
+	'''
+	import numpy as np
+
+	num_series = len(matrix)
+	if num_series == 0:
+		return []
+	parents = list(range(num_series))
+
+	def find(ind):
+		root = ind
+		while parents[root] != root:
+			root = parents[root]
+		while parents[ind] != root:
+			parents[ind], ind = root, parents[ind]
+		return root
+
+	def union(ind1, ind2):
+		root1, root2 = find(ind1), find(ind2)
+		if root1 != root2:
+			parents[max(root1, root2)] = min(root1, root2)
+
+	if candidate_pairs is None:
+		# Compare blocks of rows against all the rows after
+		# them to bound the memory used by the distance matrix.
+		num_samples = max(1, matrix.shape[1])
+		rows_per_block = max(1, int(max_block_elements / (num_series * num_samples + 1)))
+		for start in range(0, num_series, rows_per_block):
+			block = matrix[start:start+rows_per_block]
+			distances = np.abs(block[:, None, :] - matrix[None, start:, :]).sum(axis=2)
+			rows, cols = np.nonzero(distances < threshold)
+			for row, col in zip(rows + start, cols + start):
+				if row < col:
+					union(row, col)
+	elif candidate_pairs:
+		pairs = np.asarray(sorted(candidate_pairs))
+		max_pairs = max(1, int(max_block_elements / max(1, matrix.shape[1])))
+		for start in range(0, len(pairs), max_pairs):
+			chunk = pairs[start:start+max_pairs]
+			distances = np.abs(matrix[chunk[:, 0]] - matrix[chunk[:, 1]]).sum(axis=1)
+			for row, col in chunk[distances < threshold]:
+				union(row, col)
+
+	groups = {}
+	for ind in range(num_series):
+		root = find(ind)
+		if root not in groups:
+			groups[root] = []
+		groups[root].append(ind)
+
+	return [
+		group for _, group in sorted(groups.items())
+		if len(group) > 1
+	]
 
 
 def get_and_plot_differences(json_data, test='', plot_total_lines=True, args=None, show_stability=False):
@@ -51,12 +143,17 @@ def get_and_plot_differences(json_data, test='', plot_total_lines=True, args=Non
 		return None
 	args = wrap_args(args)
 
+	import numpy as np
+	plt = get_pyplot()
+
 	variability_threshold = args.variability_threshold
 	correlation_threshold = args.correlation_threshold
 
-	# Here we need to remove all file level variability
-	print("Removing file variability.")
-	json_data = filter_file_variability(json_data)
+	# Here we need to remove all file level variability, aggregated
+	# reports already contain all the files seen in any step.
+	if not isinstance(json_data, IncrementalAggregator):
+		print("Removing file variability.")
+		json_data = filter_file_variability(json_data)
 	inds = np.arange(len(json_data))
 
 	## Plot all lines hit across all files (global) ##
@@ -151,6 +248,7 @@ def get_and_plot_differences(json_data, test='', plot_total_lines=True, args=Non
 			  "the variability-threshold.")
 
 	# Normalize
+	source_order = {s: i for i, s in enumerate(filt_sources_to_plot)}
 	normed_data = {}
 	for s in filt_sources_to_plot:
 		coverage = filt_sources_to_plot[s]
@@ -168,76 +266,77 @@ def get_and_plot_differences(json_data, test='', plot_total_lines=True, args=Non
 		]
 		normed_data[s] = new_coverage
 
+	# Only sources that change over time can be grouped.
+	source_names = [
+		s for s in normed_data
+		if max(normed_data[s]) - min(normed_data[s]) != 0
+	]
+	normed_matrix = np.asarray([normed_data[s] for s in source_names], dtype=float)
+
+	# Use an LSH index to find the candidates for similar
+	# sources instead of comparing every pair of sources.
+	candidate_pairs = None
+	if args.use_lsh:
+		lsh = MinHashLSH(num_perm=args.lsh_num_perm, bands=args.lsh_bands)
+		for ind, s in enumerate(source_names):
+			lsh.add_tokens(ind, timeseries_tokens(normed_data[s]))
+		candidate_pairs = get_lsh_candidate_pairs(lsh)
+
 	# Compare
-	data_to_save = {}
-	for count, s1 in enumerate(normed_data):
-		curr_cov = normed_data[s1]
-		if max(curr_cov) - min(curr_cov) == 0:
-			continue
-
-		found_it = False
-		for grouping in data_to_save:
-			if s1 in data_to_save[grouping]['sources'].keys():
-				found_it = True
-		if found_it:
-			continue
-
-		similar_sources = []
-		sim_sources_names = []
-		sim_sources_names.append(s1)
-		similar_sources.append(curr_cov)
-		for s2 in normed_data:
-			if max(normed_data[s2]) - min(normed_data[s1]) == 0:
-				continue
+	groups = cluster_similar_series(
+		normed_matrix, correlation_threshold, candidate_pairs=candidate_pairs
+	)
 
-			if s2 == s1:
-				continue
-			differences = sum(abs(np.asarray(normed_data[s1]) - np.asarray(normed_data[s2])))
-			if differences < correlation_threshold:
-				similar_sources.append(normed_data[s2])
-				sim_sources_names.append(s2)
-		if len(similar_sources) <= 1:
-			continue
+	covered_of_src = get_source_coverage_index(json_data, source_names)
+
+	data_to_save = {}
+	for group in groups:
+		sim_sources_names = [source_names[ind] for ind in group]
+		similar_sources = normed_matrix[group]
 
 		plt.figure()
-		t = [
+		for s in similar_sources:
 			plt.plot(s, color='silver')
-			for s in similar_sources
-		]
-		print(np.mean(np.asarray(similar_sources), axis=0))
-		plt.plot(list(np.mean(np.asarray(similar_sources), axis=0)), color='blue')
-
-		print("Sources:\n" + str([s for s in sim_sources_names]))
-
-		#plt.show()
+		mean_similar = np.mean(similar_sources, axis=0)
+		print(mean_similar)
+		plt.plot(list(mean_similar), color='blue')
 
-		def get_covered_of_src(name):
-			all_coverage = []
-			for per_test_data in json_data:
-				for src in per_test_data['source_files']:
-					if src == name:
-						all_coverage.append(per_test_data['source_files'][src])
-			return all_coverage
+		print("Sources:\n" + str(sim_sources_names))
 
-		grouping = 'similar-group-' + str(count+1)
+		s1 = sim_sources_names[0]
+		grouping = 'similar-group-' + str(source_order[s1]+1)
 		data_to_save[grouping] = {}
-		data_to_save[grouping]['sources'] = {}
-		for i in range(len(sim_sources_names)):
-			data_to_save[grouping]['sources'][sim_sources_names[i]] = [str(l) for l in get_covered_of_src(sim_sources_names[i])]
+		data_to_save[grouping]['sources'] = {
+			name: [str(l) for l in covered_of_src[name]]
+			for name in sim_sources_names
+		}
 		data_to_save[grouping]['source_being_compared'] = s1
 
 	##  Save the data ##
 
 	# Get the differences to save
 	print("Gathering differences for thresholded files...")
-	filt_json_data = filter_per_test_sources(json_data, filt_sources_to_plot.keys())
-
 	test_name = test.split('/')[-1]
-	_, differences = get_common_and_different(
-		format_per_test_list(filt_json_data), format_per_test_list(filt_json_data),
-		level='line', cov1_fname=test_name + '-1',
-		cov2_fname=test_name + '-2',
-	)
+	if isinstance(json_data, IncrementalAggregator) and not args.save_all:
+		# The consecutive differences of aggregated reports
+		# are the lines that were added in each step.
+		differences = json_data.get_consecutive_differences(
+			sources=[
+				source for source in json_data.files
+				if pattern_find(source, filt_sources_to_plot.keys())
+			],
+			cov1_fname=test_name + '-1',
+			cov2_fname=test_name + '-2'
+		)
+		locations = [json_data.base_report['location']] * len(json_data) if differences else []
+	else:
+		filt_json_data = filter_per_test_sources(list(json_data), filt_sources_to_plot.keys())
+		_, differences = get_common_and_different(
+			format_per_test_list(filt_json_data), format_per_test_list(filt_json_data),
+			level='line', cov1_fname=test_name + '-1',
+			cov2_fname=test_name + '-2',
+		)
+		locations = [per_test_data['location'] for per_test_data in filt_json_data]
 
 	# If we don't want to save all differences,
 	# only save consecutive differences i.e. 0 -> 1 -> ... -> 20.
@@ -250,25 +349,22 @@ def get_and_plot_differences(json_data, test='', plot_total_lines=True, args=Non
 		differences = new_differences
 
 	# Add location info to differences file
-	for count, per_test_data in enumerate(filt_json_data):
-		differences[str(count) + '-location'] = per_test_data['location']
+	for count, location in enumerate(locations):
+		differences[str(count) + '-location'] = location
 
 	return differences, data_to_save
 
 
-def differences_analysis(args=None, save=True, filt_and_split_data=None):
+def differences_analysis(args=None, save=True, filt_and_split_data=None, pipeline=None):
 	# Plots total lines hit across all files (global variability),
 	# the ratio (lines hit - mean of lines hit) for a more accurate view,
 	# and an overlay of the number of lines hit in each file (in gray) with
 	# a mean of those lines shown over top (in blue) for 3 figures.
 	args = wrap_args(args)
 
-	if not filt_and_split_data:
-		print("Loading...")
-		filt_and_split_data = check_args_and_get_data(args=args)
-		if not filt_and_split_data:
-			return None
-		print("Done loading.")
+	pipeline = get_pipeline(args, filt_and_split_data=filt_and_split_data, pipeline=pipeline)
+	if not pipeline.data:
+		return None
 
 	OUTPUT_DIR = args.output_dir if args.output_dir else os.getcwd()
 	variability_threshold = args.variability_threshold
@@ -277,7 +373,7 @@ def differences_analysis(args=None, save=True, filt_and_split_data=None):
 	if args.line_level:
 		level = 'line'
 
-	test_groups = group_tests(filt_and_split_data)
+	test_groups = pipeline.test_groups()
 	for test in test_groups:
 		# For each test, perform the plotting mentioned above.
 		print("Running test: " + test)
@@ -302,55 +398,37 @@ def differences_analysis(args=None, save=True, filt_and_split_data=None):
 				save_json(data_to_save[grouping], OUTPUT_DIR, new_file)
 
 		print("Close all figures to see the next test...")
-		plt.show()
+		show_figures('differences', outputdir=OUTPUT_DIR)
 
 
 
-	return filt_and_split_data, differences
+	return pipeline, differences
 
 
-def aggregation_graph_analysis(args=None, save=True, filt_and_split_data=None):
+def aggregation_graph_analysis(args=None, save=True, filt_and_split_data=None, pipeline=None):
 	# Plot the same thing as 'differences', but with
 	# aggregated data.
 	args = wrap_args(args)
 
-	if not filt_and_split_data:
-		print("Loading...")
-		filt_and_split_data = check_args_and_get_data(args=args)
-		if not filt_and_split_data:
-			return None
-		print("Done loading.")
+	pipeline = get_pipeline(args, filt_and_split_data=filt_and_split_data, pipeline=pipeline)
+	if not pipeline.data:
+		return None
 
 	OUTPUT_DIR = args.output_dir if args.output_dir else os.getcwd()
 	variability_threshold = args.variability_threshold
 	save_all = args.save_all
 	freq_range = args.frequency_filter
 
-	filt_and_split_data = format_to_level(filt_and_split_data, level='line')
-
-	test_groups = group_tests(filt_and_split_data)
+	test_groups = pipeline.test_groups(level='line')
 	for test in test_groups:
 		# For each test, perform the plotting mentioned above.
 		print("Running test: " + test)
 		json_data = test_groups[test]
 
-		print("Removing file variability.")
-		json_data = filter_file_variability(json_data)
-
 		test_name = test.split('/')[-1]
 
 		print("### Aggregating reports")
-		total_aggregate = {}
-		aggregated_data = []
-		for count, per_test_data in enumerate(json_data):
-			if count >= len(json_data) - 1:
-				continue
-			if len(total_aggregate) == 0:
-				total_aggregate = per_test_data
-				continue
-
-			total_aggregate = aggregate_reports(total_aggregate, per_test_data)
-			aggregated_data.append(copy.deepcopy(total_aggregate))
+		aggregated_data = IncrementalAggregator(json_data)
 
 		print("### Ploting aggregation report")
 		differences = get_and_plot_differences(aggregated_data, test=test, plot_total_lines=False, args=args, show_stability=True)
@@ -362,42 +440,39 @@ def aggregation_graph_analysis(args=None, save=True, filt_and_split_data=None):
 				str(variability_threshold[0]) + " lines changed to: " + new_file
 			)
 			save_json(differences, OUTPUT_DIR, new_file)
-		plt.show()
+		show_figures('aggregation_graph', outputdir=OUTPUT_DIR)
 
-	return filt_and_split_data
+	return pipeline
 
 
-def filter_freqs_analysis(args=None, save=True, filt_and_split_data=None):
+def filter_freqs_analysis(args=None, save=True, filt_and_split_data=None, pipeline=None):
 	# Plot the same thing as 'differences', but with
 	# aggregated data.
 	args = wrap_args(args)
 
-	if not filt_and_split_data:
-		print("Loading...")
-		filt_and_split_data = check_args_and_get_data(args=args)
-		if not filt_and_split_data:
-			return None
-		print("Done loading.")
+	pipeline = get_pipeline(args, filt_and_split_data=filt_and_split_data, pipeline=pipeline)
+	# Checked with the tests, so that cached time series don't
+	# need the reports to be loaded.
+	if not pipeline.tests():
+		return None
+
+	import numpy as np
+	plt = get_pyplot()
 
 	OUTPUT_DIR = args.output_dir if args.output_dir else os.getcwd()
 	save_all = args.save_all
 	freq_range = args.frequency_filter
 
-	filt_and_split_data = format_to_level(filt_and_split_data, level='line')
-
-	test_groups = group_tests(filt_and_split_data)
-	for test in test_groups:
+	for test in pipeline.tests():
 		# For each test, perform the plotting mentioned above.
 		print("Running test: " + test)
-		json_data = test_groups[test]
-
-		print("Removing file variability.")
-		json_data = filter_file_variability(json_data)
 
 		test_name = test.split('/')[-1]
 
 		print("Filtering frequencies...")
-		new_data = filter_freqs(json_data, freq_range)
+		new_data = filter_freqs(
+			None, freq_range, seed=pipeline.seed, timeseries=pipeline.timeseries(test)
+		)
 
 		print("Plotting filtered data")
 		f1 = plt.figure()
@@ -420,42 +495,36 @@ def filter_freqs_analysis(args=None, save=True, filt_and_split_data=None):
 			plt.savefig(output_name)
 			plt.ylim(ymin, ymax)
 
-		plt.show()
+		show_figures('filter_freqs', outputdir=OUTPUT_DIR)
 
-	return filt_and_split_data
+	return pipeline
 
 
-def filter_ttest_analysis(args=None, save=True, filt_and_split_data=None):
+def filter_ttest_analysis(args=None, save=True, filt_and_split_data=None, pipeline=None):
 	# Plot the same thing as 'differences', but with
 	# aggregated data.
 	args = wrap_args(args)
 
-	if not filt_and_split_data:
-		print("Loading...")
-		filt_and_split_data = check_args_and_get_data(args=args)
-		if not filt_and_split_data:
-			return None
-		print("Done loading.")
+	pipeline = get_pipeline(args, filt_and_split_data=filt_and_split_data, pipeline=pipeline)
+	# Checked with the tests, so that cached time series don't
+	# need the reports to be loaded.
+	if not pipeline.tests():
+		return None
 
 	OUTPUT_DIR = args.output_dir if args.output_dir else os.getcwd()
 	save_all = args.save_all
 	freq_range = args.frequency_filter
 
-	filt_and_split_data = format_to_level(filt_and_split_data, level='line')
-
-	test_groups = group_tests(filt_and_split_data)
-	for test in test_groups:
+	for test in pipeline.tests():
 		# For each test, perform the plotting mentioned above.
 		print("Running test: " + test)
-		json_data = test_groups[test]
-
-		print("Removing file variability.")
-		json_data = filter_file_variability(json_data)
 
 		test_name = test.split('/')[-1]
 
 		print("Searching for significant changes...")
-		new_data = filter_ttest(json_data, freq_range)
+		new_data = filter_ttest(
+			None, freq_range, seed=pipeline.seed, timeseries=pipeline.timeseries(test)
+		)
 
 		print("\n\nSignificant Changes In: ")
 		for sf in new_data:
@@ -468,7 +537,7 @@ def filter_ttest_analysis(args=None, save=True, filt_and_split_data=None):
 			with open(output_name, "w") as f:
 				json.dump(new_data, f)
 
-	return filt_and_split_data
+	return pipeline
 
 
 if __name__=="__main__":
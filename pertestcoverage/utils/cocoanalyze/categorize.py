@@ -220,7 +220,7 @@ def categorize_directory_match(
 	return directory_matched_data
 
 
-def find_test_related(data, mozpath=None, return_keys=False):
+def find_test_related(data, mozpath=None, return_keys=False, cache_dir=None):
 	'''
 		Returns all changesets with test-related changes.
 	'''
@@ -234,7 +234,9 @@ def find_test_related(data, mozpath=None, return_keys=False):
 		support_files = []
 		for test in testsnotrun:
 			if mozpath:
-				support_files = find_support_files_modified(files_modified, test, mozpath)
+				support_files = find_support_files_modified(
+					files_modified, test, mozpath, cache_dir=cache_dir
+				)
 
 		files_modified = list(set(files_modified) - set(support_files))
 		files_modified = [
@@ -275,8 +277,9 @@ def categorize_test_changes(
 		failed_ptc_data = find_failed_changesets_list(ptc_breakdown_datalist)
 
 	mozpath = kwargs.get('mozcentral_path', None)
+	cache_dir = kwargs.get('cache_dir', None)
 	for data in failed_ptc_data:
-		new_datalist.append(find_test_related(data, mozpath=mozpath))
+		new_datalist.append(find_test_related(data, mozpath=mozpath, cache_dir=cache_dir))
 
 	return new_datalist
 
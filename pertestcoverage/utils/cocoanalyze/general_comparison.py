@@ -1,3 +1,5 @@
+from .redundancy import bitmap_lines, lines_to_bitmap
+
 
 def get_sets_common_and_different(files1, files2, forward_diff_name='list1-list2',
 								 backward_diff_name='list2-list1', merge_diffs=False):
@@ -134,5 +136,120 @@ def aggregate_reports(dest_report, src_report):
 	return final_report
 
 
+class IncrementalAggregator:
+	'''
+		Cumulative aggregation of a list of per-test reports, equivalent to
+		repeatedly calling `aggregate_reports` on the first report and keeping
+		a copy of it after each step (the last report is not aggregated).
+
+		Only the lines that are new in each step are stored (as per-file bitmaps),
+		the aggregated reports are rebuilt when they are accessed. A full copy of
+		the bitmaps is kept every `checkpoint_interval` steps to bound the cost
+		of accessing a random step.
+
+		Each aggregated report contains all the files seen in any step (with
+		no lines if it was not seen yet) like `filter_file_variability` does.
+	'''
+	def __init__(self, json_data_list, checkpoint_interval=50):
+		self.checkpoint_interval = checkpoint_interval
+		self.base_report = {}
+		self.files = []
+		self.deltas = []
+		self.checkpoints = {}
+
+		bitmaps = {}
+		for count, per_test_data in enumerate(json_data_list):
+			if count >= len(json_data_list) - 1:
+				break
+			if count == 0:
+				self.base_report = {
+					key: val for key, val in per_test_data.items()
+					if key != 'source_files'
+				}
+
+			delta = {}
+			for file, coverage in per_test_data['source_files'].items():
+				new_lines = lines_to_bitmap(coverage) & ~bitmaps.get(file, 0)
+				if file not in bitmaps:
+					self.files.append(file)
+				if new_lines or file not in bitmaps:
+					delta[file] = new_lines
+					bitmaps[file] = bitmaps.get(file, 0) | new_lines
+			self.deltas.append(delta)
+
+			if count % checkpoint_interval == 0:
+				self.checkpoints[count] = dict(bitmaps)
+
+	def __len__(self):
+		return max(0, len(self.deltas) - 1)
+
+	def __getitem__(self, step):
+		if step < 0:
+			step += len(self)
+		if not 0 <= step < len(self):
+			raise IndexError("Aggregation step out of range: " + str(step))
+		return self._make_report(self.get_bitmaps(step))
+
+	def __iter__(self):
+		bitmaps = {}
+		for count, delta in enumerate(self.deltas):
+			for file, new_lines in delta.items():
+				bitmaps[file] = bitmaps.get(file, 0) | new_lines
+			if count > 0:
+				yield self._make_report(bitmaps)
+
+	def get_bitmaps(self, step):
+		# Returns the {file: bitmap} coverage of the given step.
+		count = step + 1
+		checkpoint = count - count % self.checkpoint_interval
+		bitmaps = dict(self.checkpoints[checkpoint])
+		for delta in self.deltas[checkpoint+1:count+1]:
+			for file, new_lines in delta.items():
+				bitmaps[file] = bitmaps.get(file, 0) | new_lines
+		return bitmaps
+
+	def get_new_lines(self, step):
+		# Returns the {file: [lines]} that were added in the given step.
+		return {
+			file: bitmap_lines(new_lines)
+			for file, new_lines in self.deltas[step+1].items()
+		}
+
+	def get_consecutive_differences(self, sources=None, cov1_fname='list1', cov2_fname='list2'):
+		# Same output as `get_common_and_different` (at the line level) on the
+		# aggregated reports, but only for the consecutive steps i.e. 0-1, 1-2, ...
+		# All the files seen in any step are included as in `filter_file_variability`.
+		# Aggregated reports only gain lines, so the forward diffs are always empty.
+		forward_diff_name = cov1_fname + '-' + cov2_fname
+		backward_diff_name = cov2_fname + '-' + cov1_fname
+
+		all_files = self.files
+		if sources is not None:
+			sources = set(sources)
+			all_files = [file for file in all_files if file in sources]
+		if not all_files:
+			return {}
+
+		differences = {}
+		for step in range(len(self) - 1):
+			new_lines = self.get_new_lines(step + 1)
+			differences[str(step) + '-' + str(step + 1)] = {
+				file: {
+					forward_diff_name: [],
+					backward_diff_name: new_lines.get(file, [])
+				}
+				for file in all_files
+			}
+		return differences
+
+	def _make_report(self, bitmaps):
+		report = dict(self.base_report)
+		report['source_files'] = {
+			file: bitmap_lines(bitmaps.get(file, 0))
+			for file in self.files
+		}
+		return report
+
+
 if __name__=="__main__":
 	print("Not for use from CLI.")
\ No newline at end of file
@@ -0,0 +1,177 @@
+'''
+
+	MinHash signatures and a locality sensitive hashing (LSH)
+	index used to find tests (or source file time series) with
+	similar coverage without comparing every pair of them.
+
+	The LSH index splits each signature into `bands` bands of
+	`num_perm/bands` rows. Two signatures become candidates when
+	any of their bands hash to the same bucket, which happens with
+	high probability when their Jaccard similarity is above
+	roughly (1/bands)^(1/rows).
+
+'''
+import logging
+import zlib
+
+log = logging.getLogger('pertestcoverage')
+
+MERSENNE_PRIME = (1 << 31) - 1
+MAX_TOKENS_PER_CHUNK = 10000
+
+
+def hash_token(token):
+	return zlib.crc32(str(token).encode('utf-8')) % MERSENNE_PRIME
+
+
+def get_permutations(num_perm=128, seed=1):
+	'''
+		Returns the (a, b) coefficients of the `num_perm`
+		hash functions h(x) = (a*x + b) mod p.
+	'''
+	import numpy as np
+
+	rng = np.random.RandomState(seed)
+	a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+	b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+	return a, b
+
+
+def minhash_signature(tokens, permutations):
+	'''
+		Returns the MinHash signature of a set of tokens. An empty
+		set of tokens results in a signature filled with MERSENNE_PRIME.
+	'''
+	import numpy as np
+
+	a, b = permutations
+	signature = np.full(len(a), MERSENNE_PRIME, dtype=np.int64)
+
+	hashed = np.fromiter(
+		(hash_token(token) for token in set(tokens)), dtype=np.int64
+	)
+	for start in range(0, len(hashed), MAX_TOKENS_PER_CHUNK):
+		chunk = hashed[start:start+MAX_TOKENS_PER_CHUNK]
+		chunk_sig = ((np.outer(chunk, a) + b) % MERSENNE_PRIME).min(axis=0)
+		signature = np.minimum(signature, chunk_sig)
+
+	return signature
+
+
+def estimate_jaccard(signature1, signature2):
+	import numpy as np
+	return float(np.mean(signature1 == signature2))
+
+
+def coverage_tokens(source_files):
+	'''
+		Returns the set of 'source:line' tokens covered in
+		a per-test `source_files` entry.
+	'''
+	tokens = set()
+	for source, coverage in source_files.items():
+		for line in coverage:
+			if type(line) in (tuple, list):
+				line = line[0]
+			tokens.add(source + ':' + str(line))
+	return tokens
+
+
+def timeseries_tokens(series, num_levels=10):
+	'''
+		Returns tokens for a time series normalized in the range [0, 1].
+		Each sample becomes a (position, level) token, so series that
+		stay close to each other share most of their tokens.
+	'''
+	return set(
+		str(i) + ':' + str(int(round(val * num_levels)))
+		for i, val in enumerate(series)
+	)
+
+
+class MinHashLSH:
+	def __init__(self, num_perm=128, bands=32, seed=1):
+		if num_perm % bands != 0:
+			raise Exception(
+				"num_perm (%s) must be divisible by bands (%s)." %
+				(str(num_perm), str(bands))
+			)
+		self.num_perm = num_perm
+		self.bands = bands
+		self.rows = num_perm // bands
+		self.permutations = get_permutations(num_perm=num_perm, seed=seed)
+
+		self.signatures = {}
+		self.buckets = [{} for _ in range(bands)]
+
+	def signature(self, tokens):
+		return minhash_signature(tokens, self.permutations)
+
+	def _band_keys(self, signature):
+		return [
+			signature[band*self.rows:(band+1)*self.rows].tobytes()
+			for band in range(self.bands)
+		]
+
+	def add(self, key, signature):
+		self.signatures[key] = signature
+		for band, band_key in enumerate(self._band_keys(signature)):
+			bucket = self.buckets[band]
+			if band_key not in bucket:
+				bucket[band_key] = []
+			bucket[band_key].append(key)
+
+	def add_tokens(self, key, tokens):
+		self.add(key, self.signature(tokens))
+
+	def query(self, signature):
+		'''
+			Returns all keys which share at least one bucket
+			with the given signature.
+		'''
+		candidates = set()
+		for band, band_key in enumerate(self._band_keys(signature)):
+			candidates.update(self.buckets[band].get(band_key, []))
+		return candidates
+
+	def query_similar(self, signature, threshold=0.5, exclude=None):
+		'''
+			Returns a list of (key, estimated_jaccard) tuples for all candidates
+			with an estimated jaccard similarity at or above `threshold`, sorted
+			from most to least similar.
+		'''
+		similar = []
+		for key in self.query(signature):
+			if key == exclude:
+				continue
+			similarity = estimate_jaccard(signature, self.signatures[key])
+			if similarity >= threshold:
+				similar.append((key, similarity))
+		return sorted(similar, key=lambda x: -x[1])
+
+	def nearest(self, key, threshold=0.5, num_neighbours=10):
+		return self.query_similar(
+			self.signatures[key], threshold=threshold, exclude=key
+		)[:num_neighbours]
+
+	def get_similar_groups(self, threshold=0.5):
+		'''
+			Groups all keys whose estimated similarity with the
+			first key of the group is at or above `threshold`.
+			Keys with no similar keys are not returned.
+		'''
+		groups = []
+		grouped = set()
+		for key, signature in self.signatures.items():
+			if key in grouped:
+				continue
+			similar = [
+				skey for skey, _ in self.query_similar(signature, threshold=threshold, exclude=key)
+				if skey not in grouped
+			]
+			if not similar:
+				continue
+			group = [key] + similar
+			grouped.update(group)
+			groups.append(group)
+		return groups
@@ -0,0 +1,215 @@
+'''
+
+	These functions are used to find tests whose coverage is
+	a subset (or a near-subset) of another test's coverage.
+
+	Rather than comparing every pair of tests, an inverted
+	index of (source file, line) -> tests is built and only the
+	tests that cover the rarest lines of a test are considered
+	as candidates (prefix filtering). Candidates are then verified
+	with per-file line bitmaps.
+
+'''
+import logging
+import math
+
+log = logging.getLogger('pertestcoverage')
+
+
+def popcount(bitmap):
+	return bin(bitmap).count('1')
+
+
+def lines_to_bitmap(lines):
+	bitmap = 0
+	for line in lines:
+		bitmap |= 1 << line
+	return bitmap
+
+
+def get_line_numbers(coverage):
+	# Handles both line level data ([1, 2, ...]) and
+	# hits level data ([(1, 10), (2, 1), ...]).
+	return [
+		line[0] if type(line) in (tuple, list) else line
+		for line in coverage
+	]
+
+
+def merge_tests_coverage(json_data_list):
+	'''
+		Merges all the per-test data for tests with the same name
+		into a single set of per-file line bitmaps, returns a dict
+		in the form: {test_name: {source_file: bitmap}}.
+	'''
+	tests_coverage = {}
+	for per_test_data in json_data_list:
+		if 'test' not in per_test_data:
+			continue
+
+		test = per_test_data['test']
+		if test not in tests_coverage:
+			tests_coverage[test] = {}
+		test_coverage = tests_coverage[test]
+
+		for source, coverage in per_test_data['source_files'].items():
+			bitmap = lines_to_bitmap(get_line_numbers(coverage))
+			if not bitmap:
+				continue
+			test_coverage[source] = test_coverage.get(source, 0) | bitmap
+
+	return tests_coverage
+
+
+def bitmap_lines(bitmap):
+	lines = []
+	while bitmap:
+		lowest = bitmap & -bitmap
+		lines.append(lowest.bit_length() - 1)
+		bitmap ^= lowest
+	return lines
+
+
+def build_inverted_index(tests, tests_coverage):
+	'''
+		Returns a dict in the form {(source_file, line): [test indices]}.
+	'''
+	inverted_index = {}
+	for test_ind, test in enumerate(tests):
+		for source, bitmap in tests_coverage[test].items():
+			for line in bitmap_lines(bitmap):
+				key = (source, line)
+				if key not in inverted_index:
+					inverted_index[key] = []
+				inverted_index[key].append(test_ind)
+	return inverted_index
+
+
+def get_containment(subset_coverage, superset_coverage):
+	'''
+		Returns the number of lines in `subset_coverage` that
+		are also covered in `superset_coverage`.
+	'''
+	covered = 0
+	for source, bitmap in subset_coverage.items():
+		if source not in superset_coverage:
+			continue
+		covered += popcount(bitmap & superset_coverage[source])
+	return covered
+
+
+def find_redundant_tests(json_data_list, containment_threshold=1.0, max_candidates=None):
+	'''
+		Finds tests whose coverage is contained (by at least `containment_threshold`
+		of its lines) in another test's coverage.
+
+		Returns a tuple of (redundant, tests_with_no_coverage) where `redundant`
+		is a dict in the form:
+			{
+				test: {
+					'lines': 1000,
+					'supersets': [
+						{'superset': test2, 'containment': 0.98, 'lines': 1024},
+						...
+					]
+				}
+			}
+
+		Candidates for each test are sorted by containment, then by the
+		number of lines the superset covers (smallest first).
+	'''
+	if not 0 < containment_threshold <= 1:
+		raise Exception(
+			"containment_threshold must be in the range (0, 1], got %s" %
+			str(containment_threshold)
+		)
+
+	tests_coverage = merge_tests_coverage(json_data_list)
+	tests_with_no_coverage = [
+		test for test, coverage in tests_coverage.items() if not coverage
+	]
+	tests = [
+		test for test, coverage in tests_coverage.items() if coverage
+	]
+	tests_sizes = [
+		sum([popcount(bitmap) for bitmap in tests_coverage[test].values()])
+		for test in tests
+	]
+
+	log.info("Building inverted index for %s tests..." % str(len(tests)))
+	inverted_index = build_inverted_index(tests, tests_coverage)
+	log.info("Number of unique lines covered: %s" % str(len(inverted_index)))
+
+	redundant = {}
+	for test_ind, test in enumerate(tests):
+		test_coverage = tests_coverage[test]
+		test_size = tests_sizes[test_ind]
+		min_covered = int(math.ceil(containment_threshold * test_size))
+
+		# Any test covering at least `min_covered` lines of this
+		# test must cover at least one of its `prefix_size` rarest lines.
+		prefix_size = test_size - min_covered + 1
+		rarest_lines = sorted(
+			[
+				(source, line)
+				for source, bitmap in test_coverage.items()
+				for line in bitmap_lines(bitmap)
+			],
+			key=lambda key: len(inverted_index[key])
+		)[:prefix_size]
+
+		candidates = set()
+		for key in rarest_lines:
+			candidates.update(inverted_index[key])
+		candidates.discard(test_ind)
+
+		supersets = []
+		for cand_ind in candidates:
+			if tests_sizes[cand_ind] < min_covered:
+				continue
+			covered = get_containment(test_coverage, tests_coverage[tests[cand_ind]])
+			if covered < min_covered:
+				continue
+			supersets.append({
+				'superset': tests[cand_ind],
+				'containment': covered / test_size,
+				'lines': tests_sizes[cand_ind]
+			})
+
+		if not supersets:
+			continue
+
+		supersets = sorted(supersets, key=lambda s: (-s['containment'], s['lines']))
+		if max_candidates:
+			supersets = supersets[:max_candidates]
+		redundant[test] = {
+			'lines': test_size,
+			'supersets': supersets
+		}
+
+	return redundant, tests_with_no_coverage
+
+
+def get_duplicate_groups(redundant):
+	'''
+		Finds groups of tests that have exactly the same coverage
+		from the output of `find_redundant_tests`.
+	'''
+	duplicates = {}
+	for test, info in redundant.items():
+		for superset in info['supersets']:
+			if superset['containment'] < 1 or superset['lines'] != info['lines']:
+				continue
+			group = duplicates.get(test, set([test])) | duplicates.get(superset['superset'], set())
+			group.add(superset['superset'])
+			for member in group:
+				duplicates[member] = group
+
+	groups = []
+	seen = set()
+	for test, group in duplicates.items():
+		if test in seen:
+			continue
+		seen |= group
+		groups.append(sorted(group))
+	return groups
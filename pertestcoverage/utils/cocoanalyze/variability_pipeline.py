@@ -0,0 +1,153 @@
+'''
+
+	The variability pipeline loads and filters the per-test data
+	once, then keeps the per-test groupings, the file variability
+	filtered data, and the per-source time series around so that
+	all the variability analyses can share them.
+
+	The time series can also be cached on disk (see `cache_dir`)
+	so that the frequency and t-test analyses can be re-run without
+	re-opening any of the per-test reports. The cache is keyed by the
+	arguments used to load the data and the modification times of
+	the reports.
+
+'''
+import os
+import sys
+import json
+import hashlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cocoload import (
+	get_all_jsons,
+	get_jsonpaths_from_dir,
+	format_to_level,
+	level_check
+)
+from cocofilter import (
+	filter_file_variability,
+	filter_per_test_all,
+	get_source_timeseries,
+	group_tests,
+	split_file_types
+)
+
+CACHE_ARGS = ('PER_TEST_DIR', 'tests', 'sources', 'line_range', 'split_types', 'scores', 'scoredfile', 'getuniques')
+
+
+def load_filtered_data(args, split_types=True):
+	# Set `split_types` to False to leave the splitting of
+	# file types (if requested in the args) to `group_tests`.
+	json_data = get_all_jsons(args)
+	filtered_json_data = filter_per_test_all(json_data, args.tests, args.sources, args.line_range)
+
+	if split_types and args.split_types:
+		filtered_json_data = split_file_types(filtered_json_data)
+
+	return filtered_json_data
+
+
+class VariabilityPipeline:
+	def __init__(self, args, filt_and_split_data=None, seed=None, cache_dir=None):
+		self.args = args
+		self.seed = seed
+		self.cache_dir = cache_dir
+
+		# Given data is already split into file types
+		self._split_types = filt_and_split_data is None and bool(args.split_types)
+		self._data = filt_and_split_data
+		self._test_groups = {}
+		self._timeseries = None
+		self._cache_key = None
+
+	@property
+	def data(self):
+		if self._data is None:
+			print("Loading...")
+			self._data = load_filtered_data(self.args, split_types=False)
+			print("Done loading.")
+		return self._data
+
+	def test_groups(self, level=None):
+		'''
+			Returns a dict of {test: json_data} with the file variability
+			removed from each test's data. `level` can be set to 'line' to
+			get line level data.
+		'''
+		if level not in self._test_groups:
+			data = self.data
+			if level:
+				data = format_to_level(data, level=level)
+
+			test_groups = group_tests(data, split_types=self._split_types)
+			for test in test_groups:
+				print("Removing file variability for: " + test)
+				test_groups[test] = filter_file_variability(test_groups[test])
+			self._test_groups[level] = test_groups
+
+		return self._test_groups[level]
+
+	def tests(self):
+		timeseries = self._load_timeseries()
+		if timeseries is not None:
+			return list(timeseries.keys())
+		if not self.data:
+			return []
+		return list(self.test_groups(level='line').keys())
+
+	def timeseries(self, test):
+		'''
+			Returns the per-source time series of the test in the form:
+				{source_file: [lines hit in run 1, lines hit in run 2, ...]}
+		'''
+		timeseries = self._load_timeseries()
+		if timeseries is None:
+			timeseries = {}
+			for test_name, json_data in self.test_groups(level='line').items():
+				timeseries[test_name] = get_source_timeseries(
+					json_data, level_check(json_data[0])
+				)
+			self._timeseries = timeseries
+			self._save_timeseries()
+		return timeseries[test]
+
+	def _get_cache_path(self):
+		if not self.cache_dir:
+			return None
+
+		if self._cache_key is None:
+			key_data = {
+				arg: getattr(self.args, arg, None)
+				for arg in CACHE_ARGS
+			}
+			key_data['reports'] = sorted([
+				(os.path.join(root, file), os.path.getmtime(os.path.join(root, file)))
+				for root, file in get_jsonpaths_from_dir(self.args.PER_TEST_DIR)
+			])
+			self._cache_key = hashlib.sha1(
+				json.dumps(key_data, sort_keys=True, default=str).encode('utf-8')
+			).hexdigest()
+
+		return os.path.join(self.cache_dir, 'variability_timeseries_' + self._cache_key + '.json')
+
+	def _load_timeseries(self):
+		if self._timeseries is not None:
+			return self._timeseries
+
+		cache_path = self._get_cache_path()
+		if cache_path and os.path.exists(cache_path):
+			print("Using cached time series from: " + cache_path)
+			with open(cache_path, 'r') as f:
+				self._timeseries = json.load(f)
+		return self._timeseries
+
+	def _save_timeseries(self):
+		cache_path = self._get_cache_path()
+		if not cache_path:
+			return
+
+		if not os.path.exists(self.cache_dir):
+			os.makedirs(self.cache_dir)
+		print("Caching time series to: " + cache_path)
+		with open(cache_path, 'w') as f:
+			json.dump(self._timeseries, f)
@@ -0,0 +1,97 @@
+'''
+
+	An append-only journal used to checkpoint long analyses.
+
+	The journal is a newline-delimited JSON file: the first line
+	identifies the run (the settings it was started with) and each
+	following line is a record added by the analysis. Records are
+	buffered and written every `interval` records, so a crash loses
+	at most the records of the last interval. A partially written
+	last line (from a crash while writing) is ignored when reading.
+
+'''
+import json
+import logging
+import os
+
+log = logging.getLogger('pertestcoverage')
+
+
+class CheckpointJournal:
+	def __init__(self, path, key=None, interval=10):
+		self.path = path
+		self.key = key
+		self.interval = interval
+		self._buffer = []
+		self._file = None
+
+	def read(self):
+		'''
+			Returns the records found in the journal, it must have been
+			started with the same `key` as this one. Returns an empty
+			list if there is no journal.
+		'''
+		if not os.path.exists(self.path):
+			return []
+
+		records = []
+		with open(self.path, 'r') as f:
+			for count, line in enumerate(f):
+				try:
+					record = json.loads(line)
+				except ValueError:
+					log.info("Ignoring an incomplete record at line %s of %s" % (str(count+1), self.path))
+					break
+				if count == 0:
+					if record.get('checkpoint') != self.key:
+						raise Exception(
+							"Checkpoint at %s was made with different settings, "
+							"it can't be used to resume this run." % self.path
+						)
+					continue
+				records.append(record)
+		return records
+
+	def start(self, resume=False):
+		'''
+			Opens the journal for writing, a new one is started
+			unless `resume` is True and a journal already exists.
+		'''
+		if resume and os.path.exists(self.path):
+			# Drop an incomplete last line so that new records start on their own line
+			records = self.read()
+			with open(self.path, 'w') as f:
+				f.write(json.dumps({'checkpoint': self.key}) + '\n')
+				for record in records:
+					f.write(json.dumps(record, separators=(',', ':')) + '\n')
+			self._file = open(self.path, 'a')
+			return records
+
+		if os.path.exists(self.path):
+			log.info("Overwriting the checkpoint at %s" % self.path)
+		self._file = open(self.path, 'w')
+		self._file.write(json.dumps({'checkpoint': self.key}) + '\n')
+		self._file.flush()
+		return []
+
+	def append(self, record):
+		self._buffer.append(record)
+		if len(self._buffer) >= self.interval:
+			self.flush()
+
+	def flush(self):
+		if self._file is None or not self._buffer:
+			return
+		self._file.write(''.join(
+			json.dumps(record, separators=(',', ':')) + '\n'
+			for record in self._buffer
+		))
+		self._file.flush()
+		os.fsync(self._file.fileno())
+		self._buffer = []
+
+	def close(self):
+		self.flush()
+		if self._file is not None:
+			self._file.close()
+			self._file = None
@@ -0,0 +1,136 @@
+'''
+
+	A context shared by all the analysis types run in one `ptc` invocation.
+
+	While a context is active, the datasets opened with `get_all_rawdata`
+	and the responses to `get_http_json` and `query_activedata` are kept
+	in memory, so that chained analysis types only pay for loading the
+	same data once. Test and source file names found in the datasets
+	are interned so that all the datasets share a single copy of them.
+
+	Analysis types get copies of the cached data, so they can modify it
+	(or the `source_files` of the entries) without affecting each other.
+
+'''
+import json
+import logging
+import threading
+
+log = logging.getLogger('pertestcoverage')
+
+_active_context = {'context': None}
+
+
+class RunContext:
+	def __init__(self):
+		self.datasets = {}
+		self.responses = {}
+		self.names = {}
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+
+	def _get_key(self, *args):
+		return json.dumps(args, sort_keys=True, default=str)
+
+	def intern(self, name):
+		return self.names.setdefault(name, name)
+
+	def _intern_entry(self, per_test_data):
+		if 'test' in per_test_data and isinstance(per_test_data['test'], str):
+			per_test_data['test'] = self.intern(per_test_data['test'])
+		if isinstance(per_test_data.get('source_files'), dict):
+			per_test_data['source_files'] = {
+				self.intern(source): lines
+				for source, lines in per_test_data['source_files'].items()
+			}
+		return per_test_data
+
+	def get_dataset(self, location_entry, load):
+		'''
+			Returns the data of a `pertest_rawdata_folders` entry,
+			`load` is called with the entry if it wasn't loaded yet.
+		'''
+		key = self._get_key('dataset', location_entry)
+		with self._lock:
+			if key in self.datasets:
+				self.hits += 1
+				log.info("Using the data already opened from %s" % location_entry['location'])
+			else:
+				self.misses += 1
+				self.datasets[key] = [
+					self._intern_entry(per_test_data)
+					for per_test_data in load(location_entry)
+				]
+			jsondatalist = self.datasets[key]
+
+		return [
+			dict(per_test_data, source_files=dict(per_test_data['source_files']))
+			if isinstance(per_test_data.get('source_files'), dict) else dict(per_test_data)
+			for per_test_data in jsondatalist
+		]
+
+	def get_response(self, load, *request):
+		'''
+			Returns the (text) response to a request, `load` is
+			only called if the same request wasn't made before.
+		'''
+		key = self._get_key('response', *request)
+		with self._lock:
+			if key in self.responses:
+				self.hits += 1
+				return self.responses[key]
+
+		response = load()
+		with self._lock:
+			self.misses += 1
+			self.responses[key] = response
+		return response
+
+	def get_cached_response(self, *request):
+		# For clients that make their requests themselves,
+		# returns None if the response isn't cached.
+		key = self._get_key('response', *request)
+		with self._lock:
+			if key in self.responses:
+				self.hits += 1
+				return self.responses[key]
+		return None
+
+	def set_cached_response(self, response, *request):
+		key = self._get_key('response', *request)
+		with self._lock:
+			self.misses += 1
+			self.responses[key] = response
+
+	def get_json(self, load, *request):
+		# Parsed on every call so that each caller gets its own copy.
+		return json.loads(self.get_response(load, *request))
+
+	def clear(self):
+		with self._lock:
+			self.datasets = {}
+			self.responses = {}
+			self.names = {}
+
+
+def get_run_context():
+	return _active_context['context']
+
+
+def activate_run_context(context=None):
+	if context is None:
+		context = RunContext()
+	_active_context['context'] = context
+	return context
+
+
+def deactivate_run_context():
+	context = _active_context['context']
+	_active_context['context'] = None
+	if context is not None:
+		log.debug(
+			"Run context: %s cache hits, %s cache misses." %
+			(str(context.hits), str(context.misses))
+		)
+	return context
@@ -1,35 +1,44 @@
-import copy
-import numpy as np
 import random
 import os
 import logging
-import requests
-
-from scipy import stats as scistats
-from matplotlib import pyplot as plt
+import multiprocessing
 
 from ..utils.cocoload import (
 	pattern_find,
+	format_testname,
 	format_to_level,
 	level_check,
 	hg_branch,
 	HG_URL
 )
+from ..utils.cococontext import get_run_context
+from ..utils.cocoreplay import rewrite_url
+from ..utils.cocotree import (
+	get_manifest_index,
+	get_path_index,
+	get_test_manifest_files,
+	path_exists
+)
 
 log = logging.getLogger("pertestcoverage")
 
+# numpy, scipy and requests are imported in the functions
+# that need them to keep this module cheap to import.
 
-def filter_ttest(json_data_list, t_test_bounds):
-	new_sampling_rate = 100
-	dist_between_samples = 1/new_sampling_rate
 
-	# Get the current level of the data
-	curr_level = level_check(json_data_list[0])
-	print("Number of initial data points: " + str(len(json_data_list)))
-	if curr_level == 'file':
-		print("Cannot filter frequencies from `file` level data.")
-		return json_data_list
+# Maximum number of samples processed at once when
+# filtering many source file time series together.
+MAX_BATCH_SAMPLES = 2**22
 
+# File types used to split the data in `split_file_types`,
+# anything else goes into the 'etc' group.
+FILE_TYPE_GROUPS = (
+	('c', ('cpp', 'h', 'c', 'cc', 'hh', 'tcc')),
+	('js', ('js', 'jsm')),
+)
+
+
+def get_source_timeseries(json_data_list, curr_level):
 	# Get source files into groups across all datasets
 	srcFile_groups = {}
 	for per_test_data in json_data_list:
@@ -42,43 +51,120 @@ def filter_ttest(json_data_list, t_test_bounds):
 			elif curr_level == 'hits':
 				# TODO: Redo to give each line a timeseries.
 				srcFile_groups[source].append(sum([hits for _, hits in coverage]))
+	return srcFile_groups
 
-	# small test
-	additional = 5
-	for srcFile_name in srcFile_groups:
-		srcFile_data = srcFile_groups[srcFile_name]
+
+def extend_timeseries(srcFile_groups, additional, increase, noise=0, rng=random):
+	# Extends each timeseries with `additional` copies of its last
+	# sample (increased by `increase` when the file is large) and
+	# an optional uniform noise in the range [-noise, noise].
+	extended = {}
+	for srcFile_name, srcFile_data in srcFile_groups.items():
 		lastel = srcFile_data[-1]
 		if 3000 > max(srcFile_data) > 2000:
-			new_dat = lastel * 1.1
+			new_dat = lastel * increase
 		else:
 			new_dat = lastel
-		srcFile_groups[srcFile_name].extend([new_dat * (1 + random.uniform(-0.05, 0.05)) for _ in range(additional)])
+		if noise:
+			new_samples = [new_dat * (1 + rng.uniform(-noise, noise)) for _ in range(additional)]
+		else:
+			new_samples = [new_dat for _ in range(additional)]
+		extended[srcFile_name] = list(srcFile_data) + new_samples
+	return extended
 
-	significance_data = {'source_files': {}}
-	for srcFile_name in srcFile_groups:
-		srcFile_data = srcFile_groups[srcFile_name]
 
-		mean_upsignal = np.mean(srcFile_data)
+def group_timeseries_by_length(srcFile_groups):
+	# Returns {length: (source_names, 2D array of timeseries)} so that
+	# timeseries with the same number of samples can be processed together.
+	import numpy as np
 
-		# small test
-		additional = 2
-		lastel = srcFile_data[-1]
-		if 3000 > max(srcFile_data) > 2000:
-			new_dat = lastel * 1.02
-		else:
-			new_dat = lastel
-		srcFile_data.extend([new_dat for _ in range(additional)])
+	names_by_length = {}
+	for srcFile_name, srcFile_data in srcFile_groups.items():
+		length = len(srcFile_data)
+		if length not in names_by_length:
+			names_by_length[length] = []
+		names_by_length[length].append(srcFile_name)
+
+	return {
+		length: (names, np.asarray([srcFile_groups[name] for name in names], dtype=float))
+		for length, names in names_by_length.items()
+	}
+
+
+def interp_rows(new_x, data):
+	# Same as running np.interp(new_x, np.arange(num_samples), row)
+	# on each row of `data`.
+	import numpy as np
+
+	num_samples = data.shape[1]
+	if num_samples == 1:
+		return np.repeat(data, len(new_x), axis=1)
+
+	new_x = np.clip(new_x, 0, num_samples - 1)
+	left = np.minimum(np.floor(new_x).astype(int), num_samples - 2)
+	frac = new_x - left
+	return data[:, left] * (1 - frac) + data[:, left + 1] * frac
+
+
+def iter_row_chunks(data, samples_per_row):
+	rows_per_chunk = max(1, int(MAX_BATCH_SAMPLES / max(1, samples_per_row)))
+	for start in range(0, data.shape[0], rows_per_chunk):
+		yield start, data[start:start+rows_per_chunk]
+
+
+def filter_ttest(json_data_list, t_test_bounds, seed=None, timeseries=None):
+	# `timeseries` can be given to reuse the per-source timeseries
+	# returned by `get_source_timeseries` for `json_data_list`.
+	import numpy as np
+	from scipy import stats as scistats
+
+	new_sampling_rate = 100
+	dist_between_samples = 1/new_sampling_rate
+	rng = random.Random(seed) if seed is not None else random
+
+	if timeseries is None:
+		# Get the current level of the data
+		curr_level = level_check(json_data_list[0])
+		print("Number of initial data points: " + str(len(json_data_list)))
+		if curr_level == 'file':
+			print("Cannot filter frequencies from `file` level data.")
+			return json_data_list
+
+		srcFile_groups = get_source_timeseries(json_data_list, curr_level)
+	else:
+		srcFile_groups = timeseries
+
+	# small test
+	srcFile_groups = extend_timeseries(srcFile_groups, 5, 1.1, noise=0.05, rng=rng)
+	mean_upsignals = {
+		srcFile_name: np.mean(srcFile_data)
+		for srcFile_name, srcFile_data in srcFile_groups.items()
+	}
+
+	# small test
+	srcFile_groups = extend_timeseries(srcFile_groups, 2, 1.02)
+
+	t_values = {}
+	for length, (names, srcFiles_data) in group_timeseries_by_length(srcFile_groups).items():
 		# First upsample the timeseries
 		# (can only detect freq_max < sampling_rate/2 by Nyquist-Shanon sampling Theorem)
-		upsampled_signal = np.interp(
-			np.arange(0, len(srcFile_data), dist_between_samples),
-			np.arange(0, len(srcFile_data), 1),
-			srcFile_data
-		)
+		new_x = np.arange(0, length, dist_between_samples)
+		for start, chunk in iter_row_chunks(srcFiles_data, len(new_x)):
+			chunk_names = names[start:start+len(chunk)]
+			upsampled_signals = interp_rows(new_x, chunk)
+
+			zero_signals = np.repeat(
+				np.asarray([[mean_upsignals[name]] for name in chunk_names]),
+				upsampled_signals.shape[1], axis=1
+			)
 
-		zero_signal = np.asarray([mean_upsignal for _ in upsampled_signal])
+			t, p = scistats.ttest_ind(zero_signals, upsampled_signals, axis=1)
+			for name, t_value in zip(chunk_names, t):
+				t_values[name] = t_value
 
-		t, p = scistats.ttest_ind(zero_signal, upsampled_signal)
+	significance_data = {'source_files': {}}
+	for srcFile_name in srcFile_groups:
+		t = t_values[srcFile_name]
 
 		print("T-test value: " + str(t))
 		significant = False
@@ -94,7 +180,7 @@ def filter_ttest(json_data_list, t_test_bounds):
 
 
 
-def filter_freqs(json_data_list, freqs_to_keep, downsample=False):
+def filter_freqs(json_data_list, freqs_to_keep, downsample=False, seed=None, timeseries=None):
 	# Use a brickwall filter - no need to worry about Gibb's phenomenon
 	# here, we assume file variability is removed. This can
 	# really only happen in very sharp drops or increases
@@ -113,90 +199,80 @@ def filter_freqs(json_data_list, freqs_to_keep, downsample=False):
 	# the form of a single json_data as all the files were
 	# aggregated together to form a time series. (This may change).
 	#
+	# All the source files with the same number of samples are
+	# filtered together, and `seed` can be set to make the
+	# random padding reproducible. `timeseries` can be given to
+	# reuse the output of `get_source_timeseries`.
+	#
+	import numpy as np
+
 	new_sampling_rate = 100
 	dist_between_samples = 1/new_sampling_rate
 	low_freq = freqs_to_keep[0]
 	high_freq = freqs_to_keep[1]
+	rng = random.Random(seed) if seed is not None else random
 
-	if len(json_data_list) == 0:
-		return json_data_list
+	if timeseries is None:
+		if len(json_data_list) == 0:
+			return json_data_list
 
-	# Get the current level of the data
-	curr_level = level_check(json_data_list[0])
-	print("Number of initial data points: " + str(len(json_data_list)))
-	if curr_level == 'file':
-		print("Cannot filter frequencies from `file` level data.")
-		return json_data_list
+		# Get the current level of the data
+		curr_level = level_check(json_data_list[0])
+		print("Number of initial data points: " + str(len(json_data_list)))
+		if curr_level == 'file':
+			print("Cannot filter frequencies from `file` level data.")
+			return json_data_list
 
-	# Get source files into groups across all datasets
-	srcFile_groups = {}
-	for per_test_data in json_data_list:
-		for source in per_test_data['source_files']:
-			if source not in srcFile_groups:
-				srcFile_groups[source] = []
-			coverage = per_test_data['source_files'][source]
-			if curr_level == 'line':
-				srcFile_groups[source].append(len(coverage))
-			elif curr_level == 'hits':
-				# TODO: Redo to give each line a timeseries.
-				srcFile_groups[source].append(sum([hits for _, hits in coverage]))
+		srcFile_groups = get_source_timeseries(json_data_list, curr_level)
+	else:
+		srcFile_groups = timeseries
 
 	# small test
-	additional = 5
-	for srcFile_name in srcFile_groups:
-		srcFile_data = srcFile_groups[srcFile_name]
-		lastel = srcFile_data[-1]
-		if 3000 > max(srcFile_data) > 2000:
-			new_dat = lastel * 1.1
-		else:
-			new_dat = lastel
-		srcFile_groups[srcFile_name].extend([new_dat * (1 + random.uniform(-0.05, 0.05)) for _ in range(additional)])
-
-	filtered_data = {'source_files': {}}
-	for srcFile_name in srcFile_groups:
-		srcFile_data = srcFile_groups[srcFile_name]
+	srcFile_groups = extend_timeseries(srcFile_groups, 5, 1.1, noise=0.05, rng=rng)
 
+	filtered_signals = {}
+	for length, (names, srcFiles_data) in group_timeseries_by_length(srcFile_groups).items():
 		# First upsample the timeseries
 		# (can only detect freq_max < sampling_rate/2 by Nyquist-Shanon sampling Theorem)
-		upsampled_signal = np.interp(
-			np.arange(0, len(srcFile_data), dist_between_samples),
-			np.arange(0, len(srcFile_data), 1),
-			srcFile_data
-		)
+		new_x = np.arange(0, length, dist_between_samples)
+		init_length = len(new_x)
+
+		# Get the frequency bins and the filter for the padded signals
+		padded_length = init_length + int(init_length/2) + (init_length - int(init_length/2))
+		freq_bins = np.fft.fftfreq(padded_length, d=dist_between_samples)
+		freqs_to_remove = (abs(freq_bins) < low_freq) | (abs(freq_bins) > high_freq)
+		freqs_to_remove[freq_bins == 0] = False
+
+		for start, chunk in iter_row_chunks(srcFiles_data, padded_length):
+			upsampled_signals = interp_rows(new_x, chunk)
+
+			# Pad both ends
+			upsampled_signals = np.concatenate(
+				[
+					upsampled_signals[:, 0:int(init_length/2)][:, ::-1],
+					upsampled_signals,
+					upsampled_signals[:, int(init_length/2):][:, ::-1]
+				],
+				axis=1
+			)
 
-		# Pad both ends
-		init_length = len(upsampled_signal)
-		upsampled_signal = np.concatenate(
-			[
-				upsampled_signal[0:int(len(upsampled_signal)/2)][::-1],
-				upsampled_signal,
-				upsampled_signal[int(len(upsampled_signal)/2):][::-1]
-			]
-		)
+			# Get frequency domain signal, and filter it
+			filt_freq_signals = np.fft.fft(upsampled_signals, n=padded_length, axis=1)
+			filt_freq_signals[:, freqs_to_remove] = 0
 
-		# Get frequency domain signal
-		freq_bins =  np.fft.fftfreq(upsampled_signal.size, d=dist_between_samples)
-		freq_signal = np.fft.fft(upsampled_signal, n=len(upsampled_signal))
-
-		# Filter signal
-		filt_freq_signal = freq_signal.copy()
-		zero_freq = copy.deepcopy(filt_freq_signal[freq_bins == 0])
-		filt_freq_signal[(abs(freq_bins) < low_freq)] = 0
-		filt_freq_signal[(abs(freq_bins) > high_freq)] = 0
-		filt_freq_signal[freq_bins == 0] = zero_freq
-
-		# Inverse fourier to get filtered signal
-		start = int(init_length/2)
-		filt_signal = np.fft.ifft(filt_freq_signal, n=len(upsampled_signal)).real
-		filt_signal = filt_signal[start:start+init_length]
-		if downsample:
-			filtered_data['source_files'][srcFile_name] = np.interp(
-				np.arange(0, len(filt_signal), 1/dist_between_samples),
-				np.arange(0, len(filt_signal), 1),
-				filt_signal
-			)
-		else:
-			filtered_data['source_files'][srcFile_name] = filt_signal
+			# Inverse fourier to get filtered signal
+			start_ind = int(init_length/2)
+			filt_signals = np.fft.ifft(filt_freq_signals, n=padded_length, axis=1).real
+			filt_signals = filt_signals[:, start_ind:start_ind+init_length]
+			if downsample:
+				filt_signals = filt_signals[:, ::int(1/dist_between_samples)]
+
+			for name, filt_signal in zip(names[start:start+len(chunk)], filt_signals):
+				filtered_signals[name] = filt_signal
+
+	filtered_data = {'source_files': {}}
+	for srcFile_name in srcFile_groups:
+		filtered_data['source_files'][srcFile_name] = filtered_signals[srcFile_name]
 	return filtered_data
 
 
@@ -285,61 +361,63 @@ def filter_file_variability(json_data_list, remove=False):
 			return new_json_data_list
 
 
+def get_file_type_group(source):
+	# Returns the file type group of a source,
+	# one of FILE_TYPE_GROUPS or 'etc'.
+	source_ftype = source.split('.')[-1]
+	for group, ftypes in FILE_TYPE_GROUPS:
+		if source_ftype in ftypes:
+			return group
+	return 'etc'
+
+
+def split_test_file_types(per_test_data):
+	# Splits a single per-test record into one record per
+	# file type group. The new records share everything but
+	# the `test` name and `source_files` with the original.
+	splits = {group: {} for group, _ in FILE_TYPE_GROUPS}
+	splits['etc'] = {}
+	for source, coverage in per_test_data['source_files'].items():
+		splits[get_file_type_group(source)][source] = coverage
+
+	split_data = []
+	for group in splits:
+		tmp_test = dict(per_test_data)
+		tmp_test['test'] = per_test_data['test'] + '-' + group
+		tmp_test['source_files'] = splits[group]
+		split_data.append(tmp_test)
+	return split_data
+
+
 def split_file_types(json_data_list):
 	# Splits data into c/c++, js, and etc.
 	# groups. The tests are split into their
 	# own tests with the 'test' name append
 	# with either '-c', '-js', or '-etc'
 	# (even if they are empty).
-	c_group = ('cpp', 'h', 'c', 'cc', 'hh', 'tcc')
-	js_group = ('js', 'jsm')
-
 	split_data = []
 	for per_test_data in json_data_list:
-		test_name = per_test_data['test']
-
-		c_split = {}
-		js_split = {}
-		etc_split = {}
-		for source in per_test_data['source_files']:
-			coverage = per_test_data['source_files'][source]
-			source_ftype = source.split('.')[-1]
-			if source_ftype in c_group:
-				c_split[source] = coverage
-			elif source_ftype in js_group:
-				js_split[source] = coverage
-			else:
-				etc_split[source] = coverage
-
-		tmp_test = per_test_data
-		tmp_test['test'] = test_name + '-c'
-		tmp_test['source_files'] = c_split
-		split_data.append(copy.deepcopy(tmp_test))
-
-		tmp_test = per_test_data
-		tmp_test['test'] = test_name + '-js'
-		tmp_test['source_files'] = js_split
-		split_data.append(copy.deepcopy(tmp_test))
-
-		tmp_test = per_test_data
-		tmp_test['test'] = test_name + '-etc'
-		tmp_test['source_files'] = etc_split
-		split_data.append(copy.deepcopy(tmp_test))
-
+		split_data.extend(split_test_file_types(per_test_data))
 	return split_data
 
 
-def group_tests(json_data_list):
+def group_tests(json_data_list, split_types=False):
+	# Groups the per-test records by test name in a single
+	# pass, keeping the order in which the tests were first seen.
+	# If `split_types` is set, the records are also split into
+	# file type groups (see `split_file_types`).
 	test_groups = {}
-	for per_test_data1 in json_data_list:
-		test_name = per_test_data1['test']
-		if test_name in test_groups:
-			continue
+	for per_test_data in json_data_list:
+		if split_types:
+			records = split_test_file_types(per_test_data)
+		else:
+			records = [per_test_data]
 
-		test_groups[test_name] = []
-		for per_test_data2 in json_data_list:
-			if test_name == per_test_data2['test']:
-				test_groups[test_name].append(per_test_data2)
+		for record in records:
+			test_name = record['test']
+			if test_name not in test_groups:
+				test_groups[test_name] = []
+			test_groups[test_name].append(record)
 
 	return test_groups
 
@@ -394,8 +472,15 @@ def find_all_files_in_changesets(cset_n_repo_list):
 def find_files_in_changeset(changeset, repo):
 	req_url = HG_URL + hg_branch(repo) + "raw-rev/" + changeset[:12]
 
-	r = requests.get(req_url)
-	lines = r.content.decode('utf-8').split('\n')
+	def load():
+		import requests
+		return requests.get(rewrite_url(req_url)).content.decode('utf-8')
+
+	context = get_run_context()
+	if context is not None:
+		lines = context.get_response(load, 'http', req_url).split('\n')
+	else:
+		lines = load().split('\n')
 
 	all_files = []
 	new_files = []
@@ -427,97 +512,31 @@ def find_files_in_changeset(changeset, repo):
 	return list(set(new_files)), list(set(removed_files)), list(set(all_files))
 
 
-def get_manifest_lines(manifest_path):
-	with open(manifest_path, 'r') as f:
-		lines = f.readlines()
-	return lines
-
-
-def get_manifest_includes(manifest_lines):
-	includes = []
-	for line in manifest_lines:
-		if '[include:' in line or '[parent:' in line:
-			included_manifest = str(line.split(':')).split(']')[0]
-			includes.append(included_manifest)
-	return includes
-
-
-def find_support_files_modified(files_modified, test, mozcentral_path):
+def find_support_files_modified(files_modified, test, mozcentral_path, cache_dir=None):
 	support_files = []
 
 	if not mozcentral_path:
 		log.info("Mozilla-central source directory path requried.")
 		return support_files
 
-	# Get test directory
-	test_dir, test_name = os.path.split(os.path.join(mozcentral_path, test))
-	if not os.path.exists(test_dir):
-		log.info("Cannot find test directory: " + test_dir)
-		return support_files
-
-	ini_path = None
-	ini_lines = None
-
-	# Get the *.ini file this test is found in
-	for root, _, files in os.walk(test_dir):
-		for file in files:
-			if not file.endswith('.ini'):
-				continue
-			try:
-				# Found a .ini file, check if this contains the test
-				# and get all its included manifests.
-				ini_path = os.path.join(root, file)
-				lines = get_manifest_lines(ini_path)
-
-				for line in lines:
-					if test_name in line:
-						# Found the correct .ini file, stop searching.
-						ini_lines = lines
-						break
-
-				if ini_lines:
-					included_manifests = get_manifest_includes(ini_lines)
-					for manifest in included_manifests:
-						ini_lines.extend(
-							get_manifest_lines(os.path.join(root, manifest))
-						)
-
-					break
-			except Exception as e:
-				log.info("Unexpected error occurred: " + str(e))
-				break
-		if ini_lines:
-			break
-
-	if not ini_lines:
+	# Get the names of all files found in the manifests of
+	# this test (and the manifests they include).
+	manifest_index = get_manifest_index(mozcentral_path, cache_dir=cache_dir)
+	manifest_files = get_test_manifest_files(manifest_index, test)
+	if not manifest_files:
 		log.info("Cannot find manifest files for test: " + test)
 		return support_files
 
-	# Get file names
-	modfiles_names = []
+	# Find modified files that exist in the manifests
 	for file in files_modified:
 		_, name = os.path.split(file)
-		modfiles_names.append(name)
-
-	# Find files that exist in manifest
-	for line in ini_lines:
-		for file in modfiles_names:
-			if file in line:
-				support_files.append(file)
-				break
+		if name in manifest_files:
+			support_files.append(file)
 
-	# Recompute support file names
-	rcmpt_source_files = []
-	for file in support_files:
-		for modfile in files_modified:
-			if file in modfile:
-				rcmpt_source_files.append(modfile)
-				break
+	return support_files
 
-	return rcmpt_source_files
 
-
-def clean_test_name(test_name, mozcentral_path=None, ignore_wpt_existence=False):
+def clean_test_name(test_name, mozcentral_path=None, ignore_wpt_existence=False, path_index=None):
 	test_name = test_name.lstrip('/')
 	if '=' in test_name and test_name.startswith('file:'):
 		# JS test with odd name
@@ -566,20 +585,82 @@ def clean_test_name(test_name, mozcentral_path=None, ignore_wpt_existence=False)
 		test_name = test_name.replace('.html', '.js')
 		for dyn in ['', '.serviceworker', '.sharedworker', '.worker', '.https']:
 			test_name = test_name.replace(dyn, '')
-			if mozcentral_path:
-				if os.path.exists(os.path.join(mozcentral_path, test_name)):
+			if mozcentral_path or path_index is not None:
+				if path_exists(test_name, mozcentral_path, path_index=path_index):
 					break
 
-	if mozcentral_path:
-		if not os.path.exists(os.path.join(mozcentral_path, test_name)):
+	if mozcentral_path or path_index is not None:
+		if not path_exists(test_name, mozcentral_path, path_index=path_index):
 			log.info("missing: %s" % test_name)
 
 	return test_name
 
 
-def clean_test_names(test_names, mozcentral_path=None, ignore_wpt_existence=False, suites=None):
+# Path index used by the `clean_test_names` worker processes,
+# it is only sent once to each of them.
+_worker_path_index = None
+
+
+def _init_clean_test_name_worker(path_index):
+	global _worker_path_index
+	_worker_path_index = path_index
+
+
+def _clean_test_name_worker(test_args):
+	test_name, mozcentral_path, ignore_wpt_existence = test_args
+	return clean_test_name(
+		test_name,
+		mozcentral_path=mozcentral_path,
+		ignore_wpt_existence=ignore_wpt_existence,
+		path_index=_worker_path_index
+	)
+
+
+def clean_test_names(test_names, mozcentral_path=None, ignore_wpt_existence=False, suites=None,
+					 path_index=None, processes=None, cache_dir=None):
+	# When `mozcentral_path` is given, the existence checks are done with
+	# the path index of the checkout (see cocotree.get_path_index). Set
+	# `processes` to clean the names in that many processes.
 	mapping = {}
 
+	if mozcentral_path and path_index is None:
+		path_index = get_path_index(mozcentral_path, cache_dir=cache_dir)
+
+	names_to_clean = []
+	for count, test_name in enumerate(test_names):
+		if suites:
+			suite = suites[count]
+			if ('mochi' in suite or 'xpcshell' in suite):
+				continue
+		names_to_clean.append(test_name)
+	# Each unique name only needs to be cleaned once
+	names_to_clean = list(dict.fromkeys(names_to_clean))
+
+	if processes and processes > 1 and len(names_to_clean) > 1:
+		pool = multiprocessing.Pool(
+			processes, initializer=_init_clean_test_name_worker, initargs=(path_index,)
+		)
+		try:
+			new_names = pool.map(
+				_clean_test_name_worker,
+				[(test_name, mozcentral_path, ignore_wpt_existence) for test_name in names_to_clean],
+				chunksize=max(1, len(names_to_clean) // (processes * 4))
+			)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		new_names = [
+			clean_test_name(
+				test_name,
+				mozcentral_path=mozcentral_path,
+				ignore_wpt_existence=ignore_wpt_existence,
+				path_index=path_index
+			)
+			for test_name in names_to_clean
+		]
+	cleaned = dict(zip(names_to_clean, new_names))
+
 	for count, test_name in enumerate(test_names):
 		new_name = test_name
 
@@ -589,28 +670,44 @@ def clean_test_names(test_names, mozcentral_path=None, ignore_wpt_existence=Fals
 				mapping[test_name] = new_name
 				continue
 
-		new_name = clean_test_name(
-			test_name,
-			mozcentral_path=mozcentral_path,
-			ignore_wpt_existence=ignore_wpt_existence
-		)
-		mapping[test_name] = new_name
+		mapping[test_name] = cleaned[test_name]
 
 	return mapping.values(), mapping
 
 
-def fix_names(test_fixed_entries, test_names):
-	'''Fixes and cleans test names.'''
+def fix_names(test_fixed_entries, test_names, name_table=None):
+	'''
+		Fixes and cleans test names. A `coconames.TestNameTable`
+		can be given to reuse the names that were already cleaned.
+	'''
+	clean = name_table.clean if name_table else clean_test_name
+	short = name_table.short if name_table else format_testname
+
+	# Index the entries by their short names (as they are used for
+	# `test_names`) to avoid comparing every test with every entry.
+	entries_by_name = {}
+	for count, tp in enumerate(test_fixed_entries):
+		_, _, _, test_fixed = tp
+		test_fixed = test_fixed.split('ini:')[-1]
+		for name in (short(test_fixed), short(test_fixed, wpt=False)):
+			if name not in entries_by_name:
+				entries_by_name[name] = count
+
 	new_names = []
 	for test_matcher in test_names:
+		entry = entries_by_name.get(test_matcher)
+		if entry is None:
+			for count, tp in enumerate(test_fixed_entries):
+				_, _, _, test_fixed = tp
+				if test_matcher in test_fixed or test_fixed in test_matcher:
+					entry = count
+					break
+
 		good_name = ''
-		for tp in test_fixed_entries:
-			_, suite, _, test_fixed = tp
-			if test_matcher in test_fixed or test_fixed in test_matcher:
-				good_name = test_fixed
-				good_name = good_name.split('ini:')[-1]
-				if not ('mochi' in suite or 'xpcshell' in suite):
-					good_name = clean_test_name(good_name)
-				break
+		if entry is not None:
+			_, suite, _, test_fixed = test_fixed_entries[entry]
+			good_name = test_fixed.split('ini:')[-1]
+			if not ('mochi' in suite or 'xpcshell' in suite):
+				good_name = clean(good_name)
 		new_names.append(good_name)
 	return new_names
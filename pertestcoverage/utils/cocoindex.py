@@ -0,0 +1,155 @@
+'''
+
+	An index of the per-test reports found in a directory.
+
+	The index maps each report to the test (and suite) it was
+	made for, so that only the reports of the requested tests need
+	to be opened. Reports are re-indexed when their modification
+	time changes, and the index is saved in the cache directory.
+
+	The index can also keep a consolidated store of the formatted
+	reports (one JSON per line in a single file) so that the matching
+	reports can be read back without parsing them again.
+
+'''
+import hashlib
+import json
+import logging
+import os
+
+from .cocoload import file_in_type, get_cache_dir, pattern_find
+
+log = logging.getLogger('pertestcoverage')
+
+
+def get_index_key(*args):
+	return hashlib.sha1(
+		json.dumps(args, sort_keys=True, default=str).encode('utf-8')
+	).hexdigest()
+
+
+def get_report_paths(per_test_dir, filetype):
+	for root, _, files in os.walk(per_test_dir):
+		for file in files:
+			if not file_in_type(file, filetype):
+				continue
+			yield os.path.join(root, file)
+
+
+class ReportIndex:
+	def __init__(self, per_test_dir, filetype, chrome_map=None, cache_dir=None, store_options=None):
+		'''
+			`store_options` are the options used to format the reports that are
+			put in the store, no store is used if they are not given.
+		'''
+		self.per_test_dir = os.path.abspath(per_test_dir)
+		self.filetype = filetype
+
+		index_key = get_index_key(self.per_test_dir, filetype, chrome_map)
+		self.index_path = os.path.join(get_cache_dir('view-index', cache_dir=cache_dir), index_key + '.json')
+		self.reports = self._load_json(self.index_path)
+
+		self.store_path = None
+		self.store_offsets = {}
+		if store_options is not None:
+			store_key = get_index_key(self.per_test_dir, filetype, chrome_map, store_options)
+			store_dir = get_cache_dir('view-store', cache_dir=cache_dir)
+			self.store_path = os.path.join(store_dir, store_key + '.ndjson')
+			self.store_offsets = self._load_json(os.path.join(store_dir, store_key + '.json'))
+			if not os.path.exists(self.store_path):
+				self.store_offsets = {}
+
+	def _load_json(self, path):
+		if not os.path.exists(path):
+			return {}
+		try:
+			with open(path, 'r') as f:
+				return json.load(f)
+		except Exception as e:
+			log.info("Could not load %s, it will be rebuilt: %s" % (path, str(e)))
+			return {}
+
+	def refresh(self, load_report):
+		'''
+			Indexes all the new or modified reports, `load_report` is called
+			with the path of a report and must return its formatted data.
+		'''
+		paths = set(get_report_paths(self.per_test_dir, self.filetype))
+		for path in list(self.reports):
+			if path not in paths:
+				del self.reports[path]
+		for path in list(self.store_offsets):
+			if path not in paths:
+				del self.store_offsets[path]
+
+		num_indexed = 0
+		store = None
+		for path in sorted(paths):
+			mtime = os.path.getmtime(path)
+			indexed = path in self.reports and self.reports[path]['mtime'] == mtime
+			stored = not self.store_path or (
+				path in self.store_offsets and self.store_offsets[path][0] == mtime
+			)
+			if indexed and (stored or 'error' in self.reports[path]):
+				continue
+
+			num_indexed += 1
+			try:
+				report = load_report(path)
+			except Exception as e:
+				self.reports[path] = {'mtime': mtime, 'error': str(e)}
+				continue
+
+			self.reports[path] = {
+				'mtime': mtime,
+				'test': report.get('test', ''),
+				'suite': report.get('suite', '')
+			}
+
+			if self.store_path:
+				if store is None:
+					store = open(self.store_path, 'a')
+				store.seek(0, os.SEEK_END)
+				self.store_offsets[path] = [mtime, store.tell()]
+				store.write(json.dumps(report) + '\n')
+
+		if store is not None:
+			store.close()
+
+		if num_indexed:
+			log.info("Indexed %s new or modified reports." % str(num_indexed))
+			self.save()
+
+	def save(self):
+		with open(self.index_path, 'w') as f:
+			json.dump(self.reports, f)
+		if self.store_path:
+			with open(os.path.splitext(self.store_path)[0] + '.json', 'w') as f:
+				json.dump(self.store_offsets, f)
+
+	def get_num_reports(self):
+		return len([entry for entry in self.reports.values() if 'error' not in entry])
+
+	def get_bad_reports(self):
+		return {
+			path: entry['error']
+			for path, entry in self.reports.items()
+			if 'error' in entry
+		}
+
+	def find(self, test_files):
+		# Returns the paths of the reports for the given tests, reports
+		# with no test name are always returned (like in `view`).
+		return [
+			path for path, entry in sorted(self.reports.items())
+			if 'error' not in entry and (
+				not entry['test'] or pattern_find(entry['test'], test_files)
+			)
+		]
+
+	def load(self, path, load_report):
+		if path in self.store_offsets:
+			with open(self.store_path, 'r') as f:
+				f.seek(self.store_offsets[path][1])
+				return json.loads(f.readline())
+		return load_report(path)
@@ -5,15 +5,21 @@
 from __future__ import print_function, absolute_import
 
 import csv
+import io
 import os
 import gzip
 import json
 import copy
+import datetime
+import hashlib
 import urllib.request
 import logging
 import time
 
 from . import timeout
+from .cococontext import get_run_context
+from .cocoactivedata import query_many
+from .cocoreplay import rewrite_url
 
 RETRY = {"times": 3, "sleep": 5}
 LEVEL_MAP = {
@@ -25,18 +31,40 @@ LEVEL_MAP = {
 ACTIVE_DATA_URL = "http://54.149.21.8/query/"
 HG_URL = "https://hg.mozilla.org/"
 
+# Default location for data cached between runs,
+# it can be changed with the COCO_CACHE_DIR environment variable.
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'coco-tools')
+
 TYPE_PERTEST = "pertestreport"
 TYPE_LCOV = "lcov"
 TYPE_JSDCOV = "jsdcov"
 TYPE_STDPTC = "std-ptc-format"
+TYPE_RESULTS = "results"
 
 TYPE_FILE_WHITELIST = {
 	TYPE_PERTEST: [".json"],
 	TYPE_LCOV: [".info"],
 	TYPE_JSDCOV: [".json"],
-	TYPE_STDPTC: ["std-ptc-format.json"]
+	TYPE_STDPTC: ["std-ptc-format.json"],
+	TYPE_RESULTS: [".json", ".ndjson"]
+}
+
+# Extensions of the compressions that results can be saved with
+RESULTS_COMPRESSION = {
+	'gzip': '.gz',
+	'zstd': '.zst'
 }
 
+# Settings of the FBC-entries queries: the date range is split in windows
+# of FBC_WINDOW_DAYS days, and windows which return FBC_QUERY_LIMIT
+# entries (possibly truncated) are split again. Windows are only cached
+# once they ended FBC_SETTLE_DAYS days ago, since the failures can be
+# classified as fixed by a commit days after the jobs ran.
+FBC_QUERY_LIMIT = 2000
+FBC_WINDOW_DAYS = 7
+FBC_CONCURRENCY = 8
+FBC_SETTLE_DAYS = 14
+
 BRANCH_TO_HGBRANCH = {
 	"mozilla-inbound": "integration/mozilla-inbound/",
     "autoland": "integration/autoland/",
@@ -76,11 +104,174 @@ def open_json(path, filename, fullpath=None):
 	return data
 
 
+def get_cache_dir(name=None, cache_dir=None):
+	# Returns the directory used to cache data between runs
+	# (or its `name` sub-directory), creating it if needed.
+	if not cache_dir:
+		cache_dir = os.environ.get('COCO_CACHE_DIR', CACHE_DIR)
+	if name:
+		cache_dir = os.path.join(cache_dir, name)
+	os.makedirs(cache_dir, exist_ok=True)
+	return cache_dir
+
+
 def save_json(data, path, filename):
 	with open(os.path.join(path, filename), 'w') as f:
 		json.dump(data, f, indent=4)
 
 
+def open_text_file(fullpath, mode='r'):
+	# Opens a (possibly compressed) text file, the
+	# compression is given by the extension.
+	if fullpath.endswith('.gz'):
+		return gzip.open(fullpath, mode + 't', encoding='utf-8')
+	if fullpath.endswith('.zst'):
+		try:
+			import zstandard
+		except ImportError:
+			raise Exception("The `zstandard` package is needed for .zst files: pip install zstandard")
+		if 'w' in mode:
+			stream = zstandard.ZstdCompressor().stream_writer(open(fullpath, 'wb'))
+		else:
+			stream = zstandard.ZstdDecompressor().stream_reader(open(fullpath, 'rb'))
+		return io.TextIOWrapper(stream, encoding='utf-8')
+	return open(fullpath, mode, encoding='utf-8')
+
+
+def get_results_filename(filename, output_format='json', compression=None):
+	'''
+		Returns the name of a results file for the given format
+		and compression, i.e. `x.json` with the `ndjson` format
+		and `gzip` compression becomes `x.ndjson.gz`.
+	'''
+	if output_format == 'ndjson' and filename.endswith('.json'):
+		filename = filename[:-len('.json')] + '.ndjson'
+	if compression in RESULTS_COMPRESSION:
+		extension = RESULTS_COMPRESSION[compression]
+		if not filename.endswith(extension):
+			filename += extension
+	elif compression:
+		raise Exception("Unknown compression %s, must be one of: %s" % (
+			compression, str(list(RESULTS_COMPRESSION))
+		))
+	return filename
+
+
+def strip_results_extension(filename):
+	for extension in RESULTS_COMPRESSION.values():
+		if filename.endswith(extension):
+			filename = filename[:-len(extension)]
+	return os.path.splitext(filename)[0]
+
+
+class NDJSONWriter:
+	'''
+		Writes results to a newline-delimited JSON file as they
+		are produced, instead of building them fully in memory.
+
+		The first line is a header giving the type of the data,
+		a `dict` is written as one [key, value] record per line
+		(with `set`), and a `list` as one value per line (with `add`).
+		The file is compressed if it ends with `.gz` or `.zst`.
+	'''
+	def __init__(self, path, filename, datatype='dict'):
+		if datatype not in ('dict', 'list'):
+			raise Exception("Unknown NDJSON data type: %s" % datatype)
+		self.fullpath = os.path.join(path, filename)
+		self.datatype = datatype
+		self._file = open_text_file(self.fullpath, 'w')
+		self._write({'ptc-ndjson': datatype})
+
+	def _write(self, record):
+		self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+	def set(self, key, value):
+		self._write([key, value])
+
+	def add(self, value):
+		self._write(value)
+
+	def write(self, data):
+		if self.datatype == 'dict':
+			for key, value in data.items():
+				self.set(key, value)
+		else:
+			for value in data:
+				self.add(value)
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+def iter_ndjson(path, filename, fullpath=None):
+	'''
+		Yields the records of an NDJSON file made by `NDJSONWriter`,
+		(key, value) tuples for a `dict`, and values for a `list`.
+	'''
+	if fullpath == None:
+		fullpath = os.path.join(path, filename)
+	with open_text_file(fullpath, 'r') as f:
+		header = json.loads(f.readline())
+		datatype = header['ptc-ndjson'] if isinstance(header, dict) and 'ptc-ndjson' in header else None
+		if datatype is None:
+			raise Exception("Not an NDJSON results file: %s" % fullpath)
+		for line in f:
+			if not line.strip():
+				continue
+			record = json.loads(line)
+			yield tuple(record) if datatype == 'dict' else record
+
+
+def open_ndjson(path, filename, fullpath=None):
+	if fullpath == None:
+		fullpath = os.path.join(path, filename)
+	with open_text_file(fullpath, 'r') as f:
+		header = json.loads(f.readline())
+	if isinstance(header, dict) and header.get('ptc-ndjson') == 'dict':
+		return dict(iter_ndjson(path, filename, fullpath=fullpath))
+	return list(iter_ndjson(path, filename, fullpath=fullpath))
+
+
+def open_results(path, filename, fullpath=None):
+	'''
+		Opens a results file saved with `save_results` (or `save_json`),
+		it can be a JSON or an NDJSON file, and it can be compressed.
+	'''
+	if fullpath == None:
+		fullpath = os.path.join(path, filename)
+	if '.ndjson' in os.path.basename(fullpath):
+		return open_ndjson(path, filename, fullpath=fullpath)
+	with open_text_file(fullpath, 'r') as f:
+		return json.load(f)
+
+
+def save_results(data, path, filename, output_format='json', compression=None):
+	'''
+		Saves results in the given `output_format` ('json' or 'ndjson')
+		with an optional `compression` ('gzip' or 'zstd'). Returns the
+		name of the file, which has the extensions of the format used.
+	'''
+	filename = get_results_filename(filename, output_format, compression)
+	if output_format == 'ndjson':
+		datatype = 'dict' if isinstance(data, dict) else 'list'
+		with NDJSONWriter(path, filename, datatype=datatype) as writer:
+			writer.write(data)
+	elif not compression:
+		save_json(data, path, filename)
+	else:
+		with open_text_file(os.path.join(path, filename), 'w') as f:
+			json.dump(data, f, separators=(',', ':'))
+	return filename
+
+
 def chrome_mapping_rewrite(srcfiles, chrome_map_path, chrome_map_name=None):
 	try:
 		if not chrome_map_name:
@@ -137,30 +328,8 @@ def get_and_check_config(args=None, config=None):
 	return config
 
 
-def get_fixed_by_commit_entries(
-		localdata=False,
-		activedata=False,
-		suites_to_analyze=[],
-		platforms_to_analyze=[],
-		from_date="2018-08-28",
-		local_datasets_list=[],
-		save_fbc_entries=''
-	):
-	'''
-		If local is true, use local_datasets_list to parse
-		the FBC-entries.
-
-		If activedata is true, finds the FBC-entries from active-data
-		and uses from_date, suites_to_analyze, and platforms_to_analyze
-		to filter the data.
-
-		If save_fbc_entries is set to a path, the FBC entries for the active-data
-		based analysis will be saved.
-	'''
-
-	timestr = str(int(time.time()))
-
-	fixed_by_commit_query_json = {
+def get_fbc_query(suites_to_analyze, platforms_to_analyze, date_filters):
+	return {
 		"from": "treeherder",
 		"groupby": [
 			"failure.notes.text",
@@ -168,7 +337,7 @@ def get_fixed_by_commit_entries(
 			"job_log.failure_line.repository",
 			"job_log.failure_line.test"
 		],
-		"limit": 2000,
+		"limit": FBC_QUERY_LIMIT,
 		"where": {
 			"and": [
 				{"in":{"job_log.failure_line.repository":["mozilla-inbound","autoland"]}},
@@ -180,20 +349,219 @@ def get_fixed_by_commit_entries(
 					{"regex":{"job.type.name":".*%s.*" % platform}}
 					for platform in platforms_to_analyze
 				]},
-				{"gte":{"action.start_time":{"date":from_date}}}, # From-date example: "2018-08-28"
 				{"prefix":{"job.type.name":"test-"}},
 				{"regexp":{"failure.classification":".*commit"}},
 				{"exists":"job_log.failure_line.test"}
-			]
+			] + date_filters
 		}
 	}
 
+
+def get_fbc_window_query(suites_to_analyze, platforms_to_analyze, start, end):
+	# Query for the entries in the [start, end) date window
+	return get_fbc_query(suites_to_analyze, platforms_to_analyze, [
+		{"gte":{"action.start_time":{"date":start.isoformat()}}},
+		{"lt":{"action.start_time":{"date":end.isoformat()}}}
+	])
+
+
+def split_date_range(start, end, window_days):
+	windows = []
+	while start < end:
+		windows.append((start, min(end, start + datetime.timedelta(days=window_days))))
+		start = windows[-1][1]
+	return windows
+
+
+def get_fbc_windows(cached_windows, start, end, window_days):
+	'''
+		Returns the cached windows that can be used for the [start, end)
+		date range, and the windows that still need to be queried.
+	'''
+	use_cached = []
+	to_query = []
+	cursor = start
+	for wstart, wend in sorted(cached_windows):
+		if wstart < cursor or wend > end:
+			continue
+		to_query.extend(split_date_range(cursor, wstart, window_days))
+		use_cached.append((wstart, wend))
+		cursor = wend
+	to_query.extend(split_date_range(cursor, end, window_days))
+	return use_cached, to_query
+
+
+def query_fbc_windows(suites_to_analyze, platforms_to_analyze, windows,
+					  concurrency=FBC_CONCURRENCY):
+	'''
+		Queries the entries of each date window concurrently. Windows
+		which reach the query limit are split in two and queried again,
+		so that no entries are dropped. Returns a dict of the entries
+		of each window (including the split ones), and the set of
+		single-day windows that still reached the limit.
+	'''
+	entries = {}
+	truncated = set()
+	while windows:
+		log.info("Querying %s date windows of fixed_by_commit data..." % str(len(windows)))
+		results = query_many(
+			[
+				get_fbc_window_query(suites_to_analyze, platforms_to_analyze, start, end)
+				for start, end in windows
+			],
+			concurrency=concurrency
+		)
+
+		to_split = []
+		for (start, end), data in zip(windows, results):
+			if len(data) < FBC_QUERY_LIMIT:
+				entries[(start, end)] = data
+			elif (end - start).days > 1:
+				middle = start + (end - start) // 2
+				to_split.extend([(start, middle), (middle, end)])
+			else:
+				log.warning(
+					"The fixed_by_commit entries of %s reached the query limit (%s), "
+					"some of them may be missing." % (start.isoformat(), str(FBC_QUERY_LIMIT))
+				)
+				entries[(start, end)] = data
+				truncated.add((start, end))
+		windows = to_split
+	return entries, truncated
+
+
+def get_fbc_cache_path(suites_to_analyze, platforms_to_analyze, cache_dir=None):
+	# One cache file for each set of filters (without the dates)
+	key = json.dumps(get_fbc_query(suites_to_analyze, platforms_to_analyze, []), sort_keys=True)
+	return os.path.join(
+		get_cache_dir('fbc_entries', cache_dir=cache_dir),
+		hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+	)
+
+
+def load_fbc_cache(cache_path):
+	if not os.path.exists(cache_path):
+		return {}
+	try:
+		windows = open_json(None, None, fullpath=cache_path)['windows']
+	except (ValueError, KeyError) as e:
+		log.info("Ignoring the bad FBC-entries cache at %s: %s" % (cache_path, str(e)))
+		return {}
+	return {
+		(datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)): data
+		for start, end, data in windows
+	}
+
+
+def save_fbc_cache(cache_path, cached):
+	tmp_path = cache_path + '.tmp'
+	with open(tmp_path, 'w') as f:
+		json.dump({
+			'windows': [
+				[start.isoformat(), end.isoformat(), data]
+				for (start, end), data in sorted(cached.items())
+			]
+		}, f)
+	os.replace(tmp_path, cache_path)
+
+
+def query_fixed_by_commit_data(suites_to_analyze, platforms_to_analyze, from_date,
+							   to_date=None, window_days=FBC_WINDOW_DAYS,
+							   concurrency=FBC_CONCURRENCY, cache_dir=None):
+	'''
+		Returns the FBC-entries rows from active-data between from_date
+		and to_date (excluded, defaults to the end of today).
+
+		The date range is queried in concurrent windows and the windows
+		which ended more than FBC_SETTLE_DAYS days ago are cached, so that
+		extending the date range only queries the new dates.
+	'''
+	try:
+		start = datetime.date.fromisoformat(from_date)
+		end = datetime.date.fromisoformat(to_date) if to_date else None
+	except (TypeError, ValueError):
+		# Relative dates (e.g. "today-week") are left to active-data
+		log.info("Querying all fixed_by_commit data since %s at once..." % str(from_date))
+		date_filters = [{"gte":{"action.start_time":{"date":from_date}}}]
+		if to_date:
+			date_filters.append({"lt":{"action.start_time":{"date":to_date}}})
+		return query_activedata(get_fbc_query(suites_to_analyze, platforms_to_analyze, date_filters))
+
+	today = datetime.date.today()
+	if end is None:
+		end = today + datetime.timedelta(days=1)
+
+	# Recent windows can still get new entries, they are queried again
+	settled = today - datetime.timedelta(days=FBC_SETTLE_DAYS)
+	cache_path = get_fbc_cache_path(suites_to_analyze, platforms_to_analyze, cache_dir=cache_dir)
+	cached = {
+		window: data for window, data in load_fbc_cache(cache_path).items()
+		if window[1] <= settled
+	}
+	use_cached, to_query = get_fbc_windows(cached, start, end, window_days)
+	log.info(
+		"Using %s cached date windows of fixed_by_commit data, querying %s." %
+		(str(len(use_cached)), str(len(to_query)))
+	)
+
+	queried, truncated = query_fbc_windows(
+		suites_to_analyze, platforms_to_analyze, to_query, concurrency=concurrency
+	)
+
+	# Truncated windows are incomplete, they aren't cached
+	new_windows = {
+		window: data for window, data in queried.items()
+		if window[1] <= settled and window not in truncated
+	}
+	if new_windows:
+		cached.update(new_windows)
+		save_fbc_cache(cache_path, cached)
+
+	all_windows = {window: cached[window] for window in use_cached}
+	all_windows.update(queried)
+	return [entry for window in sorted(all_windows) for entry in all_windows[window]]
+
+
+def get_fixed_by_commit_entries(
+		localdata=False,
+		activedata=False,
+		suites_to_analyze=[],
+		platforms_to_analyze=[],
+		from_date="2018-08-28",
+		local_datasets_list=[],
+		save_fbc_entries='',
+		to_date=None,
+		window_days=FBC_WINDOW_DAYS,
+		concurrency=FBC_CONCURRENCY,
+		cache_dir=None
+	):
+	'''
+		If local is true, use local_datasets_list to parse
+		the FBC-entries.
+
+		If activedata is true, finds the FBC-entries from active-data
+		and uses from_date (and to_date), suites_to_analyze, and
+		platforms_to_analyze to filter the data. See
+		`query_fixed_by_commit_data` for the other arguments.
+
+		If save_fbc_entries is set to a path, the FBC entries for the active-data
+		based analysis will be saved.
+	'''
+
+	timestr = str(int(time.time()))
+
 	# Gather changesets
 	changesets = []
 	if activedata:
 		log.info("Querying active data for all fixed_by_commit data...")
-		all_fcommit_data = query_activedata(fixed_by_commit_query_json)
+		all_fcommit_data = query_fixed_by_commit_data(
+			suites_to_analyze, platforms_to_analyze, from_date, to_date=to_date,
+			window_days=window_days, concurrency=concurrency, cache_dir=cache_dir
+		)
 		log.debug("All fixed_by_commit data: \n %s" % str(all_fcommit_data))
+
+		# The same entries can be found in several windows
+		seen = set()
 		for entry in all_fcommit_data:
 			bad_entry = False
 			for el in entry:
@@ -201,7 +569,11 @@ def get_fixed_by_commit_entries(
 					bad_entry = True
 			if bad_entry:
 				continue
-			changesets.append(tuple(entry[0:4]))
+			entry = tuple(entry[0:4])
+			if entry in seen:
+				continue
+			seen.add(entry)
+			changesets.append(entry)
 		if save_fbc_entries:
 			with open(os.path.join(save_fbc_entries, timestr + '_fixed_by_commit_entries.csv'), 'w') as f:
 				def format_tp(tp):
@@ -226,7 +598,12 @@ def get_fixed_by_commit_entries(
 	return changesets
 
 
-def get_changesets(hg_analysisbranch, startrevision, numpatches):
+def get_changesets(hg_analysisbranch, startrevision, numpatches, use_pushlog=False, cache_dir=None):
+	if use_pushlog:
+		# Fetched concurrently from the pushlog, and cached
+		from .cocopush import PushLog
+		return PushLog(hg_analysisbranch, cache_dir=cache_dir).get_changesets(startrevision, numpatches)
+
 	changesets = []
 	currrev = startrevision
 
@@ -270,19 +647,20 @@ def get_coverage_tests(
 			{"gt":{"source.file.total_covered":0}}
 		])
 
-	all_tests = []
+	queries = []
 	for rev, branch in rev_n_branch_list:
 		all_test_query_json['where']['and'][0]['eq']['repo.changeset.id12'] = rev
 		all_test_query_json['where']['and'][1]['eq']['repo.branch.name'] = branch
+		queries.append(copy.deepcopy(all_test_query_json))
 
-		try:
-			all_tests = list(
-				set(all_tests) | set(
-					[testchunk[0] for testchunk in query_activedata(all_test_query_json)]
-				)
-			)
-		except Exception as e:
-			log.info("Failed to query for covered tests:" + str(e))
+	all_tests = []
+	for data in query_many(queries, return_exceptions=True):
+		if isinstance(data, Exception):
+			log.info("Failed to query for covered tests:" + str(data))
+			continue
+		all_tests = list(
+			set(all_tests) | set([testchunk[0] for testchunk in data])
+		)
 
 	return all_tests
 
@@ -433,6 +811,38 @@ def get_all_stdptc_data(stdptcdir='', chrome_map_path=''):
 	return json_data
 
 
+def get_rawdata(location_entry):
+	# Opens the dataset of one `pertest_rawdata_folders` entry.
+	if location_entry['type'] == TYPE_PERTEST:
+		return get_all_pertest_data(
+			location_entry['location'], chrome_map_path=location_entry['chrome-map']
+		)
+	elif location_entry['type'] == TYPE_STDPTC:
+		return get_all_stdptc_data(
+			location_entry['location'], chrome_map_path=location_entry['chrome-map']
+		)
+	log.info("Unknown data type %s, skipping it." % location_entry['type'])
+	return []
+
+
+def get_all_rawdata(pertest_rawdata_folders):
+	'''
+		Opens all the datasets listed in a `pertest_rawdata_folders`
+		config entry. Each entry must contain a `location`, a `type`,
+		and a `chrome-map`. Datasets are only opened once per run
+		when a run context is active.
+	'''
+	context = get_run_context()
+	jsondatalist = []
+	for location_entry in pertest_rawdata_folders:
+		log.info("Opening data from %s" % location_entry['location'])
+		if context is not None:
+			jsondatalist.extend(context.get_dataset(location_entry, get_rawdata))
+		else:
+			jsondatalist.extend(get_rawdata(location_entry))
+	return jsondatalist
+
+
 def get_per_test_scored_file(path, filename, get_hits=False, 
 							 return_test_name=False, score_range=None,
 							 ignore_uniques=True, full_path=None
@@ -601,42 +1011,26 @@ def rununtiltimeout(func, **kwargs):
 
 
 def get_http_json(url):
-	data = None
-
 	@timeout(120)
 	def get_data(url=None):
-		with urllib.request.urlopen(url) as urllib_url:
-			data = json.loads(urllib_url.read().decode())
+		with urllib.request.urlopen(rewrite_url(url)) as urllib_url:
+			data = urllib_url.read().decode()
 		return data
 
-	data = rununtiltimeout(get_data, url=url)
-	return data
+	def load():
+		return rununtiltimeout(get_data, url=url)
 
+	context = get_run_context()
+	if context is not None:
+		return context.get_json(load, 'http', url)
+	return json.loads(load())
 
-def query_activedata(query_json, debug=False, active_data_url=None):
-	if not active_data_url:
-		active_data_url = "http://activedata.allizom.org/query"
-
-	@timeout(120)
-	def get_data(active_data_url=None, query_json=None):
-		req = urllib.request.Request(active_data_url)
-		req.add_header('Content-Type', 'application/json')
-		jsondata = json.dumps(query_json)
-
-		jsondataasbytes = jsondata.encode('utf-8')
-		req.add_header('Content-Length', len(jsondataasbytes))
-
-		log.debug("Querying Active-data with: " + str(query_json))
-		response = urllib.request.urlopen(req, jsondataasbytes)
-		log.debug("Status:" + str(response.getcode()))
-		return response
 
-	response = rununtiltimeout(
-		get_data, active_data_url=active_data_url, query_json=query_json
-	)
-
-	data = json.loads(response.read().decode('utf8').replace("'", '"'))['data']
-	return data
+def query_activedata(query_json, debug=False, active_data_url=None):
+	# Made with the asyncio client, so that the query is cancelled when it
+	# times out and failures are retried with a backoff. The response is
+	# kept in the run context when there is one.
+	return query_many([query_json], active_data_url=active_data_url)[0]
 
 
 def format_generic_activedata_coverage_response(response):
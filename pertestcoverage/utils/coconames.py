@@ -0,0 +1,107 @@
+'''
+
+	A lookup table of normalised test names.
+
+	Test names found in the fixed-by-commit entries are cleaned
+	(`cocofilter.clean_test_name`) and shortened (`cocoload.format_testname`)
+	many times in a run. The table computes each of those once per
+	raw test name and is saved in the cache directory so that it can
+	be reused by the next runs, and by other analysis types. The saved
+	table is discarded when the normalisation code changes.
+
+'''
+import hashlib
+import inspect
+import json
+import logging
+import os
+
+from .cocoload import format_testname, get_cache_dir
+from .cocofilter import clean_test_name
+
+log = logging.getLogger('pertestcoverage')
+
+TEST_NAME_TABLE = 'test_names.json'
+
+# Increase this when the format of the table changes
+TEST_NAME_TABLE_VERSION = 1
+
+_test_name_tables = {}
+
+
+def get_table_version():
+	# Tables saved with a different version of the functions
+	# that normalise the names can't be reused.
+	version = str(TEST_NAME_TABLE_VERSION)
+	for func in (clean_test_name, format_testname):
+		try:
+			version += inspect.getsource(func)
+		except (OSError, TypeError):
+			version += func.__name__
+	return hashlib.sha1(version.encode('utf-8')).hexdigest()
+
+
+class TestNameTable:
+	def __init__(self, path=None):
+		self.path = path
+		# Maps raw names to [clean name, short name, short name (wpt=False)]
+		self.names = {}
+		self.version = get_table_version()
+		self._modified = False
+
+		if path and os.path.exists(path):
+			try:
+				with open(path, 'r') as f:
+					data = json.load(f)
+				if isinstance(data, dict) and data.get('version') == self.version:
+					self.names = data['names']
+				else:
+					log.info("Discarding the outdated test name table %s" % path)
+			except Exception as e:
+				log.info("Could not load the test name table %s: %s" % (path, str(e)))
+
+	def __len__(self):
+		return len(self.names)
+
+	def _get_names(self, test_name):
+		if test_name not in self.names:
+			self.names[test_name] = [
+				clean_test_name(test_name),
+				format_testname(test_name),
+				format_testname(test_name, wpt=False)
+			]
+			self._modified = True
+		return self.names[test_name]
+
+	def clean(self, test_name):
+		return self._get_names(test_name)[0]
+
+	def short(self, test_name, wpt=True):
+		if wpt:
+			return self._get_names(test_name)[1]
+		return self._get_names(test_name)[2]
+
+	def add_entries(self, test_fixed_entries):
+		# Computes the names of all the tests found
+		# in the given fixed-by-commit entries.
+		for tp in test_fixed_entries:
+			test_fixed = tp[-2] if len(tp) > 4 else tp[-1]
+			self._get_names(test_fixed.split('ini:')[-1])
+
+	def save(self):
+		if not self.path or not self._modified:
+			return
+		tmp_path = self.path + '.tmp'
+		with open(tmp_path, 'w') as f:
+			json.dump({'version': self.version, 'names': self.names}, f)
+		os.replace(tmp_path, self.path)
+		self._modified = False
+
+
+def get_test_name_table(cache_dir=None):
+	# Returns the persisted test name table, it's shared
+	# by everything that uses it in the same run.
+	path = os.path.join(get_cache_dir(cache_dir=cache_dir), TEST_NAME_TABLE)
+	if path not in _test_name_tables:
+		_test_name_tables[path] = TestNameTable(path=path)
+	return _test_name_tables[path]
@@ -0,0 +1,71 @@
+'''
+
+	Lazy access to matplotlib's pyplot.
+
+	pyplot (and the GUI toolkit of its backend) is only imported when
+	a figure is made, so that analysis types which don't plot anything
+	don't pay for it. In headless mode a non-interactive backend is
+	used, and `show_figures` saves the open figures to files instead
+	of blocking until they are closed.
+
+'''
+import logging
+import os
+import time
+
+log = logging.getLogger('pertestcoverage')
+
+HEADLESS_BACKEND = 'Agg'
+FIGURE_FORMAT = 'png'
+
+_settings = {
+	'headless': False,
+	'figures_dir': None
+}
+
+
+def set_headless(headless=True, figures_dir=None):
+	# Must be called before the first figure is made.
+	_settings['headless'] = headless
+	_settings['figures_dir'] = figures_dir
+
+
+def is_headless():
+	return _settings['headless'] or bool(os.environ.get('PTC_HEADLESS'))
+
+
+def get_pyplot():
+	import matplotlib
+	if is_headless():
+		matplotlib.use(HEADLESS_BACKEND)
+	from matplotlib import pyplot as plt
+	return plt
+
+
+def show_figures(name='figure', outputdir=None):
+	'''
+		Shows all the open figures, or in headless mode, saves them
+		to the `figures_dir` given to `set_headless` (or `outputdir`, or
+		the current directory) as <time>_<name>_<figure number>.png.
+	'''
+	plt = get_pyplot()
+	if not is_headless():
+		plt.show()
+		return []
+
+	figures_dir = _settings['figures_dir'] or outputdir or os.getcwd()
+	if not os.path.exists(figures_dir):
+		os.makedirs(figures_dir)
+
+	timestr = str(int(time.time()))
+	saved = []
+	for num in plt.get_fignums():
+		path = os.path.join(
+			figures_dir, '%s_%s_%s.%s' % (timestr, name, str(num), FIGURE_FORMAT)
+		)
+		plt.figure(num).savefig(path)
+		saved.append(path)
+		log.info("Saved figure to: " + path)
+
+	plt.close('all')
+	return saved
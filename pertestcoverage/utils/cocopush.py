@@ -0,0 +1,227 @@
+'''
+
+	Gets changesets from the hg pushlog (`json-pushes`).
+
+	Pushes are requested in windows of push IDs which are fetched
+	concurrently, instead of walking `json-log` one page at a time.
+	Pushes never change once they are made, so the changesets of each
+	push (and the changeset -> push mapping) are cached on disk and
+	reused by the next runs.
+
+'''
+import json
+import logging
+import math
+import os
+import urllib.parse
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .cocoload import get_cache_dir, get_http_json, HG_URL
+
+log = logging.getLogger('pertestcoverage')
+
+# Number of pushes requested at once, and the
+# number of requests that are made concurrently.
+PUSHLOG_WINDOW = 100
+PUSHLOG_CONCURRENCY = 8
+
+
+class PushLog:
+	def __init__(self, hg_analysisbranch, cache_dir=None,
+				 window=PUSHLOG_WINDOW, concurrency=PUSHLOG_CONCURRENCY):
+		self.hg_analysisbranch = hg_analysisbranch.strip('/')
+		self.window = window
+		self.concurrency = concurrency
+		self.cache_path = os.path.join(
+			get_cache_dir('pushlog', cache_dir=cache_dir),
+			self.hg_analysisbranch.replace('/', '_') + '.json'
+		)
+
+		# Push ID -> changesets in the push (oldest first)
+		self.pushes = {}
+		self.changeset_to_push = {}
+		self._modified = False
+		self.load()
+
+	def load(self):
+		if not os.path.exists(self.cache_path):
+			return
+		try:
+			with open(self.cache_path, 'r') as f:
+				pushes = json.load(f)['pushes']
+		except (ValueError, KeyError) as e:
+			log.info("Ignoring the bad pushlog cache at %s: %s" % (self.cache_path, str(e)))
+			return
+		for pushid, changesets in pushes.items():
+			self.add_push(int(pushid), changesets, modified=False)
+
+	def save(self):
+		if not self._modified:
+			return
+		tmp_path = self.cache_path + '.tmp'
+		with open(tmp_path, 'w') as f:
+			json.dump({'pushes': self.pushes}, f, separators=(',', ':'))
+		os.replace(tmp_path, self.cache_path)
+		self._modified = False
+
+	def add_push(self, pushid, changesets, modified=True):
+		changesets = [changeset[:12] for changeset in changesets]
+		self.pushes[pushid] = changesets
+		for changeset in changesets:
+			self.changeset_to_push[changeset] = pushid
+		self._modified = self._modified or modified
+
+	def get_pushes_url(self, **params):
+		params['version'] = 2
+		return HG_URL + self.hg_analysisbranch + "/json-pushes?" + urllib.parse.urlencode(params)
+
+	def resolve_revision(self, revision):
+		'''
+			Returns the changeset (12 characters) of a revision given
+			as a hash, a hash prefix, or a symbolic name (e.g. `tip`).
+		'''
+		if revision[:12] in self.changeset_to_push:
+			return revision[:12]
+
+		data = get_http_json(self.get_pushes_url(changeset=revision))
+		matches = set()
+		for pushid, push in data['pushes'].items():
+			self.add_push(int(pushid), push['changesets'])
+			matches.update(
+				changeset[:12] for changeset in push['changesets']
+				if changeset.startswith(revision.lower())
+			)
+		if len(matches) == 1:
+			return matches.pop()
+
+		# Symbolic revisions don't match any of the changesets
+		data = get_http_json(HG_URL + self.hg_analysisbranch + "/json-rev/" + revision)
+		return data['node'][:12]
+
+	def get_push_id(self, changeset):
+		changeset = changeset[:12]
+		if changeset not in self.changeset_to_push:
+			data = get_http_json(self.get_pushes_url(changeset=changeset))
+			for pushid, push in data['pushes'].items():
+				self.add_push(int(pushid), push['changesets'])
+		return self.changeset_to_push[changeset]
+
+	def fetch_pushes(self, startid, endid):
+		# Gets the pushes with IDs in (startid, endid]
+		data = get_http_json(self.get_pushes_url(startID=startid, endID=endid))
+		return startid, endid, data['pushes']
+
+	def fetch_windows(self, windows):
+		with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+			for startid, endid, pushes in executor.map(lambda w: self.fetch_pushes(*w), windows):
+				for pushid in range(startid + 1, endid + 1):
+					# Pushes without changesets aren't always returned
+					push = pushes.get(str(pushid), {'changesets': []})
+					self.add_push(pushid, push['changesets'])
+
+	def get_missing_windows(self, endid, numwindows):
+		# The next `numwindows` windows of pushes below
+		# `endid`, without those that are already cached.
+		windows = []
+		for _ in range(numwindows):
+			if endid <= 0:
+				break
+			startid = max(0, endid - self.window)
+			if any(pushid not in self.pushes for pushid in range(startid + 1, endid + 1)):
+				windows.append((startid, endid))
+			endid = startid
+		return windows
+
+	def get_changesets(self, startrevision, numpatches):
+		'''
+			Returns `numpatches` changesets starting from `startrevision`
+			and going back in the history, like `cocoload.get_changesets`.
+		'''
+		startrevision = self.resolve_revision(startrevision)
+		pushid = self.get_push_id(startrevision)
+		push = list(reversed(self.pushes[pushid]))
+		changesets = push[push.index(startrevision):]
+
+		nextid = pushid - 1
+		while True:
+			# Use the cached pushes until one is missing
+			while nextid > 0 and nextid in self.pushes and len(changesets) < numpatches:
+				changesets.extend(reversed(self.pushes[nextid]))
+				nextid -= 1
+			if len(changesets) >= numpatches or nextid <= 0:
+				break
+
+			# Estimate the number of windows needed from the pushes seen so far
+			numchangesets = sum(len(self.pushes[pid]) for pid in self.pushes)
+			per_push = max(1, numchangesets / max(1, len(self.pushes)))
+			numwindows = math.ceil((numpatches - len(changesets)) / (per_push * self.window))
+
+			windows = self.get_missing_windows(nextid, min(self.concurrency, max(1, numwindows)))
+			log.info("Fetching %s windows of pushes below push %s..." % (str(len(windows)), str(nextid)))
+			self.fetch_windows(windows)
+
+		self.save()
+		return changesets[:numpatches]
+
+
+class PushIndex:
+	'''
+		Groups changesets (newest first, as returned by `get_changesets`)
+		into pushes. A push starts at each changeset in `pushheads` (the
+		changesets that have their own test runs) and contains the
+		changesets that follow it until the next push head. Pushes are
+		identified by their head changeset.
+
+		The union of the tests added for the changesets of a push is kept
+		up to date as tests are added with `add_tests`.
+	'''
+	def __init__(self, changesets=None, pushheads=None):
+		# Changeset -> push ID, and push ID -> changesets (in the given order)
+		self.changeset_to_push = {}
+		self.pushes = {}
+		# Name -> push ID -> set of tests
+		self.tests = {}
+		self._last_push = None
+		if changesets:
+			self.add_changesets(changesets, pushheads=pushheads)
+
+	def __contains__(self, changeset):
+		return changeset in self.changeset_to_push
+
+	def add_changeset(self, changeset, pushhead=False):
+		if changeset in self.changeset_to_push:
+			return self.changeset_to_push[changeset]
+		if pushhead or self._last_push is None:
+			self._last_push = changeset
+			self.pushes[changeset] = []
+		self.pushes[self._last_push].append(changeset)
+		self.changeset_to_push[changeset] = self._last_push
+		return self._last_push
+
+	def add_changesets(self, changesets, pushheads=None):
+		pushheads = pushheads or ()
+		for changeset in changesets:
+			self.add_changeset(changeset, pushhead=changeset in pushheads)
+
+	def get_push(self, changeset):
+		return self.changeset_to_push[changeset]
+
+	def is_push_head(self, changeset):
+		return changeset in self.pushes
+
+	def get_push_changesets(self, changeset):
+		return self.pushes[self.changeset_to_push[changeset]]
+
+	def add_tests(self, changeset, tests, name='tests'):
+		'''
+			Adds the tests of a changeset to the union of the tests of
+			its push, and returns the union. The union is kept between
+			calls instead of being rebuilt from all the changesets.
+		'''
+		pushtests = self.tests.setdefault(name, {}).setdefault(self.get_push(changeset), set())
+		pushtests.update(tests)
+		return pushtests
+
+	def get_tests(self, changeset, name='tests'):
+		return self.tests.get(name, {}).get(self.get_push(changeset), set())
@@ -0,0 +1,285 @@
+'''
+
+	Records and replays the responses of the services used by the
+	analysis types (ActiveData, hg, and Taskcluster), so that they can
+	be run and timed offline.
+
+	A local HTTP server stands in for all the services: while it is
+	running, `rewrite_url` sends the requests to it instead, e.g.:
+
+		https://hg.mozilla.org/mozilla-central/json-log/tip ->
+		http://127.0.0.1:<port>/https/hg.mozilla.org/mozilla-central/json-log/tip
+
+	In `record` mode, the server forwards the requests it doesn't have a
+	response for to the service, and saves the response in the fixture
+	archive (a zip file). In `replay` mode, only the archive is used, and
+	`latency` (seconds per response) and `bandwidth` (bytes per second)
+	can be set to simulate the network. It's selected with the `network`
+	section of the configs:
+
+		network:
+			mode: 'replay'
+			archive: '/path/to/fixtures.zip'
+			latency: 0.1
+			bandwidth: 1000000
+
+'''
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger('pertestcoverage')
+
+NETWORK_MODES = ('live', 'record', 'replay')
+
+# Size of the chunks sent when the bandwidth is limited
+CHUNK_SIZE = 16384
+
+_active_network = {'server': None, 'settings': None}
+
+
+def canonicalize_body(body):
+	# The same JSON query can be sent with its keys in any order
+	# (depending on the client), so they are sorted before hashing.
+	if not body:
+		return b''
+	try:
+		return json.dumps(json.loads(body.decode('utf-8')), sort_keys=True).encode('utf-8')
+	except ValueError:
+		return body
+
+
+def get_request_key(method, url, body=b''):
+	body = canonicalize_body(body)
+	request = method + ' ' + url + ' ' + hashlib.sha1(body or b'').hexdigest()
+	return hashlib.sha1(request.encode('utf-8')).hexdigest()
+
+
+class FixtureArchive:
+	'''
+		Zip file with the recorded responses. Each response is stored
+		as `<key>.body` along with a `<key>.json` giving the request and
+		the status of the response.
+	'''
+	def __init__(self, path, mode='replay'):
+		self.path = path
+		self.mode = mode
+		self.entries = {}
+		self._lock = threading.Lock()
+		self._zip = None
+
+		if os.path.exists(path):
+			with zipfile.ZipFile(path, 'r') as z:
+				for name in z.namelist():
+					if name.endswith('.json'):
+						self.entries[name[:-len('.json')]] = json.loads(z.read(name).decode('utf-8'))
+		elif mode == 'replay':
+			raise Exception("Cannot find the fixture archive to replay: %s" % path)
+
+		if mode == 'record':
+			archive_dir = os.path.dirname(os.path.abspath(path))
+			os.makedirs(archive_dir, exist_ok=True)
+			self._zip = zipfile.ZipFile(path, 'a', compression=zipfile.ZIP_DEFLATED)
+		else:
+			self._zip = zipfile.ZipFile(path, 'r')
+
+	def get(self, key):
+		# Returns the entry and body of a response, or None
+		if key not in self.entries:
+			return None
+		with self._lock:
+			body = self._zip.read(key + '.body')
+		return self.entries[key], body
+
+	def add(self, key, entry, body):
+		with self._lock:
+			if key in self.entries:
+				return
+			self._zip.writestr(key + '.body', body)
+			self._zip.writestr(key + '.json', json.dumps(entry))
+			self.entries[key] = entry
+
+	def close(self):
+		with self._lock:
+			if self._zip is not None:
+				self._zip.close()
+				self._zip = None
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+	def log_message(self, format, *args):
+		log.debug("Replay server: " + format % args)
+
+	def get_upstream_url(self):
+		scheme, _, rest = self.path.lstrip('/').partition('/')
+		return scheme + '://' + rest
+
+	def fetch_upstream(self, url, body):
+		req = urllib.request.Request(url, data=body or None, method=self.command)
+		if self.headers.get('Content-Type'):
+			req.add_header('Content-Type', self.headers['Content-Type'])
+		try:
+			with urllib.request.urlopen(req, timeout=self.server.upstream_timeout) as response:
+				return response.getcode(), response.headers.get('Content-Type'), response.read()
+		except urllib.error.HTTPError as e:
+			return e.code, e.headers.get('Content-Type'), e.read()
+
+	def send_body(self, status, content_type, body):
+		self.send_response(status)
+		self.send_header('Content-Type', content_type or 'application/octet-stream')
+		self.send_header('Content-Length', str(len(body)))
+		self.send_header('Connection', 'close')
+		self.end_headers()
+		if self.command == 'HEAD':
+			return
+
+		bandwidth = self.server.bandwidth
+		if not bandwidth:
+			self.wfile.write(body)
+			return
+		for start in range(0, len(body), CHUNK_SIZE):
+			chunk = body[start:start + CHUNK_SIZE]
+			self.wfile.write(chunk)
+			time.sleep(len(chunk) / bandwidth)
+
+	def handle_request(self):
+		url = self.get_upstream_url()
+		length = int(self.headers.get('Content-Length') or 0)
+		body = self.rfile.read(length) if length else b''
+		key = get_request_key(self.command, url, body)
+		archive = self.server.archive
+
+		recorded = archive.get(key)
+		if recorded is not None:
+			entry, response = recorded
+			if self.server.latency:
+				time.sleep(self.server.latency)
+			self.send_body(entry['status'], entry['content_type'], response)
+			return
+
+		if archive.mode != 'record':
+			log.info("No recorded response for: %s %s" % (self.command, url))
+			self.send_body(404, 'text/plain', b'No recorded response')
+			return
+
+		try:
+			status, content_type, response = self.fetch_upstream(url, body)
+		except Exception as e:
+			log.debug("Error while recording %s: %s" % (url, str(e)))
+			self.send_body(502, 'text/plain', str(e).encode('utf-8'))
+			return
+
+		# Server errors are not recorded, the clients retry them
+		if status < 500 and status != 429:
+			archive.add(key, {
+				'method': self.command,
+				'url': url,
+				'status': status,
+				'content_type': content_type
+			}, response)
+		self.send_body(status, content_type, response)
+
+	def do_GET(self):
+		self.handle_request()
+
+	def do_POST(self):
+		self.handle_request()
+
+	def do_HEAD(self):
+		self.handle_request()
+
+
+class ReplayServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, archive, host='127.0.0.1', port=0, latency=0,
+				 bandwidth=None, upstream_timeout=120):
+		ThreadingHTTPServer.__init__(self, (host, port), ReplayHandler)
+		self.archive = archive
+		self.latency = latency
+		self.bandwidth = bandwidth
+		self.upstream_timeout = upstream_timeout
+		self._thread = None
+
+	@property
+	def url(self):
+		host, port = self.server_address[:2]
+		return "http://%s:%s/" % (host, str(port))
+
+	def start(self):
+		self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+		self.archive.close()
+
+
+def rewrite_url(url):
+	'''
+		Returns the URL to use for a request, it's the stand-in
+		server's URL for it when one is running.
+	'''
+	server = _active_network['server']
+	if server is None or url.startswith(server.url):
+		return url
+	scheme, sep, rest = url.partition('://')
+	if not sep:
+		return url
+	return server.url + scheme + '/' + rest
+
+
+def start_network(settings):
+	'''
+		Starts the stand-in server with the settings of a
+		`network` config section, if it isn't already running.
+	'''
+	if not settings:
+		return None
+	mode = settings['mode'] if 'mode' in settings else 'live'
+	if mode not in NETWORK_MODES:
+		raise Exception("Unknown network mode `%s`, expected one of: %s" % (mode, str(NETWORK_MODES)))
+	if _active_network['server'] is not None:
+		if _active_network['settings'] != settings:
+			log.info("The network is already being recorded or replayed, ignoring the new settings.")
+		return _active_network['server']
+	if mode == 'live':
+		return None
+	if 'archive' not in settings:
+		raise Exception("Missing `archive` in the `network` settings.")
+
+	archive = FixtureArchive(settings['archive'], mode=mode)
+	server = ReplayServer(
+		archive,
+		port=settings['port'] if 'port' in settings else 0,
+		latency=settings['latency'] if 'latency' in settings else 0,
+		bandwidth=settings['bandwidth'] if 'bandwidth' in settings else None
+	).start()
+	log.info(
+		"%s network responses with %s (%s recorded responses)." %
+		('Recording' if mode == 'record' else 'Replaying', settings['archive'], str(len(archive.entries)))
+	)
+
+	_active_network['server'] = server
+	_active_network['settings'] = settings
+	atexit.register(stop_network)
+	return server
+
+
+def stop_network():
+	server = _active_network['server']
+	_active_network['server'] = None
+	_active_network['settings'] = None
+	if server is not None:
+		server.stop()
@@ -0,0 +1,277 @@
+'''
+
+	Indices of a local mozilla-central checkout.
+
+	The manifest index maps tests to the manifests that list
+	them, and manifests to the names of the files they reference
+	(following [include:] and [parent:] sections), so that support
+	files can be found without walking the source tree.
+
+	The path index is the set of all the (relative) file and
+	directory paths in the checkout, it is used to check if paths
+	exist without hitting the file system.
+
+	Indices are saved in the cache directory and keyed by the revision
+	the checkout is at, they are only rebuilt when the checkout is updated.
+
+'''
+import gzip
+import json
+import logging
+import os
+import re
+
+from .cocoload import get_cache_dir
+
+log = logging.getLogger('pertestcoverage')
+
+IGNORED_DIRS = ('.hg', '.git', 'node_modules')
+MANIFEST_SECTION = re.compile(r'^\s*\[(.+)\]\s*$')
+MANIFEST_INCLUDES = ('include:', 'parent:')
+TOKEN_SEPARATORS = re.compile(r'[\s=,\[\]"\']+')
+
+_manifest_indices = {}
+_path_indices = {}
+
+
+def get_checkout_revision(mozcentral_path):
+	# Returns the revision of a mercurial or git
+	# checkout, or None if it can't be found.
+	dirstate = os.path.join(mozcentral_path, '.hg', 'dirstate')
+	if os.path.exists(dirstate):
+		with open(dirstate, 'rb') as f:
+			data = f.read(64)
+		if data.startswith(b'dirstate-v2\n'):
+			data = data[len(b'dirstate-v2\n'):]
+		# The first parent of the working directory
+		return data[:20].hex()
+
+	git_dir = os.path.join(mozcentral_path, '.git')
+	if not os.path.exists(os.path.join(git_dir, 'HEAD')):
+		return None
+
+	with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+		head = f.read().strip()
+	if not head.startswith('ref:'):
+		return head
+
+	ref = head[len('ref:'):].strip()
+	ref_path = os.path.join(git_dir, ref)
+	if os.path.exists(ref_path):
+		with open(ref_path, 'r') as f:
+			return f.read().strip()
+
+	packed_refs = os.path.join(git_dir, 'packed-refs')
+	if os.path.exists(packed_refs):
+		with open(packed_refs, 'r') as f:
+			for line in f:
+				if line.strip().endswith(' ' + ref):
+					return line.split()[0]
+	return None
+
+
+def walk_checkout(mozcentral_path, file_matcher=None):
+	# Yields the paths (relative to `mozcentral_path`) of all the
+	# files in the checkout, skipping VCS and object directories.
+	for root, dirs, files in os.walk(mozcentral_path):
+		dirs[:] = [
+			d for d in dirs
+			if d not in IGNORED_DIRS and not d.startswith('obj-')
+		]
+		rel_root = os.path.relpath(root, mozcentral_path)
+		for file in files:
+			if file_matcher and not file_matcher(file):
+				continue
+			yield os.path.normpath(os.path.join(rel_root, file))
+
+
+def parse_manifest(manifest_path):
+	# Returns the section names of a manifest and
+	# the names of all the files it references.
+	sections = []
+	file_names = set()
+
+	with open(manifest_path, 'r', encoding='utf-8', errors='replace') as f:
+		lines = f.readlines()
+
+	for line in lines:
+		if line.lstrip().startswith(('#', ';')):
+			continue
+
+		match = MANIFEST_SECTION.match(line)
+		if match:
+			sections.append(match.group(1).strip())
+
+		for token in TOKEN_SEPARATORS.split(line):
+			name = os.path.basename(token)
+			if name:
+				file_names.add(name)
+
+	return sections, file_names
+
+
+def build_manifest_index(mozcentral_path):
+	'''
+		Returns a manifest index in the form:
+			{
+				'tests': {test_path: [manifest_path, ...]},
+				'manifests': {
+					manifest_path: {
+						'files': [file names referenced],
+						'includes': [included manifest paths]
+					}
+				}
+			}
+		All paths are relative to `mozcentral_path`.
+	'''
+	tests = {}
+	manifests = {}
+
+	log.info("Building manifest index for: " + mozcentral_path)
+	for manifest in walk_checkout(mozcentral_path, lambda f: f.endswith('.ini')):
+		manifest_dir = os.path.dirname(manifest)
+		try:
+			sections, file_names = parse_manifest(os.path.join(mozcentral_path, manifest))
+		except Exception as e:
+			log.info("Unexpected error occurred while reading %s: %s" % (manifest, str(e)))
+			continue
+
+		includes = []
+		for section in sections:
+			if section.startswith(MANIFEST_INCLUDES):
+				included = section.split(':', 1)[1].strip()
+				includes.append(os.path.normpath(os.path.join(manifest_dir, included)))
+				continue
+			if section == 'DEFAULT':
+				continue
+
+			test = os.path.normpath(os.path.join(manifest_dir, section))
+			if test not in tests:
+				tests[test] = []
+			tests[test].append(manifest)
+
+		manifests[manifest] = {
+			'files': sorted(file_names),
+			'includes': includes
+		}
+
+	log.info("Found %s manifests listing %s tests." % (len(manifests), len(tests)))
+	return {'tests': tests, 'manifests': manifests}
+
+
+def get_manifest_index(mozcentral_path, cache_dir=None):
+	# Returns the manifest index of the checkout, it is built once
+	# per revision and kept in memory for the rest of the run.
+	mozcentral_path = os.path.abspath(mozcentral_path)
+	if mozcentral_path in _manifest_indices:
+		return _manifest_indices[mozcentral_path]
+
+	index = None
+	cache_path = None
+	revision = get_checkout_revision(mozcentral_path)
+	if revision:
+		cache_path = os.path.join(
+			get_cache_dir('manifest-index', cache_dir=cache_dir), revision + '.json'
+		)
+		if os.path.exists(cache_path):
+			log.info("Using cached manifest index: " + cache_path)
+			with open(cache_path, 'r') as f:
+				index = json.load(f)
+	else:
+		log.info("Cannot find the revision of %s, the manifest index won't be cached." % mozcentral_path)
+
+	if index is None:
+		index = build_manifest_index(mozcentral_path)
+		if cache_path:
+			with open(cache_path, 'w') as f:
+				json.dump(index, f)
+
+	_manifest_indices[mozcentral_path] = index
+	return index
+
+
+def get_test_manifests(manifest_index, test):
+	# Returns the manifests that list the test. If the test isn't
+	# listed as a section, fall back to the manifests in the test's
+	# directory (or below it) which reference the test's name.
+	test = os.path.normpath(test.lstrip('/'))
+	if test in manifest_index['tests']:
+		return manifest_index['tests'][test]
+
+	test_dir, test_name = os.path.split(test)
+	return [
+		manifest
+		for manifest, info in manifest_index['manifests'].items()
+		if (manifest.startswith(test_dir + os.sep) or not test_dir) and test_name in info['files']
+	]
+
+
+def get_test_manifest_files(manifest_index, test):
+	# Returns the set of file names referenced in the manifests of
+	# the test, including the files from the included manifests.
+	file_names = set()
+	visited = set()
+	to_visit = list(get_test_manifests(manifest_index, test))
+	while to_visit:
+		manifest = to_visit.pop()
+		if manifest in visited or manifest not in manifest_index['manifests']:
+			continue
+		visited.add(manifest)
+
+		info = manifest_index['manifests'][manifest]
+		file_names.update(info['files'])
+		to_visit.extend(info['includes'])
+
+	return file_names
+
+
+def build_path_index(mozcentral_path):
+	# Returns the set of all the files in the checkout,
+	# and all the directories they are found in.
+	log.info("Building path index for: " + mozcentral_path)
+	path_index = set()
+	for path in walk_checkout(mozcentral_path):
+		while path and path not in path_index:
+			path_index.add(path)
+			path = os.path.dirname(path)
+	log.info("Found %s paths." % len(path_index))
+	return path_index
+
+
+def get_path_index(mozcentral_path, cache_dir=None):
+	# Returns the path index of the checkout, it is built once
+	# per revision and kept in memory for the rest of the run.
+	mozcentral_path = os.path.abspath(mozcentral_path)
+	if mozcentral_path in _path_indices:
+		return _path_indices[mozcentral_path]
+
+	path_index = None
+	cache_path = None
+	revision = get_checkout_revision(mozcentral_path)
+	if revision:
+		cache_path = os.path.join(
+			get_cache_dir('path-index', cache_dir=cache_dir), revision + '.txt.gz'
+		)
+		if os.path.exists(cache_path):
+			log.info("Using cached path index: " + cache_path)
+			with gzip.open(cache_path, 'rt') as f:
+				path_index = set(f.read().splitlines())
+	else:
+		log.info("Cannot find the revision of %s, the path index won't be cached." % mozcentral_path)
+
+	if path_index is None:
+		path_index = build_path_index(mozcentral_path)
+		if cache_path:
+			with gzip.open(cache_path, 'wt') as f:
+				f.write('\n'.join(sorted(path_index)))
+
+	_path_indices[mozcentral_path] = path_index
+	return path_index
+
+
+def path_exists(path, mozcentral_path=None, path_index=None):
+	# Checks if the path exists in the checkout, using
+	# the path index instead of the file system if given.
+	if path_index is not None:
+		return os.path.normpath(path.lstrip('/')) in path_index
+	return os.path.exists(os.path.join(mozcentral_path, path))
@@ -38,6 +38,8 @@ setup(
     ],
     include_package_data=True,
     install_requires=DEPS,
+    # Needed to save or open results compressed with zstd
+    extras_require={'zstd': ['zstandard']},
     entry_points="""
     # -*- Entry points: -*-
     [console_scripts]